@@ -0,0 +1,531 @@
+# Game actions, independent of the web framework
+#
+# apply_action() is all of the game's request handling: it takes a session's
+# game_state and one action payload, updates the state in place and returns
+# the response body. It does no I/O, so the Flask (WSGI) app and the ASGI app
+# share it and only differ in how they load and store sessions.
+
+import copy # For snapshotting the state the client holds
+import time
+
+# Import game logic modules
+from game_logic import locations, combat, items, world, rng, progression # Import items module
+from game_logic.inventory import Inventory
+import state_protocol # Revisioned state / patch responses
+import state_schema # Stored game_state shape and migrations
+import dispatch # Action registry
+import metrics # Per-action latency and game event counters
+# Character creation logic will be handled directly here for simplicity,
+# or could be moved to its own module later.
+
+
+def new_game_state():
+    """Returns the state of a brand new session (character creation)."""
+    # Message and options aren't stored; see response_view()
+    return {
+        'v': state_schema.SCHEMA_VERSION,
+        'current_location': 'character_creation', # Start with character creation
+        'player_stats': None, # Will store {'name': '...', 'health': ..., ...}
+        'combat_state': None, # Will store combat details if active
+        'rng': [rng.new_seed(), 0], # The session's random stream (see game_logic/rng.py)
+    }
+
+def restore_progress(game_state, save):
+    """Loads a save game (a savegames.snapshot() dict) into a fresh game state."""
+    location_id = save['location'] if world.WORLD.location(save['location']) else world.WORLD.start
+    game_state['player_stats'] = save['player']
+    game_state['current_location'] = location_id
+    location_data = locations.get_location_data(location_id, game_state)
+    game_state['message'] = f"Welcome back, {save['player']['name']}!\n\n{location_data['message']}"
+
+def page_context(game_state):
+    """Template arguments for rendering index.html from a game state."""
+    state_schema.upgrade(game_state)
+    view = response_view(game_state)
+    state_schema.pop_events(game_state) # A welcome back message is shown once
+    # The page is the client's base revision for patch responses from /action
+    # and the item catalog version names the /items URL it caches item details from
+    return {'view': view, 'rev': game_state.get('rev', 0), 'items_version': items.CATALOG_VERSION}
+
+# --- Views ---
+# What the client sees is the stored state plus what can be derived from it:
+# the options on screen and, unless the last action said something itself,
+# a message describing the current situation.
+
+CREATION_OPTIONS = ({'action': 'submit_name', 'text': 'Confirm Name', 'input_required': 'text'},) # Indicate input needed
+
+def derive_options(game_state):
+    """The actions offered to the player right now."""
+    combat_state = game_state.get('combat_state')
+    if combat_state is not None:
+        return combat.get_combat_options(fight(game_state))
+    location_id = game_state.get('current_location')
+    if location_id == 'character_creation':
+        return CREATION_OPTIONS
+    if not location_id:
+        return ()
+    return locations.get_location_data(location_id, game_state).get('options', ())
+
+def describe(game_state):
+    """A message for the current situation (when no action has just said something)."""
+    combat_state = game_state.get('combat_state')
+    location_id = game_state.get('current_location')
+    if combat_state is not None:
+        if combat_state.get('is_over'):
+            return "You are victorious!" if combat_state.get('victory') else "You have been defeated."
+        names = [enemy['name'] for enemy in combat.combat_enemies(combat_state)]
+        return f"You are fighting {combat.describe_enemies(names)}!"
+    if location_id == 'character_creation':
+        return "Welcome, adventurer! What is your name?"
+    if not location_id:
+        return ""
+    return locations.get_location_data(location_id, game_state).get('message', '')
+
+def response_view(game_state):
+    """The client-facing view of game_state."""
+    view = state_protocol.response_view(game_state)
+    view['options'] = derive_options(game_state)
+    if view.get('message') is None:
+        view['message'] = describe(game_state)
+    return view
+
+
+def action_label(data):
+    """The metrics label for an action payload."""
+    action = data.get('action')
+    return metrics.bounded(action if isinstance(action, str) else None, KNOWN_ACTIONS)
+
+def timed_action(game_state, data):
+    """perform_action(), recording its latency and whether it was rejected."""
+    label = action_label(data)
+    start = time.perf_counter()
+    ok = perform_action(game_state, data)
+    metrics.ACTION_SECONDS.observe(time.perf_counter() - start, label)
+    if not ok:
+        metrics.ACTION_REJECTED.inc(label)
+    return ok
+
+
+def apply_action(game_state, data):
+    """Applies one action payload to game_state (in place). Returns the response body."""
+    state_schema.upgrade(game_state)
+    client_rev = data.get('rev', None) # Revision the client holds (None for legacy clients)
+    old_view = client_view(game_state, client_rev)
+    timed_action(game_state, data)
+    return finish(game_state, old_view, client_rev)
+
+def apply_actions(game_state, steps, client_rev=None):
+    """Applies a list of action payloads in order, stopping at the first invalid one.
+
+    The whole batch is one revision. Returns the response body plus 'steps'
+    (action, ok, message for each step that ran).
+    """
+    state_schema.upgrade(game_state)
+    old_view = client_view(game_state, client_rev)
+    results = []
+    for step in steps:
+        ok = timed_action(game_state, step)
+        results.append({'action': step.get('action'), 'ok': ok, 'message': game_state.get('message')})
+        if not ok:
+            break
+    response = finish(game_state, old_view, client_rev)
+    response['steps'] = results
+    return response
+
+class BatchError(ValueError):
+    """Raised for an unusable /actions request. `status` is the HTTP status to answer with."""
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def parse_batch(data, max_actions):
+    """Validates an /actions request body and returns its list of steps."""
+    steps = data.get('actions') if isinstance(data, dict) else None
+    if not isinstance(steps, list) or not steps or not all(isinstance(step, dict) for step in steps):
+        raise BatchError('Expected {"actions": [action, ...]}')
+    if len(steps) > max_actions:
+        raise BatchError(f"At most {max_actions} actions per batch", status=413)
+    return steps
+
+def client_view(game_state, client_rev):
+    """Snapshot of what the client holds (None if we can't diff against it)."""
+    # Taken before we mutate anything, so we can diff against it
+    if client_rev is not None and client_rev == game_state.get('rev', 0):
+        view = copy.deepcopy(state_protocol.response_view(game_state))
+        view['options'] = derive_options(game_state) # Immutable, no copy needed
+        # The client shows whatever message we sent last; every response sends its own
+        view['message'] = None
+        return view
+    return None
+
+def finish(game_state, old_view, client_rev):
+    """Bumps the revision and builds the response body."""
+    game_state['rev'] = game_state.get('rev', 0) + 1
+    # Return a patch against the client's revision (or a full snapshot if it's out of date)
+    new_view = response_view(game_state)
+    state_schema.pop_events(game_state) # Sent with this response only
+    return state_protocol.build_response(old_view, new_view, game_state['rev'], client_rev)
+
+# --- Action handlers ---
+# Each handler applies one action to game_state (in place) and returns False
+# if it rejected it. perform_action() picks the handler from the registry.
+
+registry = dispatch.Registry()
+handles = registry.handles
+
+def perform_action(game_state, data):
+    """Runs one action against game_state (in place). Returns False if it isn't valid here."""
+    action = data.get('action')
+    if not isinstance(action, str):
+        game_state['message'] = "No action given."
+        return False
+
+    # What the player is doing decides which handlers may run
+    combat_state = game_state.get('combat_state')
+    if combat_state is not None and not combat_state.get('is_over', False):
+        phase = dispatch.COMBAT
+    elif game_state.get('current_location') == 'character_creation':
+        phase = dispatch.CREATION
+    else:
+        phase = dispatch.WORLD
+
+    handler = registry.lookup(action)
+    if handler is None or handler.phase != phase or not handler.allowed(game_state):
+        return REJECT[phase](game_state, action)
+    return handler(game_state, data)
+
+# --- Rejections: what each phase answers to an action it doesn't allow ---
+
+def reject_in_combat(game_state, action):
+    game_state['message'] = "Invalid action during combat."
+    return False
+
+def reject_in_creation(game_state, action):
+    game_state['message'] = "Please enter your name."
+    return False
+
+def reject_in_world(game_state, action):
+    # Handle unknown actions or actions not applicable to the current state
+    game_state['message'] = f"Invalid action '{action}' here."
+    return False
+
+REJECT = {dispatch.COMBAT: reject_in_combat, dispatch.CREATION: reject_in_creation, dispatch.WORLD: reject_in_world}
+
+# --- Character creation ---
+
+MAX_NAME_LENGTH = 32
+
+@handles('submit_name', phase=dispatch.CREATION)
+def submit_name(game_state, data):
+    player_input = data.get('input', None) # For text input like name
+    if player_input and (not isinstance(player_input, str) or len(player_input) > MAX_NAME_LENGTH
+                         or not player_input.isprintable()): # No control characters (see codec.py)
+        game_state['message'] = f"Please choose a name of at most {MAX_NAME_LENGTH} printable characters."
+        return False
+    player_name = player_input if player_input else "Hero"
+    # Initialize player stats (using defaults from original Combat.py)
+    # Initialize player stats including level-up system attributes
+    initial_level = 1
+    initial_xp_needed = progression.xp_for_next_level(initial_level)
+    game_state['player_stats'] = {
+        'name': player_name, 'health': 100, 'max_health': 100,
+        'attack': 10, 'defense': 5, 'is_player': True, 'is_defending': False,
+        'level': initial_level,
+        'xp': 0,
+        'xp_to_next_level': initial_xp_needed,
+        'stat_points': 0, # Start with 0 points
+        'inventory': {}, # Initialize empty inventory (item id -> count)
+        'equipment': {'weapon': 'fists'} # Start with fists equipped
+    }
+    game_state['current_location'] = 'main_camp'
+    location_data = locations.get_location_data('main_camp', game_state)
+    game_state['message'] = f"Welcome, {player_name}! Your adventure begins.\n\n{location_data['message']}"
+    return True
+
+# --- Combat ---
+# The stored combat_state has no player of its own (player_stats is the only
+# copy); the combat module gets one attached for the call and the result is
+# split back into player_stats, combat_state and this action's message.
+
+def fight(game_state):
+    """The running combat_state as the combat module expects it, with the player attached."""
+    return dict(game_state['combat_state'], player=game_state['player_stats'])
+
+def store_fight(game_state, combat_state):
+    """Stores a combat_state coming back from the combat module."""
+    game_state['player_stats'] = combat_state.pop('player')
+    game_state['message'] = combat_state.pop('turn_message')
+    game_state['combat_state'] = combat_state
+
+@handles('combat_attack', phase=dispatch.COMBAT)
+@handles('combat_defend', phase=dispatch.COMBAT)
+def combat_turn(game_state, data):
+    combat_action = data['action'].split('_')[1] # Get 'attack' or 'defend'
+    target = data.get('target') # Which enemy to attack in a multi-enemy encounter
+    target = target if type(target) is int else None # Not bool: true/false aren't enemy indices
+    store_fight(game_state, combat.handle_combat_action(fight(game_state), combat_action, target,
+                                                        rng.session_rng(game_state)))
+    game_state['combat_turns'] = game_state.get('combat_turns', 0) + 1 # For metrics, see end_combat
+    return True
+
+@handles('combat_auto', phase=dispatch.COMBAT)
+def combat_auto(game_state, data):
+    # Resolve the whole fight server-side with the chosen policy
+    try:
+        store_fight(game_state, combat.auto_resolve(fight(game_state), data.get('policy', 'attack'),
+                                                    rng=rng.session_rng(game_state)))
+    except ValueError as e:
+        game_state['message'] = str(e)
+        return False
+    game_state['combat_turns'] = game_state.get('combat_turns', 0) + len(game_state['combat_state']['turn_log'])
+    return True
+
+@handles('end_combat', needs_combat_state=True)
+def end_combat(game_state, data):
+    # Player continues after winning/losing
+    combat_state_ended = game_state['combat_state'] # Keep a reference before clearing
+    victory = combat_state_ended.get('victory')
+    metrics.COMBAT_TURNS.observe(game_state.pop('combat_turns', 0), 'won' if victory else 'lost')
+    game_state['combat_state'] = None # End combat
+
+    if not victory:
+        # Player lost - Game Over or return to camp?
+        game_state['message'] = "You have been defeated. You awaken back at your camp, weakened."
+        # Reset location to main camp
+        game_state['current_location'] = 'main_camp'
+        # Optionally penalize player (e.g., reduce max health slightly?)
+        # game_state['player_stats']['max_health'] = max(10, game_state['player_stats']['max_health'] - 10)
+        game_state['player_stats']['health'] = game_state['player_stats']['max_health'] # Restore health
+        location_data = locations.get_location_data('main_camp', game_state)
+        game_state['message'] += "\n\n" + location_data['message']
+        return True
+
+    # --- XP Gain and Level Up ---
+    enemy_name = combat_state_ended.get('enemy', {}).get('name', None)
+    level_up_message = ""
+    player_stats = game_state.get('player_stats')
+    # XP (summed over the whole pack) is reduced if the player out-levels the enemies
+    final_xp_reward, base_xp_reward = combat.xp_reward_for_combat(combat_state_ended, player_stats.get('level', 1) if player_stats else 1)
+
+    if base_xp_reward > 0 and player_stats:
+        # Award the calculated XP; level-ups (can be several) are resolved in one go
+        gained = progression.grant_xp(player_stats, final_xp_reward)
+        level_up_message = f"\nYou gained {final_xp_reward} XP!"
+        if final_xp_reward < base_xp_reward:
+            level_up_message += f" (Reduced from {base_xp_reward} due to level difference)"
+
+        # One announcement per level reached, with the stat points held at that point
+        level, stat_points = player_stats['level'], player_stats['stat_points']
+        for reached in range(level - gained + 1, level + 1):
+            level_up_message += f"\n**LEVEL UP!** You reached level {reached}!"
+            level_up_message += f"\nYou have {stat_points - progression.STAT_POINTS_PER_LEVEL * (level - reached)} stat points to spend."
+
+    # --- Proceed with location change ---
+    next_location_id = combat_state_ended.get('destination') # Where the player was heading
+    if next_location_id:
+        game_state['current_location'] = next_location_id
+        location_data = locations.get_location_data(next_location_id, game_state)
+        # Use the enemy name from the *ended* combat state (already fetched above)
+        if 'enemies' in combat_state_ended:
+            enemy_display_name = combat.describe_enemies([e['name'] for e in combat_state_ended['enemies']])
+        else:
+            enemy_display_name = f"the {enemy_name}" if enemy_name else 'the enemy'
+        game_state['message'] = f"Having defeated {enemy_display_name}, you arrive at the {next_location_id.replace('_', ' ')}."
+        game_state['message'] += level_up_message # Add XP/Level up info
+        game_state['message'] += "\n\n" + location_data.get('message', '') # Add location description
+    else:
+        # Fallback if the fight had no destination (shouldn't happen); stay where combat happened
+        game_state['message'] = "You are victorious!"
+        game_state['message'] += level_up_message # Add XP/Level up info
+    return True
+
+# --- Moving around ---
+
+@handles('go')
+def go(game_state, data):
+    current_location = game_state.get('current_location')
+    direction = data.get('direction', None) # For 'go' actions
+    # Determine next location from the compiled world graph
+    next_location_id = world.WORLD.exit(current_location, direction)
+    if not next_location_id:
+        # This case handles invalid directions for the current location
+        game_state['message'] = "You can't go that way from here."
+        return False
+
+    # --- Check for Combat Encounters ---
+    enemy_pack = None
+    # Encounter tables are precomputed per location in the world graph
+    encounter = world.WORLD.encounter(next_location_id)
+
+    # Check if moving into a combat zone (and not already there)
+    if encounter and current_location != next_location_id:
+        # Rolls come from the session's own stream; returns e.g. ['Goblin', 'Goblin'] or None
+        enemy_pack = encounter.roll(rng.session_rng(game_state))
+        metrics.ENCOUNTER_ROLLS.inc(next_location_id, 'fight' if enemy_pack else 'quiet')
+
+    if enemy_pack:
+        # Start combat, keeping track of where player was heading
+        combat_state = combat.start_combat(game_state['player_stats'], enemy_pack)
+        combat_state['destination'] = next_location_id
+        store_fight(game_state, combat_state)
+        # Don't update current_location yet, stay in combat mode
+        return True
+
+    # No combat or not entering a combat zone, proceed with normal location change
+    game_state['current_location'] = next_location_id
+    location_data = locations.get_location_data(next_location_id, game_state)
+    # Add a message if player avoided combat
+    no_combat_message = ""
+    if encounter and current_location != next_location_id:
+        no_combat_message = f"You enter the {next_location_id.replace('_', ' ')}, but find it quiet for now.\n\n"
+
+    game_state['message'] = no_combat_message + location_data.get('message', "You arrive.")
+    # Handle potential errors from get_location_data
+    if location_data.get('next_location'):
+        game_state['current_location'] = location_data['next_location']
+    return True
+
+@handles('rest')
+def rest(game_state, data):
+    if game_state.get('current_location') != 'main_camp':
+        game_state['message'] = "You can only rest at the main camp."
+        return False
+    # Heal player fully
+    if game_state['player_stats']:
+        game_state['player_stats']['health'] = game_state['player_stats']['max_health']
+        game_state['message'] = "You rest at the camp and feel fully recovered."
+    else:
+        game_state['message'] = "You rest for a while."
+    return True
+
+@handles('explore_forest')
+def explore_forest(game_state, data):
+    if game_state.get('current_location') != 'forest':
+        game_state['message'] = "You can only explore the forest when you are there."
+        return False
+    # Add more detailed exploration logic later
+    # For now, maybe trigger another encounter chance?
+    game_state['message'] = "You explore deeper into the woods... (More content needed here)"
+    return True
+
+# --- Item Actions ---
+# (Options are derived from the state, so a taken item's 'take' option goes away by itself)
+
+@handles('take_item', needs_player=True)
+def take_item(game_state, data):
+    ok = True
+    item_id = data.get('item_id') # Get item_id from the action data
+    if isinstance(item_id, str) and item_id:
+        # Check if item exists (basic check for now)
+        item_details = items.get_item_details(item_id)
+        if item_details:
+            # Add item to inventory if its stack has room and it isn't too heavy
+            inventory = Inventory.of(game_state['player_stats'])
+            if inventory.add(item_id):
+                game_state['message'] = f"You picked up the {item_details['name']}."
+            elif item_id in inventory:
+                game_state['message'] = f"You already have a {item_details['name']}." # Stack is full
+                ok = False
+            else:
+                game_state['message'] = f"You can't carry the {item_details['name']}."
+                ok = False
+        else:
+            game_state['message'] = "You try to take something, but it's not there."
+            ok = False
+    else:
+        game_state['message'] = "Take what?" # Should not happen with button UI
+        ok = False
+    return ok
+
+@handles('equip_weapon', needs_player=True)
+def equip_weapon(game_state, data):
+    ok = True
+    weapon_id = data.get('item_id') # Get weapon_id from the action data
+    player_stats = game_state['player_stats']
+    inventory = Inventory.of(player_stats)
+    equipment = player_stats.setdefault('equipment', {'weapon': 'fists'}) # Ensure equipment exists
+
+    # Ids come from the client: anything but a string can't be an item (or a dict key)
+    weapon_details = items.get_item_details(weapon_id) if isinstance(weapon_id, str) else None
+    # Only weapons go in the weapon slot (not armor or potions)
+    is_weapon = weapon_details is not None and weapon_details['category'] == items.SLOTS['weapon']
+    if is_weapon and inventory.remove(weapon_id): # Take it out of the inventory
+        # Unequip current weapon (if it's not fists) and put it back in inventory
+        current_weapon = equipment.get('weapon')
+        if current_weapon and current_weapon != 'fists' and not inventory.add(current_weapon):
+            inventory.add(weapon_id) # No room for the old one: put the new one back
+            current_details = items.get_item_details(current_weapon) or {}
+            game_state['message'] = f"You have no room for the {current_details.get('name', current_weapon)}."
+            return False
+
+        # Equip the new weapon
+        equipment['weapon'] = weapon_id
+        game_state['message'] = f"You equipped the {weapon_details.get('name', weapon_id)}."
+    else:
+        game_state['message'] = "You can't equip that."
+        ok = False
+    return ok
+
+@handles('unequip_weapon', needs_player=True)
+def unequip_weapon(game_state, data):
+    ok = True
+    player_stats = game_state['player_stats']
+    inventory = Inventory.of(player_stats)
+    equipment = player_stats.setdefault('equipment', {'weapon': 'fists'})
+    current_weapon = equipment.get('weapon')
+
+    if current_weapon and current_weapon != 'fists':
+        weapon_details = items.get_item_details(current_weapon) or {}
+        if inventory.add(current_weapon): # Add weapon back to inventory
+            equipment['weapon'] = 'fists' # Equip fists
+            game_state['message'] = f"You unequipped the {weapon_details.get('name', current_weapon)} and equipped your Fists."
+        else:
+            game_state['message'] = f"You have no room for the {weapon_details.get('name', current_weapon)}."
+            ok = False
+    else:
+        game_state['message'] = "You don't have a weapon equipped (besides your fists)."
+        ok = False
+    return ok
+
+# --- Stat Allocation Actions ---
+
+STAT_INCREASES = {
+    'health': 5, # Max health goes up (and heals) by this much
+    'attack': 1,
+    'defense': 1,
+}
+
+@handles('allocate_health', needs_player=True)
+@handles('allocate_attack', needs_player=True)
+@handles('allocate_defense', needs_player=True)
+@handles('allocate_', needs_player=True, prefix=True) # Unknown stats get an explanation
+def allocate_stat(game_state, data):
+    ok = True
+    stat_to_increase = data['action'].split('_')[1] # e.g., 'health', 'attack', 'defense'
+    player_stats = game_state['player_stats']
+
+    if player_stats.get('stat_points', 0) > 0:
+        increase_amount = STAT_INCREASES.get(stat_to_increase)
+        if stat_to_increase == 'health':
+            # Increase max health and heal by the same amount (common practice)
+            player_stats['stat_points'] -= 1
+            player_stats['max_health'] += increase_amount
+            player_stats['health'] += increase_amount
+            game_state['message'] = f"Increased Max Health by {increase_amount}. You have {player_stats['stat_points']} points left."
+        elif increase_amount:
+            player_stats['stat_points'] -= 1
+            player_stats[stat_to_increase] += increase_amount
+            game_state['message'] = f"Increased {stat_to_increase.capitalize()} by {increase_amount}. You have {player_stats['stat_points']} points left."
+        else:
+            # Invalid stat type (shouldn't happen with button UI)
+            game_state['message'] = f"Invalid stat to allocate: {stat_to_increase}"
+            ok = False
+    else:
+        game_state['message'] = "You have no stat points to spend."
+        ok = False
+    return ok
+
+
+# Every action the game understands. Metrics label actions by these names and
+# lump anything else a client sends under "other", so labels stay bounded.
+KNOWN_ACTIONS = registry.names()
@@ -0,0 +1,458 @@
+# ASGI entry point for the web game
+#
+#   uvicorn asgi:app            (or any other ASGI server)
+#
+# Serves the same /, /action, /actions, /items, /metrics and /static as the Flask app, built from the
+# same config and sharing its session store, save games and cookies, so both
+# can run side by side against one store. The game itself stays synchronous
+# (actions.apply_action is pure CPU work); only I/O is awaited:
+#   - the session load starts as soon as the request headers arrive and
+#     runs while the body is still being received
+#   - store calls use native async I/O where the backend has it (Redis),
+#     a worker thread for blocking backends (SQLite) and run inline for the
+#     in-process MemoryStore
+#   - save games go to the write-behind queue, which never waits on disk
+#   - one session's requests (HTTP and WebSocket) queue up behind each other
+#     (an asyncio.Lock per session, which serves waiters in order); other
+#     sessions run in between. Writes are compare-and-swaps on the session's
+#     version, so a request that raced another worker runs again on the fresh
+#     session (SESSION_CAS_RETRIES times, then 409), as in the Flask app
+# Between requests a player costs an open socket and nothing else, so one
+# process can hold tens of thousands of mostly idle players.
+#
+# /ws is a WebSocket carrying the same action messages as POST /action, for
+# players who'd otherwise pay for headers and cookies on every click:
+#   - the connection is bound to the session (and save id) from the cookies
+#     sent with the handshake; without a session the handshake is refused
+#   - each client message is an /action payload (or an /actions batch),
+#     optionally with an "id"; the reply is the response body with that "id"
+#   - replies go through a small per-connection outbox; if the client stops
+#     reading, queued updates collapse into one snapshot of the latest state,
+#     and a send that stays blocked for WS_SEND_TIMEOUT drops the connection
+#   - the server pings every WS_PING_INTERVAL seconds ({"type": "ping"}, the
+#     client answers {"type": "pong"}), closes connections that stop
+#     answering, and evicts players idle for WS_IDLE_TIMEOUT seconds
+
+import asyncio
+import json
+import mimetypes
+import os
+import time
+from collections import deque
+from http.cookies import CookieError, SimpleCookie
+from urllib.parse import parse_qs
+
+from werkzeug.http import dump_cookie, parse_etags
+from werkzeug.security import safe_join
+
+import actions
+import metrics
+import savegames
+import session_store
+from game_logic import items
+
+# WebSocket close codes (4000-4999 are free for applications)
+WS_CLOSE_GOING_AWAY = 1001 # Heartbeat lost, or the client can't keep up
+WS_CLOSE_NO_SESSION = 4401 # Load / first to get a session
+WS_CLOSE_IDLE = 4408 # Evicted for inactivity
+
+CONFLICT_ERROR = "Your game was changed by another request at the same time. Please try again."
+CONFLICT_BODY = json.dumps({'error': CONFLICT_ERROR}).encode('utf-8')
+
+
+class GameASGI:
+    """ASGI application serving the game from a Flask app's config and stores."""
+    def __init__(self, flask_app):
+        interface = flask_app.session_interface
+        if not isinstance(interface, session_store.ServerSideSessionInterface):
+            raise ValueError("The ASGI app needs a server-side session backend (memory, sqlite or redis)")
+        self.flask_app = flask_app
+        self.sessions = interface
+        self.store = interface.store
+        self.saves = flask_app.extensions['savegames']
+        self.cookie_name = flask_app.config['SESSION_COOKIE_NAME']
+        self.secure_cookies = flask_app.config.get('SESSION_COOKIE_SECURE', False)
+        self.ws_ping_interval = flask_app.config.get('WS_PING_INTERVAL', 20)
+        self.ws_idle_timeout = flask_app.config.get('WS_IDLE_TIMEOUT', 900)
+        self.ws_send_queue = flask_app.config.get('WS_SEND_QUEUE', 32)
+        self.ws_send_timeout = flask_app.config.get('WS_SEND_TIMEOUT', 10)
+        self.ws_connections = 0
+        self.max_batch_actions = flask_app.config.get('MAX_BATCH_ACTIONS', 50)
+        self.recorder = flask_app.extensions.get('recorder')
+        self.cas_retries = flask_app.config.get('SESSION_CAS_RETRIES', 2)
+        self.session_locks = session_store.SessionLocks(asyncio.Lock)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] == 'websocket':
+            if scope['path'] == '/ws':
+                return await self.websocket(scope, receive, send)
+            await receive() # websocket.connect
+            return await send({'type': 'websocket.close', 'code': 1008})
+        if scope['type'] != 'http':
+            return
+        path, method = scope['path'], scope['method']
+        if path == '/action' and method == 'POST':
+            await self.action(scope, receive, send)
+        elif path == '/actions' and method == 'POST':
+            await self.batch(scope, receive, send)
+        elif path == '/' and method == 'GET':
+            await self.index(scope, receive, send)
+        elif path == '/items' and method == 'GET':
+            await self.item_catalog(scope, send)
+        elif path == '/metrics' and method == 'GET':
+            await respond(send, 200, metrics.render().encode('utf-8'), metrics.CONTENT_TYPE)
+        elif path.startswith('/static/') and method == 'GET':
+            await self.static(path[len('/static/'):], send)
+        else:
+            await respond(send, 404, b'Not Found', 'text/plain')
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.to_thread(self.saves.flush) # Don't lose queued saves
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # --- Sessions ---
+    # Same cookie and payload format as ServerSideSessionInterface. A loaded
+    # session is (session dict, payload as loaded, version as loaded).
+
+    def session_id(self, cookies):
+        """Returns (sid, is_new)."""
+        sid = self.sessions.unsign_sid(self.flask_app, cookies.get(self.cookie_name))
+        if sid is None:
+            return self.sessions.new_sid(), True
+        return sid, False
+
+    async def load_session(self, sid):
+        payload, version = await session_store.store_get_versioned(self.store, sid)
+        if payload is None: # New, expired or evicted: reuse the id
+            return {}, None, 0
+        return self.sessions.deserialize(payload), payload, version
+
+    async def save_session(self, sid, loaded, is_new, headers):
+        """Stores the session unless another request did since it was loaded. Returns False if one did."""
+        session, loaded_payload, version = loaded
+        payload = self.sessions.serialize(session)
+        if payload != loaded_payload: # Dirty tracking, as in the Flask interface
+            if await session_store.store_set_if(self.store, sid, payload, version) is None:
+                return False
+            metrics.SESSION_BYTES.observe(len(payload))
+        if is_new:
+            headers.append(self.cookie_header(self.cookie_name, self.sessions.sign_sid(self.flask_app, sid)))
+        return True
+
+    def cookie_header(self, name, value, max_age=None):
+        cookie = dump_cookie(name, value, max_age=max_age, path='/', httponly=True,
+                             secure=self.secure_cookies, samesite='Lax')
+        return (b'set-cookie', cookie.encode('latin-1'))
+
+    def queue_save(self, payload, cookies, headers):
+        if payload is None:
+            return
+        save_id = savegames.valid_save_id(cookies.get(savegames.SAVE_COOKIE))
+        if save_id is None:
+            save_id = savegames.new_save_id()
+            headers.append(self.cookie_header(savegames.SAVE_COOKIE, save_id, savegames.SAVE_COOKIE_MAX_AGE))
+        self.saves.put(save_id, payload) # In-memory; the writer thread does the disk I/O
+
+    async def play(self, sid, loaded, is_new, cookies, data, headers, steps=None):
+        """Runs one action (or a batch of `steps`) against a loaded session and stores the result.
+
+        Call with the session's lock held. If another worker stored the
+        session in the meantime, reloads it and runs the action again (up to
+        cas_retries times). Returns (response, game_state), or (None, None) if
+        every attempt lost.
+        """
+        for attempt in range(self.cas_retries + 1):
+            if attempt:
+                metrics.SESSION_CONFLICTS.inc('retried')
+                loaded = await self.load_session(sid)
+            session = loaded[0]
+            game_state = session.get('game_state', {})
+            recording = self.recorder.begin(sid, game_state) if self.recorder else None
+            # Pure game logic, no I/O
+            if steps is None:
+                response = actions.apply_action(game_state, data)
+            else:
+                response = actions.apply_actions(game_state, steps, data.get('rev'))
+            save = savegames.save_payload(game_state) # Marks game_state as saved, so before storing it
+            session['game_state'] = game_state
+            if await self.save_session(sid, loaded, is_new, headers):
+                # Only what was stored is logged and saved
+                if recording:
+                    self.recorder.end(recording, data, game_state, batch=steps is not None)
+                self.queue_save(save, cookies, headers)
+                return response, game_state
+        metrics.SESSION_CONFLICTS.inc('rejected')
+        return None, None
+
+    # --- Routes ---
+
+    async def action(self, scope, receive, send):
+        cookies = parse_cookies(scope)
+        sid, is_new = self.session_id(cookies)
+        async with self.session_locks.ahold(sid):
+            # Start loading the session while the request body is still arriving
+            loading = asyncio.ensure_future(self.load_session(sid))
+            body = await read_body(receive)
+            loaded = await loading
+            try:
+                data = json.loads(body)
+            except ValueError:
+                data = None
+            if not isinstance(data, dict):
+                return await respond(send, 400, b'{"error":"Expected a JSON object"}', 'application/json')
+
+            headers = []
+            response, _ = await self.play(sid, loaded, is_new, cookies, data, headers)
+        if response is None:
+            return await respond(send, 409, CONFLICT_BODY, 'application/json')
+        body = json.dumps(response, separators=(',', ':')).encode('utf-8')
+        metrics.RESPONSE_BYTES.observe(len(body), actions.action_label(data))
+        await respond(send, 200, body, 'application/json', headers)
+
+    async def batch(self, scope, receive, send):
+        cookies = parse_cookies(scope)
+        sid, is_new = self.session_id(cookies)
+        async with self.session_locks.ahold(sid):
+            loading = asyncio.ensure_future(self.load_session(sid))
+            body = await read_body(receive)
+            loaded = await loading
+            try:
+                data = json.loads(body)
+            except ValueError:
+                data = None
+            try:
+                steps = actions.parse_batch(data, self.max_batch_actions)
+            except actions.BatchError as e:
+                return await respond(send, e.status, json.dumps({'error': str(e)}).encode('utf-8'), 'application/json')
+
+            headers = []
+            response, _ = await self.play(sid, loaded, is_new, cookies, data, headers, steps)
+        if response is None:
+            return await respond(send, 409, CONFLICT_BODY, 'application/json')
+        body = json.dumps(response, separators=(',', ':')).encode('utf-8')
+        metrics.RESPONSE_BYTES.observe(len(body), 'batch')
+        await respond(send, 200, body, 'application/json', headers)
+
+    async def index(self, scope, receive, send):
+        cookies = parse_cookies(scope)
+        sid, is_new = self.session_id(cookies)
+        async with self.session_locks.ahold(sid):
+            html, headers = await self.render_index(sid, is_new, cookies)
+        await respond(send, 200, html.encode('utf-8'), 'text/html; charset=utf-8', headers)
+
+    async def render_index(self, sid, is_new, cookies):
+        loaded = await self.load_session(sid)
+        session = loaded[0]
+        if 'game_state' not in session:
+            session['game_state'] = actions.new_game_state()
+            # Returning player with a new session: pick up from their save game
+            save_id = savegames.valid_save_id(cookies.get(savegames.SAVE_COOKIE))
+            payload = await asyncio.to_thread(self.saves.get, save_id) if save_id else None
+            save = savegames.decode(payload) if payload is not None else None
+            if save is not None:
+                actions.restore_progress(session['game_state'], save)
+
+        # Jinja rendering (and url_for in the template) need a Flask request context
+        with self.flask_app.test_request_context('/'):
+            html = self.flask_app.jinja_env.get_template('index.html').render(
+                **actions.page_context(session['game_state']))
+        headers = []
+        if not await self.save_session(sid, loaded, is_new, headers):
+            # Another worker stored the session first: keep theirs. The page's
+            # first action gets a snapshot of it (its revision won't match).
+            metrics.SESSION_CONFLICTS.inc('dropped')
+        return html, headers
+
+    async def item_catalog(self, scope, send):
+        # Same caching as the Flask route: versioned URLs are immutable, the bare one revalidates
+        version = items.CATALOG_VERSION
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        cache_control = 'public, max-age=31536000, immutable' if query.get('v') == [version] else 'public, no-cache'
+        headers = [(b'etag', f'"{version}"'.encode('latin-1')), (b'cache-control', cache_control.encode('latin-1'))]
+        if_none_match = dict(scope.get('headers', [])).get(b'if-none-match')
+        if if_none_match and parse_etags(if_none_match.decode('latin-1')).contains(version):
+            return await respond(send, 304, b'', 'application/json', headers)
+        await respond(send, 200, items.CATALOG_JSON, 'application/json', headers)
+
+    async def static(self, filename, send):
+        path = safe_join(self.flask_app.static_folder, filename)
+        if path is None or not os.path.isfile(path):
+            return await respond(send, 404, b'Not Found', 'text/plain')
+        with open(path, 'rb') as f: # Small files from local disk
+            body = f.read()
+        await respond(send, 200, body, mimetypes.guess_type(path)[0] or 'application/octet-stream')
+
+
+    # --- WebSocket ---
+
+    async def websocket(self, scope, receive, send):
+        if (await receive())['type'] != 'websocket.connect':
+            return
+        cookies = parse_cookies(scope)
+        sid = self.sessions.unsign_sid(self.flask_app, cookies.get(self.cookie_name))
+        if sid is None or await session_store.store_get(self.store, sid) is None:
+            return await send({'type': 'websocket.close', 'code': WS_CLOSE_NO_SESSION})
+
+        # Cookies can't be set once the socket is open, so hand out a save id now
+        headers = []
+        if savegames.valid_save_id(cookies.get(savegames.SAVE_COOKIE)) is None:
+            cookies[savegames.SAVE_COOKIE] = savegames.new_save_id()
+            headers.append(self.cookie_header(savegames.SAVE_COOKIE, cookies[savegames.SAVE_COOKIE],
+                                              savegames.SAVE_COOKIE_MAX_AGE))
+        await send({'type': 'websocket.accept', 'headers': headers})
+
+        connection = WSConnection(send, self.ws_send_queue, self.ws_send_timeout)
+        tasks = [asyncio.ensure_future(connection.send_loop()),
+                 asyncio.ensure_future(self.heartbeat(connection))]
+        self.ws_connections += 1
+        try:
+            while not connection.closed:
+                message = await receive()
+                if message['type'] == 'websocket.disconnect':
+                    break
+                connection.last_heard = time.monotonic()
+                await self.ws_message(connection, sid, cookies, message.get('text'))
+        finally:
+            self.ws_connections -= 1
+            connection.closed = True
+            for task in tasks:
+                task.cancel()
+
+    async def ws_message(self, connection, sid, cookies, text):
+        try:
+            data = json.loads(text) if text else None
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            return connection.put({'error': "Expected a JSON object"})
+        if data.get('type') == 'pong':
+            return
+        connection.last_action = time.monotonic()
+        message_id = data.pop('id', None)
+        steps = None
+        if 'actions' in data: # A batch, as for POST /actions
+            try:
+                steps = actions.parse_batch(data, self.max_batch_actions)
+            except actions.BatchError as e:
+                return connection.put({'error': str(e), 'id': message_id})
+
+        # Reload every time: the player may also be playing over HTTP in another tab
+        async with self.session_locks.ahold(sid):
+            loaded = await self.load_session(sid)
+            response, game_state = await self.play(sid, loaded, False, cookies, data, [], steps)
+        if response is None:
+            return connection.put({'error': CONFLICT_ERROR, 'id': message_id})
+        if message_id is not None:
+            response['id'] = message_id
+
+        def snapshot():
+            # Used instead if the client has fallen behind: one message with the latest state
+            message = {'rev': game_state['rev'], 'state': actions.response_view(game_state)}
+            if message_id is not None:
+                message['id'] = message_id
+            return message
+        connection.put(response, snapshot)
+
+    async def heartbeat(self, connection):
+        while not connection.closed:
+            await asyncio.sleep(self.ws_ping_interval)
+            now = time.monotonic()
+            if now - connection.last_heard > 2 * self.ws_ping_interval:
+                await connection.close(WS_CLOSE_GOING_AWAY) # Missed a pong: peer is gone
+            elif now - connection.last_action > self.ws_idle_timeout:
+                await connection.close(WS_CLOSE_IDLE)
+            else:
+                connection.put({'type': 'ping'})
+
+
+class WSConnection:
+    """Per-connection outbox with backpressure: a slow client gets coalesced snapshots."""
+    def __init__(self, send, limit, send_timeout):
+        self.send = send
+        self.limit = limit
+        self.send_timeout = send_timeout
+        self.outbox = deque()
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.last_heard = self.last_action = time.monotonic()
+        self.coalesced = 0
+
+    def put(self, message, snapshot=None):
+        if self.closed:
+            return
+        if len(self.outbox) >= self.limit:
+            if snapshot is None:
+                return # Heartbeats and errors can be dropped
+            # The client is behind: everything queued is superseded by the latest state
+            self.outbox.clear()
+            message = snapshot()
+            self.coalesced += 1
+        self.outbox.append(message)
+        self.ready.set()
+
+    async def send_loop(self):
+        try:
+            while not self.closed:
+                await self.ready.wait()
+                self.ready.clear()
+                while self.outbox:
+                    text = json.dumps(self.outbox.popleft(), separators=(',', ':'))
+                    await asyncio.wait_for(self.send({'type': 'websocket.send', 'text': text}), self.send_timeout)
+        except asyncio.TimeoutError:
+            await self.close(WS_CLOSE_GOING_AWAY) # Client isn't reading at all
+
+    async def close(self, code):
+        if not self.closed:
+            self.closed = True
+            self.ready.set()
+            await self.send({'type': 'websocket.close', 'code': code})
+
+
+# --- ASGI helpers ---
+
+def parse_cookies(scope):
+    cookies = {}
+    for name, value in scope.get('headers', []):
+        if name == b'cookie':
+            try:
+                cookies.update({k: m.value for k, m in SimpleCookie(value.decode('latin-1')).items()})
+            except CookieError:
+                pass # Ignore a garbled header, as if there were no cookies
+    return cookies
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def respond(send, status, body, content_type, headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type.encode('latin-1')),
+                    (b'content-length', str(len(body)).encode('latin-1')), *headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def create_asgi_app(flask_app=None):
+    """Builds the ASGI app around a Flask app (by default, app.app)."""
+    if flask_app is None:
+        from app import app as flask_app
+    return GameASGI(flask_app)
+
+
+app = create_asgi_app()
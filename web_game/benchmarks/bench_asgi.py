@@ -0,0 +1,218 @@
+# Benchmark: ASGI (asyncio) vs WSGI (threads) on one core
+#
+# Both paths run the same game (actions.apply_action) in this one process,
+# against a session store that answers after a fixed network-like latency,
+# i.e. what Redis or another remote store costs per call:
+#   - wsgi: Flask's test client driven from a pool of request threads, as a
+#     threaded WSGI worker would run it; each request holds a thread while
+#     it waits on the store
+#   - asgi: every player is a task on one event loop calling asgi.app
+#     directly; waiting on the store holds nothing
+#   - ws: the same players, but each sends its actions over one /ws
+#     connection instead of one request per action
+# Each player loads the page and then plays --actions actions back to back.
+#
+# Usage (from web_game/):
+#   python benchmarks/bench_asgi.py [--players 2000] [--latency-ms 5] [--threads 32]
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asgi # noqa: E402
+import session_store # noqa: E402
+from app import create_app # noqa: E402
+
+
+class SlowStore:
+    """A MemoryStore that takes `latency` seconds per call, blocking or async."""
+    blocking = True
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.inner = session_store.MemoryStore(max_entries=1_000_000)
+
+    def get(self, sid):
+        time.sleep(self.latency)
+        return self.inner.get(sid)
+
+    def get_versioned(self, sid):
+        time.sleep(self.latency)
+        return self.inner.get_versioned(sid)
+
+    def set(self, sid, payload):
+        time.sleep(self.latency)
+        self.inner.set(sid, payload)
+
+    def set_if(self, sid, payload, version):
+        time.sleep(self.latency)
+        return self.inner.set_if(sid, payload, version)
+
+    def delete(self, sid):
+        self.inner.delete(sid)
+
+    async def aget(self, sid):
+        await asyncio.sleep(self.latency)
+        return self.inner.get(sid)
+
+    async def aget_versioned(self, sid):
+        await asyncio.sleep(self.latency)
+        return self.inner.get_versioned(sid)
+
+    async def aset(self, sid, payload):
+        await asyncio.sleep(self.latency)
+        self.inner.set(sid, payload)
+
+    async def aset_if(self, sid, payload, version):
+        await asyncio.sleep(self.latency)
+        return self.inner.set_if(sid, payload, version)
+
+
+def pick_payload(state, rng):
+    """Clicks a random button, but always fights when in combat."""
+    options = state.get('options') or []
+    actions = [o['action'] for o in options]
+    if 'submit_name' in actions or not options:
+        return {'action': 'submit_name', 'input': 'Bench'}
+    if 'combat_attack' in actions:
+        return {'action': 'combat_attack'}
+    option = rng.choice(options)
+    return {key: option[key] for key in ('action', 'direction', 'item_id') if key in option}
+
+
+def run_wsgi(flask_app, players, actions, threads):
+    latencies = []
+
+    def player(seed):
+        rng = random.Random(seed)
+        client = flask_app.test_client()
+        client.get('/')
+        state = {}
+        for _ in range(actions):
+            start = time.perf_counter()
+            state = client.post('/action', json=pick_payload(state, rng)).get_json()
+            latencies.append(time.perf_counter() - start)
+
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(player, range(players)))
+    return latencies
+
+
+async def asgi_request(app, method, path, cookies, body=b''):
+    headers = [(b'content-type', b'application/json')]
+    if cookies:
+        headers.append((b'cookie', '; '.join(f"{k}={v}" for k, v in cookies.items()).encode('latin-1')))
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app({'type': 'http', 'method': method, 'path': path, 'headers': headers}, receive, send)
+    for name, value in messages[0]['headers']:
+        if name == b'set-cookie':
+            cookies.update({k: m.value for k, m in SimpleCookie(value.decode('latin-1')).items()})
+    return b''.join(m.get('body', b'') for m in messages[1:])
+
+
+def run_asgi(asgi_app, players, actions):
+    latencies = []
+
+    async def player(seed):
+        rng = random.Random(seed)
+        cookies = {}
+        await asgi_request(asgi_app, 'GET', '/', cookies)
+        state = {}
+        for _ in range(actions):
+            start = time.perf_counter()
+            body = json.dumps(pick_payload(state, rng)).encode('utf-8')
+            state = json.loads(await asgi_request(asgi_app, 'POST', '/action', cookies, body))
+            latencies.append(time.perf_counter() - start)
+
+    async def main():
+        await asyncio.gather(*(player(seed) for seed in range(players)))
+
+    asyncio.run(main())
+    return latencies
+
+
+def run_ws(asgi_app, players, actions):
+    latencies = []
+
+    async def player(seed):
+        rng = random.Random(seed)
+        cookies = {}
+        await asgi_request(asgi_app, 'GET', '/', cookies)
+        inbox, outbox = asyncio.Queue(), asyncio.Queue()
+        headers = [(b'cookie', '; '.join(f"{k}={v}" for k, v in cookies.items()).encode('latin-1'))]
+        await inbox.put({'type': 'websocket.connect'})
+        connection = asyncio.ensure_future(
+            asgi_app({'type': 'websocket', 'path': '/ws', 'headers': headers}, inbox.get, outbox.put))
+        await outbox.get() # websocket.accept
+        state = {}
+        for i in range(actions):
+            start = time.perf_counter()
+            payload = dict(pick_payload(state, rng), id=i)
+            await inbox.put({'type': 'websocket.receive', 'text': json.dumps(payload)})
+            state = json.loads((await outbox.get())['text'])
+            latencies.append(time.perf_counter() - start)
+        await inbox.put({'type': 'websocket.disconnect'})
+        await connection
+
+    async def main():
+        await asyncio.gather(*(player(seed) for seed in range(players)))
+
+    asyncio.run(main())
+    return latencies
+
+
+def report(mode, latencies, elapsed, threads):
+    latencies.sort()
+    print(f"{mode:<5} {len(latencies) / elapsed:>8,.0f} {latencies[len(latencies) // 2] * 1000:>8.2f} "
+          f"{latencies[int(len(latencies) * 0.99)] * 1000:>8.2f} {threads:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ASGI vs WSGI on one core with a slow session store.")
+    parser.add_argument('--players', type=int, default=2000, help="Concurrent players")
+    parser.add_argument('--actions', type=int, default=10, help="Actions per player")
+    parser.add_argument('--latency-ms', type=float, default=5.0, help="Session store latency per call")
+    parser.add_argument('--threads', type=int, default=32, help="WSGI request threads")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        flask_app = create_app({'SECRET_KEY': 'bench', 'SAVE_DB_PATH': os.path.join(tmp, 'saves.sqlite3')})
+        flask_app.session_interface.store = SlowStore(args.latency_ms / 1000)
+        asgi_app = asgi.create_asgi_app(flask_app)
+
+        print(f"{args.players:,} players x {args.actions} actions, store latency {args.latency_ms:g} ms\n")
+        print(f"{'mode':<5} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'threads':>8}")
+        start = time.perf_counter()
+        latencies = run_wsgi(flask_app, args.players, args.actions, args.threads)
+        report('wsgi', latencies, time.perf_counter() - start, args.threads)
+
+        threads_before = threading.active_count()
+        start = time.perf_counter()
+        latencies = run_asgi(asgi_app, args.players, args.actions)
+        report('asgi', latencies, time.perf_counter() - start, threading.active_count() - threads_before + 1)
+
+        start = time.perf_counter()
+        latencies = run_ws(asgi_app, args.players, args.actions)
+        report('ws', latencies, time.perf_counter() - start, threading.active_count() - threads_before + 1)
+        flask_app.extensions['savegames'].close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# Microbenchmark: per-turn Character state round trip
+#
+# Every combat turn rebuilds both Characters from their saved state and
+# serializes them again. This compares:
+#   legacy dict  - the old __dict__-backed Character with dict states
+#   slots dict   - the __slots__ Character with dict states
+#   slots codec  - the __slots__ Character with codec.py bytes
+# reporting time per round trip and memory blocks allocated per round trip.
+#
+# Usage (from web_game/):  python benchmarks/bench_character_codec.py [--turns 200000]
+
+import argparse
+import os
+import sys
+import timeit
+import tracemalloc
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from game_logic import codec, combat, simulation # noqa: E402
+
+# The pre-__slots__ Character: same methods, ordinary instance __dict__
+LegacyCharacter = type('LegacyCharacter', (), {
+    name: value for name, value in vars(combat.Character).items()
+    if name not in ('__slots__', '__dict__', '__weakref__') and not isinstance(value, types.MemberDescriptorType)
+})
+
+
+def make_round_trips():
+    player_state = simulation.make_build(weapon='rusty_sword')
+    player_state['inventory'] = ['fists']
+    enemy_state = combat.Character('Goblin', 50, 8, 2).get_state()
+    player_bytes = codec.encode_character(player_state)
+    enemy_bytes = codec.encode_character(enemy_state)
+
+    def legacy_dict():
+        player = LegacyCharacter.from_state(player_state)
+        enemy = LegacyCharacter.from_state(enemy_state)
+        return player.get_state(), enemy.get_state()
+
+    def slots_dict():
+        player = combat.Character.from_state(player_state)
+        enemy = combat.Character.from_state(enemy_state)
+        return player.get_state(), enemy.get_state()
+
+    def slots_codec():
+        player = combat.Character.from_bytes(player_bytes)
+        enemy = combat.Character.from_bytes(enemy_bytes)
+        return player.to_bytes(), enemy.to_bytes()
+
+    return {'legacy dict': legacy_dict, 'slots dict': slots_dict, 'slots codec': slots_codec}, \
+        (len(repr(player_state)) + len(repr(enemy_state)), len(player_bytes) + len(enemy_bytes))
+
+
+def allocated_blocks(func, iterations=2000):
+    """Memory blocks allocated per call, keeping every result alive so nothing is freed."""
+    results = []
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(iterations):
+        results.append(func())
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+    return blocks / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--turns', type=int, default=200_000)
+    args = parser.parse_args()
+
+    round_trips, (dict_size, codec_size) = make_round_trips()
+    print(f"state size: dict repr {dict_size} B, codec {codec_size} B\n")
+    print(f"{'round trip':<12} {'us/turn':>8} {'blocks/turn':>12}")
+    for name, func in round_trips.items():
+        seconds = min(timeit.repeat(func, number=args.turns // 5, repeat=5)) / (args.turns // 5)
+        print(f"{name:<12} {seconds * 1e6:>8.2f} {allocated_blocks(func):>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# Benchmark: save game throughput, write-behind vs one commit per update
+#
+# Simulates thousands of concurrent players, each saving after every action,
+# from a pool of request threads. "sync" commits every update on its own (one
+# fsync each); "write-behind" queues them in savegames.WriteBehindQueue, which
+# coalesces repeated saves per player and commits them in batches.
+#
+# Usage (from web_game/):
+#   python benchmarks/bench_savegames.py [--players 5000] [--updates 20] [--threads 16]
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import savegames # noqa: E402
+from game_logic import simulation # noqa: E402
+
+
+def make_updates(players, updates, seed):
+    """Builds (save_id, payload) updates, interleaving players like concurrent traffic."""
+    rng = random.Random(seed)
+    save_ids = [f"{i:032d}" for i in range(players)]
+    builds = {save_id: simulation.make_build(name=f"Player {i}") for i, save_id in enumerate(save_ids)}
+    sequence = save_ids * updates
+    rng.shuffle(sequence)
+    result = []
+    for save_id in sequence:
+        build = builds[save_id]
+        build['xp'] += rng.randint(1, 10) # Every save really is different
+        result.append((save_id, savegames.encode({'v': savegames.SAVE_VERSION, 'player': build, 'location': 'forest'})))
+    return result
+
+
+def run(mode, updates, threads, path, flush_interval):
+    """Pushes `updates` through `threads` workers. Returns a report dict."""
+    store = savegames.SaveStore(path)
+    queue = savegames.WriteBehindQueue(store, flush_interval=flush_interval) if mode == 'write-behind' else None
+    chunks = [updates[i::threads] for i in range(threads)]
+    latencies = [[] for _ in range(threads)]
+
+    def worker(i):
+        timings = latencies[i]
+        for save_id, payload in chunks[i]:
+            start = time.perf_counter()
+            if queue is not None:
+                queue.put(save_id, payload)
+            else:
+                store.write_many([(save_id, payload)])
+            timings.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    accepted = time.perf_counter() - start
+    if queue is not None:
+        queue.flush() # Count the time until everything is durable
+    durable = time.perf_counter() - start
+
+    all_latencies = sorted(x for timings in latencies for x in timings)
+    report = {
+        'mode': mode,
+        'updates': len(updates),
+        'accepted_per_s': len(updates) / accepted,
+        'durable_per_s': len(updates) / durable,
+        'p50_us': all_latencies[len(all_latencies) // 2] * 1e6,
+        'p99_us': all_latencies[int(len(all_latencies) * 0.99)] * 1e6,
+        'commits': queue.stats['batches'] if queue is not None else len(updates),
+        'rows': queue.stats['writes'] if queue is not None else len(updates),
+    }
+    if queue is not None:
+        queue.close()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Save game throughput benchmark.")
+    parser.add_argument('--players', type=int, default=5000)
+    parser.add_argument('--updates', type=int, default=20, help="Saves per player")
+    parser.add_argument('--threads', type=int, default=16, help="Concurrent request threads")
+    parser.add_argument('--sync-updates', type=int, default=3000,
+                        help="Updates to run in sync mode (one fsync each, so it's capped)")
+    parser.add_argument('--flush-interval', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+
+    updates = make_updates(args.players, args.updates, args.seed)
+    print(f"{args.players:,} players x {args.updates} saves, {args.threads} threads\n")
+    print(f"{'mode':<13} {'updates':>8} {'accepted/s':>11} {'durable/s':>10} {'p50 us':>8} {'p99 us':>9} {'commits':>8} {'rows':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode, sample in (('sync', updates[:args.sync_updates]), ('write-behind', updates)):
+            r = run(mode, sample, args.threads, os.path.join(tmp, f"{mode}.sqlite3"), args.flush_interval)
+            print(f"{r['mode']:<13} {r['updates']:>8,} {r['accepted_per_s']:>11,.0f} {r['durable_per_s']:>10,.0f} "
+                  f"{r['p50_us']:>8.1f} {r['p99_us']:>9.1f} {r['commits']:>8,} {r['rows']:>8,}")
+
+
+if __name__ == '__main__':
+    main()
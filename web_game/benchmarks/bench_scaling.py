@@ -0,0 +1,181 @@
+# Load test: throughput vs number of worker processes
+#
+# Starts the app with 1, 2, 4, ... workers sharing one SQLite session store
+# and a shared SECRET_KEY, then hammers it from several client processes for
+# a fixed time. Each client plays its own session and spreads its requests
+# over every server, so the run also checks that any worker can serve any
+# session: every response must carry exactly the next revision.
+#
+# Servers are gunicorn (gunicorn.conf.py) if it's installed, otherwise one
+# single-threaded dev server per worker with the clients round-robining
+# between them, like nodes behind a load balancer.
+#
+# Usage (from web_game/):
+#   python benchmarks/bench_scaling.py [--workers 1,2,4] [--clients 8] [--duration 5]
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import secrets
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from http.cookies import SimpleCookie
+
+WEB_GAME = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_servers(kind, workers, env):
+    """Starts the app with `workers` processes. Returns (processes, ports)."""
+    if kind == 'gunicorn':
+        port = free_port()
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                   '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--threads', '1']
+        quiet = {'stdout': subprocess.DEVNULL, 'stderr': subprocess.DEVNULL}
+        return [subprocess.Popen(command, cwd=WEB_GAME, env=env, **quiet)], [port]
+    processes, ports = [], []
+    for _ in range(workers):
+        port = free_port()
+        command = [sys.executable, '-c', f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=False)"]
+        processes.append(subprocess.Popen(command, cwd=WEB_GAME, env=env,
+                                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        ports.append(port)
+    return processes, ports
+
+
+def wait_ready(ports, timeout=20):
+    deadline = time.time() + timeout
+    for port in ports:
+        while True:
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+                conn.request('GET', '/')
+                conn.getresponse().read()
+                conn.close()
+                break
+            except OSError:
+                if time.time() > deadline:
+                    raise RuntimeError(f"Server on port {port} didn't start")
+                time.sleep(0.1)
+
+
+def pick_payload(state, rng):
+    """Clicks a random button, but always fights when in combat."""
+    options = state.get('options') or []
+    actions = [o['action'] for o in options]
+    if 'submit_name' in actions or not options:
+        return {'action': 'submit_name', 'input': 'Load'}
+    if 'combat_attack' in actions:
+        return {'action': 'combat_attack'}
+    option = rng.choice(options)
+    return {key: option[key] for key in ('action', 'direction', 'item_id') if key in option}
+
+
+def client(args):
+    """One player: plays its own session for `duration` seconds across all `ports`."""
+    ports, duration, seed = args
+    rng = random.Random(seed)
+    connections = [http.client.HTTPConnection('127.0.0.1', port, timeout=10) for port in ports]
+    cookies = {}
+    latencies, errors, stale = [], 0, 0
+    state, rev = {}, 0
+    turn = 0
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        conn = connections[turn % len(connections)] # Never the same server twice in a row
+        turn += 1
+        body = json.dumps(pick_payload(state, rng))
+        headers = {'Content-Type': 'application/json'}
+        if cookies:
+            headers['Cookie'] = '; '.join(f"{k}={v}" for k, v in cookies.items())
+        start = time.perf_counter()
+        try:
+            conn.request('POST', '/action', body=body, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            continue
+        latencies.append(time.perf_counter() - start)
+        for header in response.headers.get_all('Set-Cookie') or []:
+            cookie = SimpleCookie(header)
+            cookies.update({k: morsel.value for k, morsel in cookie.items()})
+        if response.status != 200:
+            errors += 1
+            continue
+        state = json.loads(data)
+        if state.get('rev') != rev + 1:
+            stale += 1 # This server didn't see the previous request's write
+        rev = state.get('rev', rev)
+    return latencies, errors, stale
+
+
+def run(kind, workers, clients, duration, tmp):
+    env = dict(os.environ,
+               SECRET_KEY=secrets.token_hex(16), # Shared by every worker
+               SESSION_BACKEND='sqlite', SESSION_CACHE_SIZE='0',
+               SESSION_SQLITE_PATH=os.path.join(tmp, f"sessions-{workers}.sqlite3"),
+               SAVE_DB_PATH=os.path.join(tmp, f"saves-{workers}.sqlite3"),
+               WEB_CONCURRENCY=str(workers))
+    processes, ports = start_servers(kind, workers, env)
+    try:
+        wait_ready(ports)
+        with multiprocessing.Pool(clients) as pool:
+            results = pool.map(client, [(ports, duration, seed) for seed in range(clients)])
+    finally:
+        for p in processes:
+            p.terminate()
+            p.wait()
+    latencies = sorted(x for r in results for x in r[0])
+    return {
+        'workers': workers,
+        'requests': len(latencies),
+        'rps': len(latencies) / duration,
+        'p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0,
+        'errors': sum(r[1] for r in results),
+        'stale': sum(r[2] for r in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-process scaling load test.")
+    parser.add_argument('--workers', default='1,2,4', help="Comma separated worker counts")
+    parser.add_argument('--clients', type=int, default=8, help="Concurrent client processes")
+    parser.add_argument('--duration', type=float, default=5.0, help="Seconds per run")
+    parser.add_argument('--server', choices=['auto', 'gunicorn', 'processes'], default='auto')
+    args = parser.parse_args()
+
+    kind = args.server
+    if kind == 'auto':
+        try:
+            import gunicorn # noqa: F401
+            kind = 'gunicorn'
+        except ImportError:
+            kind = 'processes'
+    print(f"server: {kind}, {args.clients} clients, {args.duration:.0f}s per run, {os.cpu_count()} CPUs\n")
+    print(f"{'workers':>7} {'req/s':>8} {'speedup':>8} {'p50 ms':>7} {'p99 ms':>7} {'errors':>6} {'stale':>6}")
+    baseline = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for workers in (int(w) for w in args.workers.split(',')):
+            r = run(kind, workers, args.clients, args.duration, tmp)
+            baseline = baseline or r['rps']
+            print(f"{r['workers']:>7} {r['rps']:>8,.0f} {r['rps'] / baseline:>7.2f}x {r['p50_ms']:>7.2f} "
+                  f"{r['p99_ms']:>7.2f} {r['errors']:>6} {r['stale']:>6}")
+    # Scaling tops out at the number of CPU cores (clients share them too)
+
+
+if __name__ == '__main__':
+    main()
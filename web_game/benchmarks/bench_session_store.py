@@ -0,0 +1,96 @@
+# Benchmark: cookie session vs server-side session stores
+#
+# Drives the real app through Flask's test client with a fixed, seeded
+# walk through the game and reports per-request latency plus the bytes each
+# request/response spends on session data.
+#
+# Usage (from web_game/):  python benchmarks/bench_session_store.py [--requests 2000]
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app # noqa: E402
+import session_store # noqa: E402
+
+
+def pick_payload(state, rng):
+    """Chooses the next action the way a player clicking buttons would."""
+    options = state.get('options') or []
+    actions = [o['action'] for o in options]
+    if 'submit_name' in actions:
+        return {'action': 'submit_name', 'input': 'Bench'}
+    if 'combat_attack' in actions:
+        return {'action': 'combat_attack'}
+    option = rng.choice(options)
+    payload = {'action': option['action']}
+    for key in ('direction', 'item_id'):
+        if key in option:
+            payload[key] = option[key]
+    return payload
+
+
+def run(backend, requests, seed=1234):
+    """Runs `requests` actions against the app using the given backend."""
+    app.config['SESSION_BACKEND'] = backend
+    if backend == 'cookie':
+        app.session_interface = app.__class__.session_interface # Flask's default
+    else:
+        session_store.init_app(app)
+
+    rng = random.Random(seed)
+    client = app.test_client()
+    client.get('/')
+    state = {'options': [{'action': 'submit_name'}]}
+    latencies = []
+    cookie_bytes = [] # Cookie header sent with each request
+    set_cookie_bytes = [] # Set-Cookie headers received
+    body_bytes = []
+
+    for _ in range(requests):
+        payload = pick_payload(state, rng)
+        cookie = client.get_cookie('session')
+        cookie_bytes.append(len(cookie.key) + 1 + len(cookie.value) if cookie else 0)
+        start = time.perf_counter()
+        response = client.post('/action', json=payload)
+        latencies.append(time.perf_counter() - start)
+        set_cookie_bytes.append(sum(len(h) for h in response.headers.getlist('Set-Cookie')))
+        body_bytes.append(len(response.data))
+        state = response.get_json()
+
+    latencies.sort()
+    return {
+        'backend': backend,
+        'mean_ms': statistics.fmean(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000,
+        'cookie_b': statistics.fmean(cookie_bytes),
+        'set_cookie_b': statistics.fmean(set_cookie_bytes),
+        'body_b': statistics.fmean(body_bytes),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--backends', default='cookie,memory,sqlite')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='session-bench-')
+    app.config['SESSION_SQLITE_PATH'] = os.path.join(tmpdir, 'sessions.sqlite3')
+
+    print(f"{'backend':<8} {'mean ms':>8} {'p95 ms':>8} {'cookie B':>9} {'set-cookie B':>13} {'body B':>8} {'wire B':>8}")
+    for backend in args.backends.split(','):
+        r = run(backend, args.requests)
+        wire = r['cookie_b'] + r['set_cookie_b'] + r['body_b']
+        print(f"{r['backend']:<8} {r['mean_ms']:>8.3f} {r['p95_ms']:>8.3f} {r['cookie_b']:>9.0f} "
+              f"{r['set_cookie_b']:>13.0f} {r['body_b']:>8.0f} {wire:>8.0f}")
+
+
+if __name__ == '__main__':
+    main()
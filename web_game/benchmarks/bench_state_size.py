@@ -0,0 +1,70 @@
+# Benchmark: size and (de)serialization cost of the stored game_state
+#
+# Plays seeded random sessions straight through actions.apply_action (each
+# step picks one of the options the last response offered) and, after every
+# action, measures the game_state the session store would write:
+#   - its JSON size, the way the server-side stores serialize it
+#   - json.dumps / json.loads time per state
+# Runs the same on any tree, so checking out an older commit and running it
+# again gives the before/after numbers for a change to the stored shape.
+#
+# Usage (from web_game/):  python benchmarks/bench_state_size.py [--sessions 200] [--steps 200]
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import actions # noqa: E402
+import state_schema # noqa: E402
+
+# The stored form, on trees that have one (see state_schema.to_stored)
+stored = getattr(state_schema, 'to_stored', lambda game_state: game_state)
+
+
+def play(seed, steps):
+    """One session's stored states, as JSON, after each of `steps` actions."""
+    pick = random.Random(seed)
+    game_state = actions.new_game_state()
+    game_state['rng'] = [seed, 0] # Same fights on every tree
+    response = actions.apply_action(game_state, {'action': 'submit_name', 'name': f"Player{seed}"})
+    dumps = []
+    for _ in range(steps):
+        options = response.get('options') or [{'action': 'rest'}]
+        choice = {key: value for key, value in pick.choice(options).items() if key != 'text'}
+        response = actions.apply_action(game_state, choice)
+        dumps.append(json.dumps({'game_state': stored(game_state)}, separators=(',', ':')))
+    return dumps
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sessions', type=int, default=200)
+    parser.add_argument('--steps', type=int, default=200)
+    args = parser.parse_args()
+
+    dumps = [d for seed in range(args.sessions) for d in play(seed, args.steps)]
+    sizes = sorted(len(d.encode('utf-8')) for d in dumps)
+    states = [json.loads(d) for d in dumps]
+
+    # Over a fixed sample, so the timings don't depend on --sessions
+    sample = dumps[::max(1, len(dumps) // 2000)]
+    sample_states = states[::max(1, len(states) // 2000)]
+    dumps_us = min(timeit.repeat(lambda: [json.dumps(s, separators=(',', ':')) for s in sample_states],
+                                 number=5, repeat=5)) / 5 / len(sample_states) * 1e6
+    loads_us = min(timeit.repeat(lambda: [json.loads(d) for d in sample],
+                                 number=5, repeat=5)) / 5 / len(sample) * 1e6
+
+    print(f"{len(sizes)} states from {args.sessions} sessions x {args.steps} actions")
+    print(f"{'mean B':>8} {'p50 B':>8} {'p95 B':>8} {'max B':>8} {'dumps us':>9} {'loads us':>9}")
+    print(f"{statistics.fmean(sizes):>8.0f} {sizes[len(sizes) // 2]:>8} {sizes[int(len(sizes) * 0.95)]:>8} "
+          f"{sizes[-1]:>8} {dumps_us:>9.2f} {loads_us:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,377 @@
+# Load generator: simulated players against the real app
+#
+# Each player is a thread playing its own session from character creation:
+#   - walks the location graph, preferring exits it has taken less often
+#     (weight 1 / (1 + visits)), so players spread out over the whole map
+#   - fights every encounter to the end (defending now and then when low)
+#   - picks up whatever items it finds, equips the rusty sword and spends
+#     stat points as soon as it has them, and rests at camp when hurt
+# Players send the revision they hold and apply the patch replies, like
+# index.html does.
+#
+# Targets:
+#   - client: Flask's test client, in this process (default)
+#   - http: a local dev server started for the run, or --url for one that's
+#     already running (e.g. gunicorn); nothing leaves localhost
+#
+# Reports throughput and p50/p95/p99 latency per action type, and the mean
+# size of the sessions written in each --interval window (from /metrics;
+# against a multi-worker server that's only the worker that answered the scrape).
+# With --max-p99-ms / --max-errors it exits non-zero when the run is over
+# budget, so it can gate a deploy.
+#
+# Usage (from web_game/):
+#   python benchmarks/loadgen.py [--target client|http] [--players 50] [--actions 200]
+#                                [--url http://127.0.0.1:8000] [--max-p99-ms 50] [--json out.json]
+
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import secrets
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlsplit
+
+WEB_GAME = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, WEB_GAME)
+
+from game_logic import world # noqa: E402
+
+STATS = ('health', 'attack', 'defense')
+
+
+# --- Transports ---
+
+class ClientTransport:
+    """One player's connection through Flask's test client."""
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+
+    def request(self, method, path, payload=None):
+        """Returns (status, body bytes)."""
+        response = self.client.open(path, method=method, json=payload)
+        return response.status_code, response.get_data()
+
+
+class HTTPTransport:
+    """One player's keep-alive HTTP connection, with its own cookie jar."""
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.conn = http.client.HTTPConnection(host, port, timeout=30)
+        self.cookies = {}
+
+    def request(self, method, path, payload=None):
+        headers = {}
+        body = None
+        if payload is not None:
+            body = json.dumps(payload)
+            headers['Content-Type'] = 'application/json'
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f"{k}={v}" for k, v in self.cookies.items())
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close() # Reconnects on the next request
+            raise
+        for header in response.headers.get_all('Set-Cookie') or []:
+            self.cookies.update({k: m.value for k, m in SimpleCookie(header).items()})
+        return response.status, data
+
+
+# --- Players ---
+
+def apply_patch(state, ops):
+    """Applies a state_protocol patch to a client-side copy of the state."""
+    for op in ops:
+        tokens = [t.replace('~1', '/').replace('~0', '~') for t in op['path'].split('/')[1:]]
+        if not tokens: # Whole document replaced
+            state = op['value']
+            continue
+        parent = state
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+        last = tokens[-1]
+        if isinstance(parent, list):
+            last = int(last)
+        if op['op'] == 'remove':
+            del parent[last]
+        else:
+            parent[last] = op['value']
+    return state
+
+
+class Player:
+    """A simulated player: decides its next action from the state it holds."""
+    def __init__(self, transport, seed):
+        self.transport = transport
+        self.rng = random.Random(seed)
+        self.state = {}
+        self.rev = None # Until the first reply we hold no revision
+        self.visits = {} # location -> times entered
+
+    def next_payload(self):
+        state = self.state
+        options = state.get('options') or []
+        actions = {o['action'] for o in options}
+        stats = state.get('player_stats') or {}
+        if not stats or 'submit_name' in actions:
+            return {'action': 'submit_name', 'input': f"Player{self.rng.randrange(10000)}"}
+
+        if 'combat_attack' in actions:
+            low = stats['health'] < 0.25 * stats['max_health']
+            if low and self.rng.random() < 0.3:
+                return {'action': 'combat_defend'}
+            return {'action': 'combat_attack'}
+        if 'end_combat' in actions:
+            return {'action': 'end_combat'}
+
+        if stats.get('stat_points', 0) > 0:
+            return {'action': f"allocate_{self.rng.choice(STATS)}"}
+        for option in options:
+            if option['action'] == 'take_item':
+                return {'action': 'take_item', 'item_id': option['item_id']}
+        if 'rusty_sword' in stats.get('inventory', []) and stats.get('equipment', {}).get('weapon') == 'fists':
+            return {'action': 'equip_weapon', 'item_id': 'rusty_sword'}
+        if 'rest' in actions and stats['health'] < stats['max_health']:
+            return {'action': 'rest'}
+        return self.walk(options)
+
+    def walk(self, options):
+        """Picks an exit (or a local action like exploring), favouring places seen less."""
+        here = self.state.get('current_location')
+        choices, weights = [], []
+        for option in options:
+            if option['action'] == 'go':
+                target = world.WORLD.exit(here, option['direction'])
+                weights.append(1 / (1 + self.visits.get(target, 0)))
+                choices.append({'action': 'go', 'direction': option['direction']})
+            elif option['action'] in ('explore_forest', 'rest'):
+                weights.append(0.25)
+                choices.append({'action': option['action']})
+        if not choices:
+            return {'action': 'rest'} # Nothing offered; any action refreshes the options
+        choice = self.rng.choices(choices, weights)[0]
+        if choice['action'] == 'go':
+            target = world.WORLD.exit(here, choice['direction'])
+            self.visits[target] = self.visits.get(target, 0) + 1
+        return choice
+
+    def act(self):
+        """Sends one action. Returns (action, latency, ok)."""
+        payload = self.next_payload()
+        if self.rev is not None:
+            payload['rev'] = self.rev
+        start = time.perf_counter()
+        try:
+            status, body = self.transport.request('POST', '/action', payload)
+        except (OSError, http.client.HTTPException):
+            return payload['action'], time.perf_counter() - start, False
+        latency = time.perf_counter() - start
+        if status != 200:
+            return payload['action'], latency, False
+        reply = json.loads(body)
+        rev = reply['rev']
+        if 'patch' in reply and reply.get('base') == self.rev:
+            self.state = apply_patch(self.state, reply['patch'])
+        else:
+            self.state = reply.get('state', reply)
+            self.state.pop('rev', None) # Legacy replies carry it inline
+        self.rev = rev
+        return payload['action'], latency, True
+
+
+# --- Session size sampling ---
+
+_METRIC_RE = re.compile(r'^game_session_bytes_(sum|count) (\S+)$', re.M)
+
+def session_bytes(transport):
+    """Returns (sum, count) of game_session_bytes from /metrics."""
+    status, body = transport.request('GET', '/metrics')
+    if status != 200:
+        return 0.0, 0
+    values = dict(_METRIC_RE.findall(body.decode('utf-8')))
+    return float(values.get('sum', 0)), int(float(values.get('count', 0)))
+
+
+def sample_sessions(transport, interval, stop, windows):
+    """Appends (elapsed, mean session bytes written in the window, writes) every `interval`."""
+    start = time.perf_counter()
+    last = session_bytes(transport)
+    while not stop.wait(interval):
+        current = session_bytes(transport)
+        writes = current[1] - last[1]
+        if writes:
+            windows.append((time.perf_counter() - start, (current[0] - last[0]) / writes, writes))
+        last = current
+
+
+# --- Running ---
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(tmp):
+    """Starts a threaded dev server for the run. Returns (process, port)."""
+    port = free_port()
+    env = dict(os.environ, SECRET_KEY=secrets.token_hex(16), SESSION_BACKEND='memory',
+               SAVE_DB_PATH=os.path.join(tmp, 'saves.sqlite3'))
+    command = [sys.executable, '-c', f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    process = subprocess.Popen(command, cwd=WEB_GAME, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 20
+    while True:
+        try:
+            HTTPTransport('127.0.0.1', port).request('GET', '/metrics')
+            return process, port
+        except OSError:
+            if time.time() > deadline or process.poll() is not None:
+                process.terminate()
+                raise RuntimeError("Dev server didn't start")
+            time.sleep(0.1)
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+def run(make_transport, players, actions, seed, interval):
+    """Runs the players to completion. Returns the results dict."""
+    results = {} # action -> list of latencies
+    errors = {}
+    lock = threading.Lock()
+
+    def play(index):
+        transport = make_transport()
+        transport.request('GET', '/') # Gets the session cookie, like opening the page
+        player = Player(transport, seed * 100003 + index)
+        latencies, failed = {}, {}
+        for _ in range(actions):
+            action, latency, ok = player.act()
+            latencies.setdefault(action, []).append(latency)
+            if not ok:
+                failed[action] = failed.get(action, 0) + 1
+        with lock:
+            for action, values in latencies.items():
+                results.setdefault(action, []).extend(values)
+            for action, count in failed.items():
+                errors[action] = errors.get(action, 0) + count
+
+    stop = threading.Event()
+    windows = []
+    sampler = threading.Thread(target=sample_sessions, args=(make_transport(), interval, stop, windows), daemon=True)
+    threads = [threading.Thread(target=play, args=(i,)) for i in range(players)]
+    start = time.perf_counter()
+    sampler.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    sampler.join()
+
+    per_action = {}
+    for action, values in sorted(results.items()):
+        values.sort()
+        per_action[action] = {
+            'count': len(values),
+            'errors': errors.get(action, 0),
+            'p50_ms': percentile(values, 0.50) * 1000,
+            'p95_ms': percentile(values, 0.95) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000,
+        }
+    everything = sorted(x for values in results.values() for x in values)
+    return {
+        'players': players,
+        'requests': len(everything),
+        'seconds': elapsed,
+        'rps': len(everything) / elapsed,
+        'errors': sum(errors.values()),
+        'p50_ms': percentile(everything, 0.50) * 1000,
+        'p95_ms': percentile(everything, 0.95) * 1000,
+        'p99_ms': percentile(everything, 0.99) * 1000,
+        'actions': per_action,
+        'session_bytes': [{'t': t, 'mean_bytes': mean, 'writes': writes} for t, mean, writes in windows],
+    }
+
+
+def report(r):
+    print(f"{r['players']} players, {r['requests']:,} actions in {r['seconds']:.1f}s: "
+          f"{r['rps']:,.0f} actions/s, {r['errors']} errors\n")
+    print(f"{'action':<16} {'count':>7} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for action, a in r['actions'].items():
+        print(f"{action:<16} {a['count']:>7,} {a['errors']:>6} {a['p50_ms']:>8.2f} {a['p95_ms']:>8.2f} {a['p99_ms']:>8.2f}")
+    print(f"{'all':<16} {r['requests']:>7,} {r['errors']:>6} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f}")
+    if r['session_bytes']:
+        print(f"\n{'t (s)':>7} {'session B':>10} {'writes':>8}")
+        for window in r['session_bytes']:
+            print(f"{window['t']:>7.1f} {window['mean_bytes']:>10.0f} {window['writes']:>8,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated players against the game.")
+    parser.add_argument('--target', choices=['client', 'http'], default='client')
+    parser.add_argument('--url', help="Server to load (http target); default: start a local dev server")
+    parser.add_argument('--players', type=int, default=50, help="Concurrent players")
+    parser.add_argument('--actions', type=int, default=200, help="Actions per player")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--interval', type=float, default=1.0, help="Seconds per session size sample")
+    parser.add_argument('--max-p99-ms', type=float, help="Fail if any action's p99 is above this")
+    parser.add_argument('--max-errors', type=int, help="Fail if more requests than this fail")
+    parser.add_argument('--json', help="Also write the results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        process = None
+        if args.target == 'client':
+            from app import create_app
+            flask_app = create_app({'SECRET_KEY': 'loadgen', 'SESSION_BACKEND': 'memory',
+                                    'SAVE_DB_PATH': os.path.join(tmp, 'saves.sqlite3')})
+            make_transport = lambda: ClientTransport(flask_app)
+        else:
+            if args.url:
+                url = urlsplit(args.url)
+                host, port = url.hostname, url.port or 80
+            else:
+                process, port = start_server(tmp)
+                host = '127.0.0.1'
+            make_transport = lambda: HTTPTransport(host, port)
+        try:
+            r = run(make_transport, args.players, args.actions, args.seed, args.interval)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+        if args.target == 'client':
+            flask_app.extensions['savegames'].close()
+
+    report(r)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(r, f, indent=2)
+
+    failures = []
+    if args.max_p99_ms is not None:
+        failures += [f"{action} p99 {a['p99_ms']:.2f} ms > {args.max_p99_ms:g} ms"
+                     for action, a in r['actions'].items() if a['p99_ms'] > args.max_p99_ms]
+    if args.max_errors is not None and r['errors'] > args.max_errors:
+        failures.append(f"{r['errors']} errors > {args.max_errors}")
+    if failures:
+        print("\nFAILED:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
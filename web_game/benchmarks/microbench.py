@@ -0,0 +1,272 @@
+# Microbenchmarks for the game's hot paths, with stored baselines
+#
+# Each case times one call of a hot path (best of --repeat runs, so noise
+# from other processes only ever makes a case look slower, never faster;
+# compare re-measures a case that looks regressed before failing):
+#   combat.handle_combat_action  (one enemy, and a 3 enemy pack)
+#   Character.from_state / get_state
+#   locations.get_location_data  (every location in the world)
+#   items.get_item_details, and Inventory operations on a full 1,000 item hoard
+#   progression.xp_for_next_level, and end_combat with a run of level-ups
+#   perform_action dispatch, and POST /action through the test client
+#
+# Baselines live in benchmarks/baselines.json. Timings from different
+# machines aren't comparable, so every run also times a fixed pure-Python
+# calibration loop and compare scales the baselines by how much faster or
+# slower this machine is than the one that recorded them.
+#
+# Usage (from web_game/):
+#   python benchmarks/microbench.py run [-k combat]
+#   python benchmarks/microbench.py save                  (re-record baselines.json)
+#   python benchmarks/microbench.py compare [--threshold 25]   (exits 1 on a regression)
+#
+# compare also checks, with fixed seeds, that the vectorized combat simulator
+# still agrees with the real combat code (simulation.check_equivalence), and
+# exits 1 on a MISMATCH: a change to the combat rules has to be made in both.
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import actions # noqa: E402
+from game_logic import combat, items, locations, progression, simulation, world # noqa: E402
+from game_logic.inventory import CAPACITY, Inventory # noqa: E402
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+BIG = 10 ** 9 # Health for fights that must never end while we time them
+
+
+# --- Cases ---
+# Each returns the zero-argument function to time; setup happens outside it.
+
+def case_combat_turn():
+    state = combat.start_combat(simulation.make_build(health=BIG, weapon='rusty_sword'), 'Goblin')
+    state['enemy']['health'] = state['enemy']['max_health'] = BIG
+    return lambda: combat.handle_combat_action(state, 'attack')
+
+def case_combat_pack_turn():
+    state = combat.start_combat(simulation.make_build(health=BIG, weapon='rusty_sword'), ['Goblin', 'Goblin', 'Slime'])
+    for enemy in state['enemies']:
+        enemy['health'] = enemy['max_health'] = BIG
+    return lambda: combat.handle_combat_action(state, 'attack')
+
+def case_character_round_trip():
+    player_state = simulation.make_build(weapon='rusty_sword')
+    return lambda: combat.Character.from_state(player_state).get_state()
+
+def case_location_data():
+    game_state = {'player_stats': simulation.make_build()}
+    location_ids = list(world.WORLD.locations)
+    def run():
+        for location_id in location_ids:
+            locations.get_location_data(location_id, game_state)
+    return run
+
+def case_item_details():
+    return lambda: items.get_item_details('rusty_sword')
+
+def case_inventory_hoard():
+    # A full inventory at the default CAPACITY: 1,000 distinct items of weight 1
+    player_stats = {'inventory': {f'junk_{i}': 1 for i in range(CAPACITY)}}
+    def run():
+        inventory = Inventory.of(player_stats)
+        inventory.remove('junk_500')
+        inventory.add('junk_500')
+        return 'junk_999' in inventory
+    return run
+
+def case_xp_for_next_level():
+    return lambda: progression.xp_for_next_level(17)
+
+def case_level_up_loop():
+    def run():
+        player = simulation.make_build()
+        player['xp'] = 50000 # Enough for ~25 level-ups in one go
+        game_state = {
+            'v': 2, 'current_location': 'forest', 'player_stats': player,
+            'combat_state': {'enemy': {'name': 'Goblin'}, 'is_over': True, 'victory': True, 'destination': 'forest'},
+        }
+        actions.perform_action(game_state, {'action': 'end_combat'})
+    return run
+
+def case_perform_action():
+    game_state = actions.new_game_state()
+    actions.perform_action(game_state, {'action': 'submit_name', 'input': 'Bench'})
+    return lambda: actions.perform_action(game_state, {'action': 'rest'})
+
+def case_http_action():
+    from app import create_app
+    tmp = tempfile.mkdtemp(prefix='microbench-')
+    flask_app = create_app({'SECRET_KEY': 'microbench', 'SESSION_BACKEND': 'memory',
+                            'SAVE_DB_PATH': os.path.join(tmp, 'saves.sqlite3')})
+    client = flask_app.test_client()
+    client.get('/')
+    client.post('/action', json={'action': 'submit_name', 'input': 'Bench'})
+    return lambda: client.post('/action', json={'action': 'rest'})
+
+CASES = {
+    'combat.handle_combat_action': case_combat_turn,
+    'combat.handle_combat_action[pack]': case_combat_pack_turn,
+    'Character.from_state+get_state': case_character_round_trip,
+    'locations.get_location_data[all]': case_location_data,
+    'items.get_item_details': case_item_details,
+    'Inventory.remove+add[1000 items]': case_inventory_hoard,
+    'progression.xp_for_next_level': case_xp_for_next_level,
+    'end_combat[level-ups]': case_level_up_loop,
+    'actions.perform_action[rest]': case_perform_action,
+    'POST /action[rest]': case_http_action,
+}
+
+
+# --- Simulator check ---
+# (build, policy) pairs: the starting character, and a weak, cautious
+# one with win rates away from 0 and 1 and defend turns in every fight
+SIMULATOR_CHECKS = [
+    (dict(), 'attack'),
+    (dict(health=60, attack=7, defense=3), 'defend_below:30'),
+]
+SIMULATOR_FIGHTS = 2000 # Per enemy for the reference; the vectorized one runs 50x that
+SIMULATOR_SEED = 7
+
+def check_simulator():
+    """Runs the simulator equivalence checks. Returns False on a mismatch."""
+    if simulation.np is None:
+        print("simulator check skipped: needs NumPy\n")
+        return True
+    ok = True
+    for build, policy in SIMULATOR_CHECKS:
+        print(f"simulator check: {build} {policy}")
+        ok = simulation.check_equivalence(simulation.make_build(**build), list(combat.ENEMY_STATS),
+                                          SIMULATOR_FIGHTS, policy, SIMULATOR_SEED) and ok
+    print()
+    return ok
+
+
+# --- Measuring ---
+
+def calibration():
+    """A fixed pure-Python workload used to compare machine speed."""
+    counts = {}
+    for i in range(2000):
+        key = i % 37
+        counts[key] = counts.get(key, 0) + i * 3 // 7
+    return counts
+
+def measure(func, repeat):
+    """Seconds per call: best of `repeat` runs of ~0.1 s each."""
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * 0.1 / max(elapsed, 1e-9)))
+    return min(timer.repeat(repeat, number)) / number
+
+def run_cases(pattern, repeat):
+    """Returns (calibration seconds, {case: seconds per call})."""
+    results = {}
+    calib = measure(calibration, repeat)
+    for name, make in CASES.items():
+        if pattern and pattern not in name:
+            continue
+        results[name] = measure(make(), repeat)
+        # Calibrate between cases too, so a slow spell hits both sides of the ratio
+        calib = min(calib, measure(calibration, repeat))
+    return calib, results
+
+def format_time(seconds):
+    if seconds < 1e-6:
+        return f"{seconds * 1e9:.0f} ns"
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.2f} us"
+    return f"{seconds * 1e3:.2f} ms"
+
+
+# --- Commands ---
+
+def cmd_run(args):
+    calib, results = run_cases(args.k, args.repeat)
+    print(f"{'case':<36} {'per call':>10}")
+    for name, seconds in results.items():
+        print(f"{name:<36} {format_time(seconds):>10}")
+    print(f"{'(calibration)':<36} {format_time(calib):>10}")
+
+def cmd_save(args):
+    # Baselines are the yardstick for every later compare, so take the best of a few passes
+    calib, results = run_cases(args.k, args.repeat)
+    for _ in range(args.passes - 1):
+        more_calib, more = run_cases(args.k, args.repeat)
+        calib = min(calib, more_calib)
+        results = {name: min(seconds, more[name]) for name, seconds in results.items()}
+    baselines = {'cases': {}}
+    if args.k and os.path.exists(BASELINES_PATH): # Only re-record the selected cases
+        with open(BASELINES_PATH) as f:
+            baselines = json.load(f)
+        factor = calib / baselines['calibration']
+        results = {**{n: s * factor for n, s in baselines['cases'].items()}, **results}
+    baselines.update({
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'calibration': calib,
+        'cases': {name: results[name] for name in CASES if name in results},
+    })
+    with open(BASELINES_PATH, 'w') as f:
+        json.dump(baselines, f, indent=2)
+        f.write('\n')
+    print(f"Saved {len(baselines['cases'])} baselines to {os.path.relpath(BASELINES_PATH)}")
+
+def cmd_compare(args):
+    with open(BASELINES_PATH) as f:
+        baselines = json.load(f)
+    simulator_ok = check_simulator()
+    calib, results = run_cases(args.k, args.repeat)
+    # >1 when this machine is slower than the one that recorded the baselines
+    factor = calib / baselines['calibration'] if args.calibrate else 1.0
+    print(f"machine speed factor {factor:.2f}, threshold +{args.threshold:g}%\n")
+    print(f"{'case':<36} {'baseline':>10} {'now':>10} {'change':>8}")
+    regressions = []
+    for name, seconds in results.items():
+        baseline = baselines['cases'].get(name)
+        if baseline is None:
+            print(f"{name:<36} {'-':>10} {format_time(seconds):>10} {'new':>8}")
+            continue
+        expected = baseline * factor
+        # A slow result is measured again before it counts: on a busy machine
+        # one unlucky series is far more likely than a real regression
+        for _ in range(args.retries):
+            if seconds <= expected * (1 + args.threshold / 100):
+                break
+            seconds = min(seconds, measure(CASES[name](), args.repeat))
+        change = (seconds / expected - 1) * 100
+        flag = ''
+        if change > args.threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<36} {format_time(expected):>10} {format_time(seconds):>10} {change:>+7.1f}%{flag}")
+    if regressions:
+        print(f"\n{len(regressions)} case(s) regressed by more than {args.threshold:g}%")
+    if not simulator_ok:
+        print("\nThe vectorized simulator no longer matches the combat code (see the simulator check)")
+    if regressions or not simulator_ok:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Game hot path microbenchmarks.")
+    parser.add_argument('command', choices=['run', 'save', 'compare'], nargs='?', default='run')
+    parser.add_argument('-k', help="Only cases whose name contains this")
+    parser.add_argument('--repeat', type=int, default=7, help="Runs per case (the best one counts)")
+    parser.add_argument('--retries', type=int, default=2, help="Re-measurements of a case that looks regressed (compare)")
+    parser.add_argument('--passes', type=int, default=3, help="Passes over the whole suite (save)")
+    parser.add_argument('--threshold', type=float, default=25.0, help="Allowed slowdown in percent (compare)")
+    parser.add_argument('--no-calibrate', dest='calibrate', action='store_false',
+                        help="Compare raw timings (same machine as the baselines)")
+    args = parser.parse_args()
+    {'run': cmd_run, 'save': cmd_save, 'compare': cmd_compare}[args.command](args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+# Compact binary codec for character state
+#
+# The dict form of a character (Character.get_state()) repeats every key
+# string on every save. This codec packs the same fields into one fixed
+# struct followed by a single UTF-8 text blob:
+#
+#   version:u8  flags:u8  health:i32  max_health:i32  attack:i32  defense:i32
+#   level:u16  xp:u32  xp_to_next_level:u32  stat_points:u16  text_length:u16
+#   text: name US inventory US equipment
+#
+# inventory is item ids joined by RS, each followed by "GS count" when it's
+# more than one (inventory.py's id -> count map, in order), and
+# equipment is "slot GS item_id" pairs joined by RS (US/RS/GS are the ASCII
+# unit/record/group separators). Item ids and slots come from the game data
+# and never contain them. Names are player input: submit_name only accepts
+# printable names, and a player name containing US can't be encoded
+# (CodecError) rather than decoding wrongly.
+# Inventories are decoded to id -> count maps; older data without counts
+# decodes as one of each. Player-only numbers are 0 for enemies.
+# Packing everything with one struct call and one encode keeps the per-turn
+# cost low. decode_character() also accepts today's dict states, so callers
+# can switch over gradually.
+
+import struct
+
+from .inventory import as_counts
+
+VERSION = 1
+
+FLAG_PLAYER = 0x01
+FLAG_DEFENDING = 0x02
+
+US, RS, GS = '\x1f', '\x1e', '\x1d'
+
+_LAYOUT = struct.Struct('<BBiiiiHIIHH')
+
+
+class CodecError(ValueError):
+    """Raised when encoded character data can't be decoded."""
+
+
+def encode_character(state):
+    """Encodes a character state dict (or a Character) into bytes."""
+    if isinstance(state, dict):
+        return _encode(state.get('is_player', False), state.get('is_defending', False),
+                       state['health'], state['max_health'], state['attack'], state['defense'], state['name'],
+                       state.get('level', 1), state.get('xp', 0), state.get('xp_to_next_level', 100),
+                       state.get('stat_points', 0), state.get('inventory', []),
+                       state.get('equipment', {'weapon': 'fists'}))
+    if state.is_player: # Character: read the slots directly, no intermediate dict
+        return _encode(True, state.is_defending, state.health, state.max_health, state.attack, state.defense,
+                       state.name, state.level, state.xp, state.xp_to_next_level, state.stat_points,
+                       state.inventory, state.equipment)
+    return _encode(False, state.is_defending, state.health, state.max_health, state.attack, state.defense,
+                   state.name, 0, 0, 0, 0, None, None)
+
+
+def _encode(is_player, is_defending, health, max_health, attack, defense, name,
+            level, xp, xp_to_next_level, stat_points, inventory, equipment):
+    flags = (FLAG_PLAYER if is_player else 0) | (FLAG_DEFENDING if is_defending else 0)
+    if is_player:
+        if US in name:
+            raise CodecError("Player names can't contain the field separator")
+        text = US.join((
+            name,
+            RS.join(item_id if n == 1 else f"{item_id}{GS}{n}" for item_id, n in as_counts(inventory).items()),
+            RS.join(slot + GS + item_id for slot, item_id in equipment.items()),
+        )).encode('utf-8')
+    else:
+        text = name.encode('utf-8')
+        level = xp = xp_to_next_level = stat_points = 0
+    if len(text) > 0xFFFF:
+        raise CodecError("Character text fields are too long to encode")
+    return _LAYOUT.pack(VERSION, flags, health, max_health, attack, defense,
+                        level, xp, xp_to_next_level, stat_points, len(text)) + text
+
+
+def decode_fields(data):
+    """Decodes bytes from encode_character() into a flat tuple:
+
+    (is_player, is_defending, health, max_health, attack, defense, name, player)
+    where player is (level, xp, xp_to_next_level, stat_points, inventory, equipment)
+    or None for enemies.
+    """
+    try:
+        (version, flags, health, max_health, attack, defense,
+         level, xp, xp_to_next_level, stat_points, length) = _LAYOUT.unpack_from(data, 0)
+        if version != VERSION:
+            raise CodecError(f"Unsupported character codec version {version}")
+        text = data[_LAYOUT.size:_LAYOUT.size + length].decode('utf-8')
+        player = None
+        if flags & FLAG_PLAYER:
+            name, inventory, equipment = text.split(US)
+            player = (
+                level, xp, xp_to_next_level, stat_points,
+                _decode_inventory(inventory) if inventory else {},
+                dict(pair.split(GS) for pair in equipment.split(RS)) if equipment else {},
+            )
+        else:
+            name = text
+        return (bool(flags & FLAG_PLAYER), bool(flags & FLAG_DEFENDING),
+                health, max_health, attack, defense, name, player)
+    except (struct.error, ValueError, UnicodeDecodeError) as e:
+        raise CodecError(f"Corrupt character data: {e}") from e
+
+
+def _decode_inventory(text):
+    counts = {}
+    for entry in text.split(RS):
+        item_id, _, n = entry.partition(GS)
+        counts[item_id] = int(n) if n else 1
+    return counts
+
+
+def decode_character(data):
+    """Decodes bytes from encode_character() into a state dict.
+
+    Dict states (the legacy session format) are returned unchanged.
+    """
+    if isinstance(data, dict):
+        return data
+    is_player, is_defending, health, max_health, attack, defense, name, player = decode_fields(data)
+    state = {
+        'name': name, 'health': health, 'max_health': max_health,
+        'attack': attack, 'defense': defense,
+        'is_player': is_player, 'is_defending': is_defending,
+    }
+    if player:
+        level, xp, xp_to_next_level, stat_points, inventory, equipment = player
+        state.update({
+            'level': level, 'xp': xp, 'xp_to_next_level': xp_to_next_level,
+            'stat_points': stat_points, 'inventory': inventory, 'equipment': equipment,
+        })
+    return state
@@ -1,10 +1,21 @@
+import functools
+import math
 import random
 
-import math
-from . import items # Import the new items module
+from . import codec, items, progression # Import the new items module
+
+try:
+    import numpy as np
+except ImportError: # Needed for multi-enemy encounters (worlds with packs won't load without it)
+    np = None
 
 class Character:
     """Represents a character in the game (player or enemy)."""
+    # Fixed attribute set: no per-instance __dict__, cheaper to create every turn.
+    # Player-only slots stay unset on enemies.
+    __slots__ = ('name', 'max_health', 'health', 'attack', 'defense', 'is_player', 'is_defending',
+                 'level', 'xp', 'xp_to_next_level', 'stat_points', 'inventory', 'equipment')
+
     def __init__(self, name, health, attack, defense, is_player=False, level=1, xp=0, xp_to_next_level=100, stat_points=0, inventory=None, equipment=None):
         self.name = name
         self.max_health = health # Store max health for potential healing later
@@ -20,12 +31,15 @@ class Character:
             self.xp_to_next_level = xp_to_next_level
             self.stat_points = stat_points
             # Initialize inventory and equipment only for player
-            self.inventory = inventory if inventory is not None else []
+            self.inventory = inventory if inventory is not None else {} # item id -> count (see inventory.py)
             self.equipment = equipment if equipment is not None else {'weapon': 'fists'} # Default to fists
 
     def take_damage(self, damage):
         """Applies damage to the character, considering defense."""
-        actual_damage = max(0, damage - self.defense)
+        defense = self.defense
+        if self.is_player:
+            defense += items.equipment_bonus(self.equipment)[1] # Armor
+        actual_damage = max(0, damage - defense)
         self.health -= actual_damage
         return actual_damage # Return damage taken for messaging
 
@@ -33,8 +47,11 @@ class Character:
         """Checks if the character's health is above 0."""
         return self.health > 0
 
-    def attack_target(self, target):
-        """Calculates and applies attack damage to a target."""
+    def attack_target(self, target, rng=random):
+        """Calculates and applies attack damage to a target.
+
+        `rng` supplies the damage roll (a random.Random, e.g. the session's stream).
+        """
         # Reset defense boost if player was defending
         if self.is_player and self.is_defending:
             self.defense -= 2 # Assuming a +2 boost for defense action
@@ -42,10 +59,10 @@ class Character:
 
         # Calculate effective attack including weapon bonus for player
         effective_attack = self.attack
-        if self.is_player and 'weapon' in self.equipment:
-            effective_attack += items.get_weapon_bonus(self.equipment['weapon'])
+        if self.is_player:
+            effective_attack += items.equipment_bonus(self.equipment)[0]
 
-        damage = random.randint(effective_attack - 2, effective_attack + 2)
+        damage = rng.randint(effective_attack - 2, effective_attack + 2)
         damage_taken = target.take_damage(damage)
         message = f"{self.name} attacks {target.name} for {damage} damage!"
         if damage_taken < damage:
@@ -83,9 +100,26 @@ class Character:
             })
         return state # Return the potentially updated state dictionary
 
+    def to_bytes(self):
+        """Returns the compact binary encoding of this character (see codec.py)."""
+        return codec.encode_character(self)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Creates a Character instance from codec bytes, without an intermediate dict."""
+        char = cls.__new__(cls)
+        (char.is_player, char.is_defending, char.health, char.max_health,
+         char.attack, char.defense, char.name, player) = codec.decode_fields(data)
+        if player:
+            (char.level, char.xp, char.xp_to_next_level, char.stat_points,
+             char.inventory, char.equipment) = player
+        return char
+
     @classmethod
     def from_state(cls, state):
-        """Creates a Character instance from a state dictionary."""
+        """Creates a Character instance from a state dictionary (or codec bytes)."""
+        if not isinstance(state, dict):
+            return cls.from_bytes(state)
         is_player = state.get('is_player', False)
         # Provide default values for new stats if they don't exist in the state (for backward compatibility)
         char = cls(
@@ -99,7 +133,7 @@ class Character:
             xp_to_next_level=state.get('xp_to_next_level', 100) if is_player else 100,
             stat_points=state.get('stat_points', 0) if is_player else 0,
             # Load inventory/equipment, providing defaults if missing
-            inventory=state.get('inventory', []) if is_player else None,
+            inventory=state.get('inventory', {}) if is_player else None,
             equipment=state.get('equipment', {'weapon': 'fists'}) if is_player else None
         )
         char.health = state['health']
@@ -116,12 +150,31 @@ ENEMY_STATS = {
     "Slime":         {"health": 30, "attack": 5,  "defense": 1, "xp_reward": 5,  "level": 1}, # Default/Fallback
 }
 
+def xp_reward_for(enemy_name, player_level):
+    """Returns (final_xp, base_xp) for defeating an enemy at the player's level."""
+    enemy_stats = ENEMY_STATS.get(enemy_name)
+    if not enemy_stats:
+        return 0, 0
+    base_xp_reward = enemy_stats.get('xp_reward', 0)
+    # Reduced if the player out-levels the enemy
+    return progression.reduced_xp(base_xp_reward, enemy_stats.get('level', 1), player_level), base_xp_reward
+
 # --- Combat Management Functions ---
 
-def start_combat(player_state, enemy_type='Slime'):
-    """Initializes combat state with a specific enemy type."""
+def start_combat(player_state, enemy_type='Slime', count=1):
+    """Initializes combat state with a specific enemy type.
+
+    `count` > 1 (or a list of enemy types) starts a multi-enemy encounter.
+    """
     player = Character.from_state(player_state) # Recreate player object from state
 
+    enemy_types = list(enemy_type) if isinstance(enemy_type, (list, tuple)) else [enemy_type] * count
+    if len(enemy_types) > 1:
+        if np is None: # The world refuses to load packs without NumPy, so this is a direct call
+            raise RuntimeError("Multi-enemy encounters need NumPy (pip install numpy)")
+        return start_pack_combat(player, enemy_types)
+    enemy_type = enemy_types[0]
+
     # Get stats for the requested enemy type, defaulting to Slime if unknown
     stats = ENEMY_STATS.get(enemy_type, ENEMY_STATS['Slime'])
     enemy = Character(enemy_type, stats['health'], stats['attack'], stats['defense'])
@@ -135,54 +188,64 @@ def start_combat(player_state, enemy_type='Slime'):
     }
     return combat_state
 
-def handle_combat_action(combat_state, action):
-    """Processes a player action during combat."""
-    player = Character.from_state(combat_state['player'])
-    enemy = Character.from_state(combat_state['enemy'])
-    messages = []
+def play_turn(player, enemy, action, rng=random):
+    """Plays one exchange between two Character objects, rolling damage from `rng`.
 
-    if combat_state['is_over']:
-        messages.append("Combat is already over.")
-        return combat_state # No changes if combat finished
+    Returns (messages, victory) where victory is None while the fight goes on.
+    """
+    messages = []
 
     # Player action
     if action == 'attack':
-        messages.append(player.attack_target(enemy))
-    elif action == 'defend':
-        messages.append(player.defend())
+        messages.append(player.attack_target(enemy, rng))
     else:
-        messages.append("Invalid action!")
-        # Don't proceed to enemy turn if player action was invalid
-        combat_state['player'] = player.get_state() # Update state even on invalid action
-        combat_state['turn_message'] = "\n".join(messages)
-        return combat_state
+        messages.append(player.defend())
 
     # Check if enemy defeated
     if not enemy.is_alive():
         messages.append(f"You defeated {enemy.name}!")
-        combat_state['is_over'] = True
-        combat_state['victory'] = True
-        combat_state['player'] = player.get_state() # Store final player state
-        combat_state['enemy'] = enemy.get_state()   # Store final enemy state
-        combat_state['turn_message'] = "\n".join(messages)
-        return combat_state
+        return messages, True
 
     # Enemy action (simple AI: always attacks)
-    messages.append(enemy.attack_target(player))
+    messages.append(enemy.attack_target(player, rng))
 
     # Check if player defeated
     if not player.is_alive():
         messages.append(f"You were defeated by {enemy.name}!")
-        combat_state['is_over'] = True
-        combat_state['victory'] = False
-        # Player state is already updated by enemy attack
-    else:
-         # Reset player defense boost if they defended last turn but didn't attack this turn
-         # (attack_target already handles this if they attacked)
-        if player.is_defending and action != 'attack':
-             player.defense -= 2
-             player.is_defending = False
+        return messages, False
+
+    # Reset player defense boost if they defended last turn but didn't attack this turn
+    # (attack_target already handles this if they attacked)
+    if player.is_defending and action != 'attack':
+        player.defense -= 2
+        player.is_defending = False
+    return messages, None
 
+def handle_combat_action(combat_state, action, target=None, rng=None):
+    """Processes a player action during combat.
+
+    `target` picks which enemy to attack in a multi-enemy encounter. Rolls
+    come from `rng` (a random.Random), or the global random module if None.
+    """
+    rng = rng or random
+    if 'enemies' in combat_state:
+        return handle_pack_action(combat_state, action, target, rng)
+    player = Character.from_state(combat_state['player'])
+    enemy = Character.from_state(combat_state['enemy'])
+
+    if combat_state['is_over']:
+        return combat_state # No changes if combat finished
+
+    if action not in ('attack', 'defend'):
+        # Don't proceed to enemy turn if player action was invalid
+        combat_state['player'] = player.get_state() # Update state even on invalid action
+        combat_state['turn_message'] = "Invalid action!"
+        return combat_state
+
+    messages, victory = play_turn(player, enemy, action, rng)
+    if victory is not None:
+        combat_state['is_over'] = True
+        combat_state['victory'] = victory # True for player win, False for player loss
 
     # Update state
     combat_state['player'] = player.get_state()
@@ -191,14 +254,411 @@ def handle_combat_action(combat_state, action):
 
     return combat_state
 
+# --- Multi-enemy encounters ---
+# A pack's combat_state keeps the single-enemy keys ('enemy' mirrors the
+# current target) and adds 'enemies' (one state per enemy) and 'target'.
+# During a turn the enemies live in an EnemySide: one array per stat, so the
+# whole side attacks and is checked for deaths in a single batched pass no
+# matter how many enemies there are.
+
+PACK_TARGET_BUTTONS = 6 # Above this many living enemies, offer a single "Attack" option
+
+class EnemySide:
+    """A group of enemies stored as a structure of arrays."""
+    __slots__ = ('names', 'health', 'max_health', 'attack', 'defense')
+
+    def __init__(self, names, health, max_health, attack, defense):
+        self.names = names # Plain list: names are only needed for messages
+        self.health = np.array(health, dtype=np.int64)
+        self.max_health = np.array(max_health, dtype=np.int64)
+        self.attack = np.array(attack, dtype=np.int64)
+        self.defense = np.array(defense, dtype=np.int64)
+
+    @classmethod
+    def spawn(cls, enemy_types):
+        """Creates a fresh side from enemy type names."""
+        stats = [ENEMY_STATS.get(name, ENEMY_STATS['Slime']) for name in enemy_types]
+        health = [s['health'] for s in stats]
+        return cls(list(enemy_types), health, health, [s['attack'] for s in stats], [s['defense'] for s in stats])
+
+    @classmethod
+    def from_states(cls, states):
+        """Creates a side from a list of enemy state dicts."""
+        return cls([s['name'] for s in states], [s['health'] for s in states], [s['max_health'] for s in states],
+                   [s['attack'] for s in states], [s['defense'] for s in states])
+
+    def to_states(self):
+        """Returns the enemies as a list of state dicts (the combat_state format)."""
+        return [
+            {'name': name, 'health': health, 'max_health': max_health, 'attack': attack,
+             'defense': defense, 'is_player': False, 'is_defending': False}
+            for name, health, max_health, attack, defense in zip(
+                self.names, self.health.tolist(), self.max_health.tolist(),
+                self.attack.tolist(), self.defense.tolist())
+        ]
+
+    def alive(self):
+        """Boolean array: which enemies are still standing."""
+        return self.health > 0
+
+    def character(self, index):
+        """Returns one enemy as a Character (for the player's single attack)."""
+        enemy = Character(self.names[index], int(self.max_health[index]), int(self.attack[index]), int(self.defense[index]))
+        enemy.health = int(self.health[index])
+        return enemy
+
+    def strike(self, target_defense, rng):
+        """Every living enemy attacks at once. Returns each enemy's damage after defense."""
+        rolls = rng.integers(self.attack - 2, self.attack + 3) # Same spread as Character.attack_target
+        return np.where(self.health > 0, np.maximum(0, rolls - target_defense), 0)
+
+def _pack_rng(rng=random):
+    """NumPy generator seeded from `rng`, so the session's stream still reproduces fights."""
+    return np.random.default_rng(rng.getrandbits(64))
+
+def _first_alive(side):
+    return int(np.flatnonzero(side.alive())[0])
+
+def start_pack_combat(player, enemy_types):
+    """Initializes combat state for a multi-enemy encounter."""
+    side = EnemySide.spawn(enemy_types)
+    enemies = side.to_states()
+    description = describe_enemies(enemy_types)
+    return {
+        'player': player.get_state(),
+        'enemy': enemies[0],
+        'enemies': enemies,
+        'target': 0,
+        'turn_message': f"{description[0].upper()}{description[1:]} appear!",
+        'is_over': False,
+        'victory': None
+    }
+
+def play_pack_turn(player, side, action, target, np_rng, rng=random):
+    """Plays one exchange between the player and a whole EnemySide.
+
+    The enemies' rolls come from `np_rng` (a NumPy Generator), the player's from `rng`.
+    Returns (messages, victory, target) where victory is None while the fight goes on.
+    """
+    messages = []
+    alive = side.alive()
+    # type(), not isinstance(): True/False would index the NumPy array as a mask
+    if type(target) is not int or not (0 <= target < len(side.names)) or not alive[target]:
+        target = _first_alive(side)
+
+    # Player action: one attack against the chosen target
+    if action == 'attack':
+        enemy = side.character(target)
+        messages.append(player.attack_target(enemy, rng))
+        side.health[target] = enemy.health
+        if not enemy.is_alive():
+            messages.append(f"You defeated {enemy.name}!")
+    else:
+        messages.append(player.defend())
+
+    alive = side.alive()
+    if not alive.any():
+        return messages, True, target
+    if not alive[target]:
+        target = _first_alive(side)
+
+    # Enemy action: the whole side attacks in one batched pass
+    damage = side.strike(player.defense + items.equipment_bonus(player.equipment)[1], np_rng)
+    total = int(damage.sum())
+    player.health -= total
+    attackers = int(alive.sum())
+    if attackers <= 3:
+        for index in np.flatnonzero(alive).tolist():
+            messages.append(f"{side.names[index]} attacks {player.name} for {int(damage[index])} damage!")
+    else:
+        messages.append(f"{attackers} enemies attack {player.name} for a total of {total} damage!")
+
+    if not player.is_alive():
+        messages.append("You were overwhelmed!")
+        return messages, False, target
+
+    if player.is_defending and action != 'attack':
+        player.defense -= 2
+        player.is_defending = False
+    return messages, None, target
+
+def _store_pack(combat_state, player, side, target):
+    enemies = side.to_states()
+    combat_state['player'] = player.get_state()
+    combat_state['enemies'] = enemies
+    combat_state['target'] = target
+    combat_state['enemy'] = enemies[target]
+
+def handle_pack_action(combat_state, action, target=None, rng=random):
+    """Processes a player action during a multi-enemy encounter."""
+    if combat_state['is_over']:
+        return combat_state
+    if action not in ('attack', 'defend'):
+        combat_state['turn_message'] = "Invalid action!"
+        return combat_state
+
+    player = Character.from_state(combat_state['player'])
+    side = EnemySide.from_states(combat_state['enemies'])
+    if target is None:
+        target = combat_state.get('target')
+    messages, victory, target = play_pack_turn(player, side, action, target, _pack_rng(rng), rng)
+    if victory is not None:
+        combat_state['is_over'] = True
+        combat_state['victory'] = victory
+
+    _store_pack(combat_state, player, side, target)
+    combat_state['turn_message'] = "\n".join(messages)
+    return combat_state
+
+def combat_enemies(combat_state):
+    """Returns the list of enemy states in an encounter (one for a single enemy)."""
+    return combat_state.get('enemies') or [combat_state.get('enemy') or {}]
+
+def describe_enemies(enemy_names):
+    """Describes a group of enemies, e.g. '2 Goblins and a Cave Bat'."""
+    counts = {}
+    for name in enemy_names:
+        counts[name] = counts.get(name, 0) + 1
+    parts = [f"{n} {name}s" if n > 1 else f"a {name}" for name, n in counts.items()]
+    return parts[0] if len(parts) == 1 else ", ".join(parts[:-1]) + " and " + parts[-1]
+
+def xp_reward_for_combat(combat_state, player_level):
+    """Returns (final_xp, base_xp) summed over every enemy in an encounter."""
+    final_total = base_total = 0
+    for enemy in combat_enemies(combat_state):
+        final_xp, base_xp = xp_reward_for(enemy.get('name'), player_level)
+        final_total += final_xp
+        base_total += base_xp
+    return final_total, base_total
+
+# --- Auto-battle ---
+# Resolves the rest of an encounter server-side in one request, following a
+# simple policy, instead of one POST /action per turn.
+
+AUTO_BATTLE_MAX_TURNS = 200 # Stalemates (nobody can do damage) hand control back to the player
+AUTO_BATTLE_POLICIES = {
+    'attack': 'Auto-battle',
+    'defend_below:30': 'Auto-battle (cautious)',
+}
+
+def parse_policy(policy):
+    """Parses a policy name into a defend threshold (fraction of max health).
+
+    'attack' always attacks; 'defend_below:30' defends while health is below 30%.
+    """
+    if policy == 'attack':
+        return 0.0
+    if isinstance(policy, str) and policy.startswith('defend_below:'):
+        try:
+            return float(policy.split(':', 1)[1]) / 100
+        except ValueError:
+            pass
+    raise ValueError(f"Unknown combat policy '{policy}'")
+
+def choose_action(health, max_health, defend_below):
+    """Returns the action ('attack' or 'defend') a policy picks for this turn."""
+    return 'defend' if health < defend_below * max_health else 'attack'
+
+def auto_resolve(combat_state, policy='attack', max_turns=AUTO_BATTLE_MAX_TURNS, rng=None):
+    """Fights the rest of an encounter following `policy`.
+
+    Adds a compact 'turn_log' to combat_state: one [action, damage dealt,
+    damage taken] entry per turn, with action 'a' (attack) or 'd' (defend).
+    Rolls come from `rng` (a random.Random), or the global random module if None.
+    """
+    if combat_state['is_over']:
+        return combat_state
+    defend_below = parse_policy(policy)
+    rng = rng or random
+    player = Character.from_state(combat_state['player'])
+    pack = 'enemies' in combat_state
+    if pack:
+        side = EnemySide.from_states(combat_state['enemies'])
+        target = combat_state.get('target')
+        np_rng = _pack_rng(rng)
+        enemy_health = lambda: int(side.health.clip(min=0).sum())
+    else:
+        enemy = Character.from_state(combat_state['enemy'])
+        enemy_health = lambda: enemy.health
+
+    turn_log = []
+    messages, victory = [], None
+    while victory is None and len(turn_log) < max_turns:
+        action = choose_action(player.health, player.max_health, defend_below)
+        health_before, enemy_before = player.health, enemy_health()
+        if pack:
+            messages, victory, target = play_pack_turn(player, side, action, target, np_rng, rng)
+        else:
+            messages, victory = play_turn(player, enemy, action, rng)
+        turn_log.append([action[0], enemy_before - enemy_health(), health_before - player.health])
+
+    dealt = sum(entry[1] for entry in turn_log)
+    taken = sum(entry[2] for entry in turn_log)
+    summary = f"Auto-battle: {len(turn_log)} turns. You dealt {dealt} damage and took {taken}."
+    if victory is None:
+        messages = ["Neither of you can gain the upper hand. You take back control of the fight."]
+    else:
+        combat_state['is_over'] = True
+        combat_state['victory'] = victory
+
+    if pack:
+        _store_pack(combat_state, player, side, target)
+    else:
+        combat_state['player'] = player.get_state()
+        combat_state['enemy'] = enemy.get_state()
+    combat_state['turn_log'] = turn_log
+    combat_state['turn_message'] = summary + "\n" + messages[-1]
+    return combat_state
+
+ODDS_MAX_ROWS = 300 # Most player health values tabulated per table; builds needing more show no odds
+ODDS_CACHE_SIZE = 32 # Tables kept (each at most ODDS_MAX_ROWS x enemy health floats)
+
+def _hit_chances(margin):
+    """Damage -> chance for one roll of attack-2..attack+2 (margin = attack - defense)."""
+    chances = {}
+    for roll in range(-2, 3):
+        damage = max(0, margin + roll)
+        chances[damage] = chances.get(damage, 0.0) + 0.2
+    return chances
+
+def _add_shifted(row, start, weight, source):
+    """row[start:] += weight * source[1:] (as far as row goes)."""
+    if np is not None:
+        row[start:] += weight * source[1:len(row) - start + 1]
+    else:
+        for index in range(start, len(row)):
+            row[index] += weight * source[index - start + 1]
+
+@functools.lru_cache(maxsize=ODDS_CACHE_SIZE)
+def _odds_rows(first_row, last_row, attack_margin, enemy_margin, enemy_max):
+    """Rows first_row..last_row of an odds table, the player attacking in all of them."""
+    player_hits = _hit_chances(attack_margin)
+    enemy_hits = _hit_chances(enemy_margin)
+    new_row = (lambda: np.zeros(enemy_max + 1)) if np is not None else (lambda: [0.0] * (enemy_max + 1))
+    rows = []
+    for player_health in range(first_row, last_row + 1):
+        row = new_row()
+        stay = 0.0 # Chance that nobody takes damage this turn
+        same_row = {} # Damage dealt -> chance, for hits the player answers without losing health
+        for dealt, dealt_chance in player_hits.items():
+            for enemy_health in range(1, min(dealt, enemy_max) + 1):
+                row[enemy_health] += dealt_chance # Enemy dies before it can strike back
+            for taken, taken_chance in enemy_hits.items():
+                chance = dealt_chance * taken_chance
+                if taken == 0:
+                    if dealt == 0:
+                        stay += chance
+                    else:
+                        same_row[dealt] = same_row.get(dealt, 0.0) + chance
+                elif player_health - taken >= first_row and dealt < enemy_max: # Lower rows win nothing
+                    _add_shifted(row, dealt + 1, chance, rows[player_health - taken - first_row])
+        if stay >= 1:
+            row = new_row() # Stalemates never end in a win
+        elif same_row: # Depends on this row's lower enemy health values: fill in order
+            for enemy_health in range(1, enemy_max + 1):
+                win = row[enemy_health]
+                for dealt, chance in same_row.items():
+                    if enemy_health > dealt:
+                        win += chance * row[enemy_health - dealt]
+                row[enemy_health] = win / (1 - stay)
+        elif stay:
+            row = row / (1 - stay) if np is not None else [win / (1 - stay) for win in row]
+        rows.append(row)
+    return tuple(rows)
+
+def odds_table(max_health, attack, defense, enemy_name, policy='attack'):
+    """Exact win chance for every (player health, enemy health) position (memoized).
+
+    A fight is a Markov chain over the two health values: each turn the
+    damage rolls are uniform over attack-2..attack+2. Positions only lead to
+    positions with less (or equal) health, so one pass from low to high
+    health fills the table, a row (one player health) at a time. `attack`
+    already includes the weapon bonus.
+
+    Only the rows that need work are tabulated. Below the policy's defend
+    threshold the player never deals damage again, so never wins. High
+    enough above it, the player keeps attacking until the enemy is surely
+    dead, so always wins. In between, the odds depend only on the damage
+    margins and the enemy's health, so builds that differ elsewhere (more
+    max health, a level-up the enemy can't tell) share a table.
+
+    Returns (first_row, rows): rows[i][enemy_health] is the chance for
+    player health first_row + i; above the last row it's 1. None if that
+    would take more than ODDS_MAX_ROWS rows (very long fights).
+    """
+    stats = ENEMY_STATS.get(enemy_name, ENEMY_STATS['Slime'])
+    # Margins below -2 all mean "every hit does 0"
+    attack_margin = max(attack - stats['defense'], -3)
+    enemy_margin = max(stats['attack'] - defense, -3)
+    first_row = max(1, math.ceil(parse_policy(policy) * max_health)) # Lowest health the policy attacks at
+    min_dealt = max(0, attack_margin - 2)
+    if min_dealt:
+        # The enemy is dead within `turns` turns and strikes back at most turns - 1 times
+        turns = -(-stats['health'] // min_dealt)
+        last_row = min(max_health, first_row + (turns - 1) * max(0, enemy_margin + 2) - 1)
+    else:
+        last_row = max_health
+    if last_row - first_row + 1 > ODDS_MAX_ROWS:
+        return None
+    return first_row, _odds_rows(first_row, last_row, attack_margin, enemy_margin, stats['health'])
+
+def win_odds(health, max_health, attack, defense, enemy_name, enemy_health, policy='attack'):
+    """Chance to win from this position with a policy (None if it isn't tabulated)."""
+    if health <= 0 or enemy_health <= 0:
+        return 1.0 if enemy_health <= 0 else 0.0
+    table = odds_table(max_health, attack, defense, enemy_name, policy)
+    if table is None:
+        return None
+    first_row, rows = table
+    index = min(health, max_health) - first_row
+    if index < 0:
+        return 0.0
+    if index >= len(rows):
+        return 1.0
+    return float(rows[index][min(enemy_health, len(rows[index]) - 1)])
+
+def odds_for(combat_state, policy='attack'):
+    """Returns the win chance of auto-battling the current combat (None if it isn't tabulated)."""
+    player, enemy = combat_state['player'], combat_state['enemy']
+    attack_bonus, defense_bonus = items.equipment_bonus(player.get('equipment', {}))
+    attack = player['attack'] + attack_bonus
+    # The defend boost only lasts for the current turn, so use base defense
+    defense = player['defense'] + defense_bonus - (2 if player.get('is_defending') else 0)
+    return win_odds(player['health'], player['max_health'], attack, defense,
+                    enemy['name'], enemy['health'], policy)
+
 def get_combat_options(combat_state):
     """Returns available actions for the player in combat."""
     if combat_state['is_over']:
         # Options after combat ends (e.g., return to previous location)
         return [{'action': 'end_combat', 'text': 'Continue'}]
     else:
-        return [
+        if 'enemies' in combat_state:
+            return get_pack_options(combat_state)
+        options = [
             {'action': 'combat_attack', 'text': 'Attack'},
             {'action': 'combat_defend', 'text': 'Defend'}
             # Add other combat actions like 'use_item', 'flee' later
         ]
+        # Auto-battle options show the (memoized) odds of winning with that policy
+        for policy, text in AUTO_BATTLE_POLICIES.items():
+            odds = odds_for(combat_state, policy)
+            if odds is not None:
+                text = f"{text} - {odds:.0%} to win"
+            options.append({'action': 'combat_auto', 'policy': policy, 'text': text})
+        return options
+
+def get_pack_options(combat_state):
+    """Returns combat actions for a multi-enemy encounter, with one attack per target."""
+    alive = [(index, enemy) for index, enemy in enumerate(combat_state['enemies']) if enemy['health'] > 0]
+    if len(alive) <= PACK_TARGET_BUTTONS:
+        options = [{'action': 'combat_attack', 'target': index,
+                    'text': f"Attack {enemy['name']} #{index + 1} ({enemy['health']} HP)"}
+                   for index, enemy in alive]
+    else:
+        options = [{'action': 'combat_attack', 'text': f"Attack ({len(alive)} enemies left)"}]
+    options.append({'action': 'combat_defend', 'text': 'Defend'})
+    # Odds are only tabulated for one-on-one fights
+    for policy, text in AUTO_BATTLE_POLICIES.items():
+        options.append({'action': 'combat_auto', 'policy': policy, 'text': text})
+    return options
@@ -0,0 +1,78 @@
+# Weighted encounter tables
+#
+# Each zone has an encounter rate and a weighted mix of enemies (optionally
+# in packs). The weights are compiled once into an alias table (Vose's
+# method), so drawing an encounter is O(1) however many entries a zone has,
+# and drawing millions at once for simulations is a couple of NumPy calls.
+
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError: # Needed for batch sampling, and by combat for packs (see world.World)
+    np = None
+
+EncounterEntry = namedtuple('EncounterEntry', ['enemy', 'weight', 'min_count', 'max_count'])
+
+
+def build_alias(weights):
+    """Builds (probabilities, aliases) lists for O(1) weighted sampling."""
+    n = len(weights)
+    total = float(sum(weights))
+    if n == 0 or total <= 0:
+        raise ValueError("An alias table needs at least one positive weight")
+    scaled = [w * n / total for w in weights]
+    prob = [0.0] * n
+    alias = [0] * n
+    small = [i for i, p in enumerate(scaled) if p < 1.0]
+    large = [i for i, p in enumerate(scaled) if p >= 1.0]
+    while small and large:
+        s, l = small.pop(), large.pop()
+        prob[s] = scaled[s]
+        alias[s] = l
+        scaled[l] -= 1.0 - scaled[s]
+        (small if scaled[l] < 1.0 else large).append(l)
+    for i in small + large: # Leftovers are 1.0 up to rounding error
+        prob[i] = 1.0
+        alias[i] = i
+    return prob, alias
+
+
+class EncounterTable:
+    """A zone's compiled encounter table."""
+    __slots__ = ('rate', 'entries', 'prob', 'alias')
+
+    def __init__(self, rate, entries, prob, alias):
+        self.rate = rate # Percent chance of an encounter when entering the zone
+        self.entries = tuple(EncounterEntry(*entry) for entry in entries)
+        self.prob = tuple(prob)
+        self.alias = tuple(alias)
+
+    def pick(self, rng):
+        """Draws one entry index from the weighted table in O(1)."""
+        i = int(rng.random() * len(self.entries))
+        return i if rng.random() < self.prob[i] else self.alias[i]
+
+    def roll(self, rng):
+        """Rolls for an encounter. Returns the list of enemy names to fight, or None."""
+        if rng.randint(1, 100) > self.rate:
+            return None
+        entry = self.entries[self.pick(rng)]
+        return [entry.enemy] * rng.randint(entry.min_count, entry.max_count)
+
+    def sample_many(self, n, np_rng):
+        """Rolls n encounters at once. Returns (triggered, entry_index, count) arrays."""
+        if np is None:
+            raise RuntimeError("Batch sampling needs NumPy (pip install numpy)")
+        triggered = np_rng.integers(1, 101, size=n) <= self.rate
+        columns = np_rng.integers(0, len(self.entries), size=n)
+        keep = np_rng.random(n) < np.asarray(self.prob)[columns]
+        index = np.where(keep, columns, np.asarray(self.alias)[columns])
+        low = np.asarray([e.min_count for e in self.entries])[index]
+        high = np.asarray([e.max_count for e in self.entries])[index]
+        count = np_rng.integers(low, high + 1)
+        return triggered, index, count
+
+    def enemy_names(self):
+        """Enemy names in entry order (to map sample_many indices back to names)."""
+        return [entry.enemy for entry in self.entries]
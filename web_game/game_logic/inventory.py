@@ -0,0 +1,140 @@
+# Player inventories
+#
+# An inventory is an item id -> count map. While a request runs it's a Counts
+# (a dict) under player_stats['inventory'], and Inventory wraps that map in
+# place, so contains/add/remove are single dict operations with no load or
+# save step. Counts also carries the total weight of its items, which add
+# and remove keep up to date, so checking the capacity doesn't touch the
+# other items either.
+#
+# Each item stacks up to its catalog 'max_stack' (default 1: one of each
+# weapon or armor piece), and the inventory holds at most CAPACITY weight
+# (catalog 'weight', default 1 per item). Equipped items don't count.
+#
+# Sessions store the compact form instead (pack()/unpack(), called by
+# state_schema.to_stored/from_stored): parallel id and count arrays plus
+# the weight, {"ids": [...], "counts": [...], "weight": n}.
+#
+# Older states store a plain id -> count map, or a list of item ids (one
+# entry per item). Inventory.of() converts those in place the first time
+# they're touched (the only time the weight is summed), and everything that
+# only reads an inventory (`item_id in inventory`) works on all of them.
+
+from . import items
+
+CAPACITY = 1000 # Total weight a player can carry
+
+
+def from_list(item_ids):
+    """Converts a legacy list of item ids to an id -> count map."""
+    counts = {}
+    for item_id in item_ids:
+        counts[item_id] = counts.get(item_id, 0) + 1
+    return counts
+
+
+def as_counts(value):
+    """An id -> count map for any inventory form (map, packed, legacy list or None)."""
+    if is_packed(value):
+        return unpack(value)
+    if isinstance(value, dict):
+        return value
+    return from_list(value or [])
+
+
+def _item_info(item_id):
+    item = items.get_item_details(item_id) or {}
+    return item.get('max_stack', 1), item.get('weight', 1)
+
+
+class Counts(dict):
+    """An id -> count map that also keeps the total weight of its items."""
+    __slots__ = ('weight',)
+
+    def __init__(self, counts=(), weight=None):
+        super().__init__(counts)
+        if weight is None:
+            weight = sum(_item_info(item_id)[1] * n for item_id, n in self.items())
+        self.weight = weight
+
+    def __reduce__(self):
+        # Lets copy/deepcopy/pickle keep the weight
+        return (Counts, (dict(self), self.weight))
+
+
+# --- Stored form ---
+
+def is_packed(value):
+    return isinstance(value, dict) and isinstance(value.get('ids'), list) # A count is never a list
+
+def pack(value):
+    """The stored form of an inventory: parallel id/count arrays and the weight."""
+    if not isinstance(value, Counts):
+        value = Counts(as_counts(value))
+    return {'ids': list(value), 'counts': list(value.values()), 'weight': value.weight}
+
+def unpack(packed):
+    """The Counts for a stored inventory."""
+    return Counts(zip(packed['ids'], packed['counts']), packed['weight'])
+
+
+class Inventory:
+    """An id -> count map with stacking limits and a weight capacity."""
+    __slots__ = ('counts', 'capacity')
+
+    def __init__(self, counts=None, capacity=CAPACITY):
+        # A Counts is shared, not copied; anything else is converted first
+        self.counts = counts if isinstance(counts, Counts) else Counts(as_counts(counts))
+        self.capacity = capacity # None for no limit
+
+    @classmethod
+    def of(cls, player_stats, capacity=CAPACITY):
+        """The inventory stored in player_stats, converting other forms in place."""
+        value = player_stats.get('inventory')
+        if not isinstance(value, Counts):
+            value = player_stats['inventory'] = Counts(as_counts(value))
+        return cls(value, capacity)
+
+    def __contains__(self, item_id):
+        return item_id in self.counts
+
+    def __len__(self):
+        return len(self.counts) # Distinct items
+
+    def __iter__(self):
+        return iter(self.counts)
+
+    def count(self, item_id):
+        return self.counts.get(item_id, 0)
+
+    @property
+    def weight(self):
+        return self.counts.weight
+
+    def room_for(self, item_id):
+        """How many more of an item fit (stack limit and capacity)."""
+        max_stack, weight = _item_info(item_id)
+        room = max_stack - self.counts.get(item_id, 0)
+        if self.capacity is not None and weight > 0:
+            room = min(room, (self.capacity - self.counts.weight) // weight)
+        return max(0, room)
+
+    def add(self, item_id, count=1):
+        """Adds up to `count` of an item. Returns how many were added (0 if none fit)."""
+        added = min(count, self.room_for(item_id))
+        if added > 0:
+            self.counts[item_id] = self.counts.get(item_id, 0) + added
+            self.counts.weight += added * _item_info(item_id)[1]
+        return added
+
+    def remove(self, item_id, count=1):
+        """Removes `count` of an item. Returns False (and changes nothing) if there aren't that many."""
+        have = self.counts.get(item_id, 0)
+        if have < count or count <= 0:
+            return False
+        if have == count:
+            del self.counts[item_id]
+        else:
+            self.counts[item_id] = have - count
+        self.counts.weight -= count * _item_info(item_id)[1]
+        return True
@@ -1,4 +1,19 @@
 # Defines items in the game
+#
+# Items are written per category below and compiled at import into ITEMS,
+# one id-indexed table of read-only entries that also carry their id and
+# category. Equipment bonuses are precomputed for every possible equipment
+# set (one item or nothing per slot), so combat looks up a player's total
+# attack/defense bonus with a single dict get.
+#
+# The whole table is also published as a catalog (CATALOG_JSON), named by a
+# hash of its content (CATALOG_VERSION), for the web client's /items
+# endpoint: clients download it once per version and cache it.
+
+import hashlib
+import itertools
+import json
+from types import MappingProxyType
 
 # Using item IDs as keys for easy lookup
 WEAPONS = {
@@ -20,18 +35,85 @@ WEAPONS = {
     # }
 }
 
-# Could add ARMOR, CONSUMABLES etc. dictionaries here later
+# Not placed in the world yet
+ARMOR = {
+    'leather_armor': {
+        'name': 'Leather Armor',
+        'defense_bonus': 2,
+        'description': 'Stiff, scuffed, better than nothing.'
+    },
+}
+
+CONSUMABLES = {
+    'health_potion': {
+        'name': 'Health Potion',
+        'heal': 30,
+        'max_stack': 10, # How many fit in one inventory slot
+        'description': 'A small red vial that smells of cinnamon.'
+    },
+}
+
+CATEGORIES = {'weapon': WEAPONS, 'armor': ARMOR, 'consumable': CONSUMABLES}
+
+# Equipment slot -> the category of item it holds
+SLOTS = {'weapon': 'weapon', 'armor': 'armor'}
+
+
+def build_items(categories=CATEGORIES):
+    """Compiles the category dicts into one id -> read-only entry table."""
+    table = {}
+    for category, entries in categories.items():
+        for item_id, item in entries.items():
+            if item_id in table:
+                raise ValueError(f"Item id '{item_id}' is used by both {table[item_id]['category']} and {category}")
+            table[item_id] = MappingProxyType({'id': item_id, 'category': category, **item})
+    return MappingProxyType(table)
+
+ITEMS = build_items()
+
+
+def _item_bonus(item_id):
+    item = ITEMS.get(item_id)
+    if item is None:
+        return 0, 0
+    return item.get('attack_bonus', 0), item.get('defense_bonus', 0)
+
+def _bonus_table():
+    """(item id or None per slot, in SLOTS order) -> (attack bonus, defense bonus)."""
+    choices = [[None] + [i for i, item in ITEMS.items() if item['category'] == category]
+               for category in SLOTS.values()]
+    table = {}
+    for equipped in itertools.product(*choices):
+        bonuses = [_item_bonus(item_id) for item_id in equipped]
+        table[equipped] = (sum(b[0] for b in bonuses), sum(b[1] for b in bonuses))
+    return table
+
+_EQUIPMENT_BONUSES = _bonus_table()
+_SLOT_NAMES = tuple(SLOTS)
+
 
 def get_item_details(item_id):
     """Returns the details for a given item ID, checking all item types."""
-    if item_id in WEAPONS:
-        return WEAPONS[item_id]
-    # Add checks for other item types (ARMOR etc.) here if they exist
-    return None # Item not found
+    return ITEMS.get(item_id) # None if not found
 
 def get_weapon_bonus(weapon_id):
     """Safely gets the attack bonus for a weapon ID."""
-    weapon = WEAPONS.get(weapon_id)
-    if weapon:
-        return weapon.get('attack_bonus', 0)
-    return 0 # Default to 0 if weapon not found or has no bonus
+    return _item_bonus(weapon_id)[0] # Default to 0 if weapon not found or has no bonus
+
+def equipment_bonus(equipment):
+    """Total (attack bonus, defense bonus) of an equipment dict like {'weapon': 'rusty_sword'}."""
+    key = tuple(map(equipment.get, _SLOT_NAMES)) # Same order as the table's keys
+    bonus = _EQUIPMENT_BONUSES.get(key)
+    if bonus is None: # An unknown id (e.g. an item removed since the save)
+        bonus = tuple(map(sum, zip(*(_item_bonus(item_id) for item_id in key))))
+    return bonus
+
+
+# --- Catalog ---
+
+def build_catalog():
+    """The client-facing catalog: every item, by id, plus the equipment slots."""
+    return {'items': {item_id: dict(item) for item_id, item in ITEMS.items()}, 'slots': SLOTS}
+
+CATALOG_JSON = json.dumps(build_catalog(), sort_keys=True, separators=(',', ':')).encode('utf-8')
+CATALOG_VERSION = hashlib.sha256(CATALOG_JSON).hexdigest()[:16]
@@ -1,132 +1,93 @@
 # Refactored location logic for the web game
+#
+# Location descriptions, options, items and exits are defined in world.json
+# and compiled by the world module; this module turns them into the
+# message/options views the game shows for a location.
+#
+# Views are a pure function of the location id plus a small set of state
+# predicates the location declares (currently: "does the player own item X"
+# for each item lying there), so they are built once per key, cached, and
+# shared between requests as immutable objects.
+
+from . import world
+
+
+class FrozenDict(dict):
+    """A dict that can't be modified, so cached views can be shared safely."""
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Cached location views are read-only")
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        # Lets copy/deepcopy/pickle rebuild it without calling __setitem__
+        return (FrozenDict, (dict(self),))
+
+
+_view_cache = {} # (location_id, *predicate values) -> FrozenDict view
+# Approximate under threads, good enough for hit rates. Kept across reloads,
+# since /metrics exports them as counters (see metrics.py)
+_view_cache_stats = {'hits': 0, 'misses': 0}
+
+
+def invalidate_view_cache():
+    """Drops all cached views (called whenever the world is reloaded)."""
+    _view_cache.clear()
+
+
+def view_cache_info():
+    """Returns cache hit/miss counters and the number of cached views."""
+    return dict(_view_cache_stats, size=len(_view_cache))
+
+
+world.on_reload(invalidate_view_cache)
+
+
+def player_has_item(game_state, item_id):
+    """Checks if the player owns an item (equipped or in inventory)."""
+    # A dict lookup for id -> count inventories; legacy lists are scanned
+    player_stats = game_state.get('player_stats') or {}
+    return (item_id in player_stats.get('inventory', [])) or \
+           (player_stats.get('equipment', {}).get('weapon') == item_id)
 
-# Import other logic modules as needed (e.g., combat for forest encounter)
-# from . import combat
 
 def get_location_data(location_id, game_state):
     """
     Returns the message and options for a given location ID.
-    This acts as a router to the specific location functions.
     """
-    if location_id == 'main_camp':
-        return main_camp(game_state)
-    elif location_id == 'fork':
-        return fork(game_state)
-    elif location_id == 'left_path': # Renamed from 'left' to avoid conflict with direction
-        return left_path(game_state)
-    elif location_id == 'right_path': # Renamed from 'right' to avoid conflict with direction
-        return right_path(game_state)
-    elif location_id == 'forest':
-        return forest(game_state)
-    elif location_id == 'ocean':
-        return ocean(game_state)
-    elif location_id == 'mountains':
-        return mountains(game_state)
-    elif location_id == 'damp_cave': # Added Damp Cave
-        return damp_cave(game_state)
-    # Add other locations here
-    else:
+    location = world.WORLD.location(location_id)
+    if location is None:
         # Default or error case
         return {
             'message': f"Error: Unknown location '{location_id}'. Returning to camp.",
-            'options': main_camp(game_state)['options'], # Provide camp options
-            'next_location': 'main_camp'
+            'options': get_location_data(world.WORLD.start, game_state)['options'], # Provide camp options
+            'next_location': world.WORLD.start
         }
 
-def main_camp(game_state):
-    """Returns data for the main camp."""
-    message = ("You are at your main camp.\n\n"
-               "To the NORTH, there is a dirt road.\n"
-               "To the EAST is a dense forest.\n"
-               "Looking SOUTH, you see a vast ocean.\n"
-               "Off to the WEST is a large mountain range.\n"
-               "You can also stay at the camp and REST.")
-    options = [
-        {'action': 'go', 'direction': 'north', 'text': 'Go North (Road)'},
-        {'action': 'go', 'direction': 'east', 'text': 'Go East (Forest)'},
-        {'action': 'go', 'direction': 'south', 'text': 'Go South (Ocean)'},
-        {'action': 'go', 'direction': 'west', 'text': 'Go West (Mountains)'},
-        {'action': 'rest', 'text': 'Rest at Camp'}
-    ]
-    return {'message': message, 'options': options}
-
-def fork(game_state):
-    """Returns data for the fork in the road."""
-    message = "After following the road for a while, you come to a fork."
-    options = [
-        {'action': 'go', 'direction': 'left', 'text': 'Go Left'},
-        {'action': 'go', 'direction': 'right', 'text': 'Go Right'},
-        {'action': 'go', 'direction': 'back', 'text': 'Go Back to Camp'} # 'back' implies returning to previous location logic in app.py
-    ]
-    return {'message': message, 'options': options}
-
-def left_path(game_state):
-    """Returns data for the left path."""
-    message = ("You went left down the path. The path narrows and you see the dark entrance to a cave, dripping with moisture.")
-    options = [
-        {'action': 'go', 'direction': 'cave', 'text': 'Enter Damp Cave'}, # Changed direction to 'cave'
-        {'action': 'go', 'direction': 'back', 'text': 'Go Back to Fork'}
-    ]
-    return {'message': message, 'options': options}
-
-def right_path(game_state):
-    """Returns data for the right path."""
-    message = "You went right down the path. It continues into the distance."
-    options = [
-        # TODO: Add more options here if the path leads somewhere
-        {'action': 'go', 'direction': 'back', 'text': 'Go Back to Fork'}
-    ]
-    return {'message': message, 'options': options}
-
-def forest(game_state):
-    """Returns data for the forest entrance."""
-    # Combat encounter logic will be handled in app.py before calling this
-    message = ("You arrive at the edge of a dense forest.\n"
-               "You can EXPLORE deeper into the woods.\n"
-               "Or you can head BACK to camp.")
-    options = [
-        {'action': 'explore_forest', 'text': 'Explore Forest'},
-        {'action': 'go', 'direction': 'back', 'text': 'Go Back to Camp'}
-    ]
-    return {'message': message, 'options': options}
-
-def ocean(game_state):
-    """Returns data for the ocean."""
-    message = "You stand at the shore of a vast, sparkling ocean. The waves crash gently."
-    options = [
-        {'action': 'go', 'direction': 'back', 'text': 'Go Back to Camp'}
-    ]
-    return {'message': message, 'options': options}
-
-def mountains(game_state):
-    """Returns data for the mountains."""
-    message = "You arrive at the foothills of a towering mountain range. The peaks disappear into the clouds."
-    options = [
-        {'action': 'go', 'direction': 'back', 'text': 'Go Back to Camp'}
-    ]
-    return {'message': message, 'options': options}
-
-from . import items # Import items to check weapon details
-
-def damp_cave(game_state):
-    """Returns data for the damp cave."""
-    # Combat encounter logic (Slime) will be handled in app.py before calling this
-    message = ("You step into the Damp Cave. Water drips constantly from the ceiling, and the air is cool and musty. "
-               "Strange, gelatinous shapes seem to quiver in the dim light.")
-    options = [
-        # TODO: Add exploration options within the cave later?
-        {'action': 'go', 'direction': 'back', 'text': 'Leave Cave (Back to Left Path)'}
-    ]
-
-    # Check if player already has the sword (equipped or in inventory)
-    player_stats = game_state.get('player_stats', {})
-    has_sword = ('rusty_sword' in player_stats.get('inventory', [])) or \
-                (player_stats.get('equipment', {}).get('weapon') == 'rusty_sword')
-
-    if not has_sword:
-        message += "\n\nLying on a damp ledge, you spot a Rusty Sword."
-        options.insert(0, {'action': 'take_item', 'item_id': 'rusty_sword', 'text': 'Take Rusty Sword'}) # Add take option
-
-    return {'message': message, 'options': options}
-
-# Add functions for other locations/scenes as needed
+    # The only state a location view depends on is which of its items the player owns
+    key = (location_id,) + tuple(player_has_item(game_state, item['item_id']) for item in location.items)
+    view = _view_cache.get(key)
+    if view is not None:
+        _view_cache_stats['hits'] += 1
+        return view
+    _view_cache_stats['misses'] += 1
+
+    view = _build_view(location, key[1:])
+    _view_cache[key] = view
+    return view
+
+
+def _build_view(location, owned_items):
+    """Builds the (immutable) view for a location given which items are owned."""
+    message = location.message
+    options = [FrozenDict(option) for option in location.options]
+
+    # Items lying around are offered until the player owns one
+    take_options = []
+    for item, owned in zip(location.items, owned_items):
+        if not owned:
+            message += "\n\n" + item['message']
+            take_options.append(FrozenDict({'action': 'take_item', 'item_id': item['item_id'], 'text': item['text']}))
+
+    return FrozenDict({'message': message, 'options': tuple(take_options + options)})
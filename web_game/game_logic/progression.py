@@ -0,0 +1,129 @@
+# Character progression: the XP curve, level-ups and XP rewards
+#
+# Reaching level L+1 from level L takes ceil(50 * L ** 1.3) XP. The curve is
+# tabulated once up to LEVEL_CAP, together with the cumulative XP needed to
+# reach each level, so a grant of any size resolves with one bisect instead
+# of a loop over every level gained. Players at the cap keep collecting XP
+# but don't level any further.
+#
+# XP for a defeated enemy is reduced by 20% per level the player is above
+# it (down to 10% of the base reward). xp_rewards() and grant_xp_bulk() are
+# the NumPy versions, for the simulator and for events that hand XP to many
+# players at once.
+
+import math
+from bisect import bisect_right
+
+try:
+    import numpy as np
+except ImportError: # Only the bulk/array functions need NumPy
+    np = None
+
+LEVEL_CAP = 100
+XP_BASE = 50 # Halved the base requirement from 100 to 50
+XP_EXPONENT = 1.3 # Reduced exponent from 1.5 to 1.3
+STAT_POINTS_PER_LEVEL = 5
+
+REDUCTION_PER_LEVEL = 0.20 # XP lost per level the player is above the enemy
+MAX_REDUCTION = 0.9 # Always keep at least 10%
+
+# _XP_TO_NEXT[L]: XP needed to go from level L to L+1 (L = 0..LEVEL_CAP)
+_XP_TO_NEXT = [math.ceil(XP_BASE * (level ** XP_EXPONENT)) for level in range(LEVEL_CAP + 1)]
+
+# _CUMULATIVE[L - 1]: total XP from the start of level 1 to the start of level L
+_CUMULATIVE = [0]
+for _level in range(1, LEVEL_CAP):
+    _CUMULATIVE.append(_CUMULATIVE[-1] + _XP_TO_NEXT[_level])
+del _level
+
+
+def xp_for_next_level(level):
+    """XP needed to go from `level` to the next one."""
+    if 0 <= level <= LEVEL_CAP:
+        return _XP_TO_NEXT[level]
+    return math.ceil(XP_BASE * (level ** XP_EXPONENT)) # Use ceil to ensure integer XP requirement
+
+
+def total_xp_for_level(level):
+    """Total XP from the start of level 1 to the start of `level` (1..LEVEL_CAP)."""
+    return _CUMULATIVE[level - 1]
+
+
+def level_for_total_xp(total):
+    """The level a player with `total` XP since the start of level 1 has reached."""
+    return min(bisect_right(_CUMULATIVE, total), LEVEL_CAP)
+
+
+def grant_xp(player_stats, amount):
+    """Adds XP to a player state and applies any level-ups. Returns the number of levels gained."""
+    level = player_stats['level']
+    xp = player_stats['xp'] + amount
+    xp_to_next_level = player_stats['xp_to_next_level']
+    if xp < xp_to_next_level or level >= LEVEL_CAP:
+        player_stats['xp'] = xp
+        return 0
+
+    # The first level-up goes by the player's stored requirement (it may
+    # predate a change to the curve); the rest by the table
+    xp -= xp_to_next_level
+    new_level = level + 1
+    if new_level < LEVEL_CAP:
+        total = _CUMULATIVE[new_level - 1] + xp
+        new_level = level_for_total_xp(total)
+        xp = total - _CUMULATIVE[new_level - 1]
+
+    gained = new_level - level
+    player_stats['level'] = new_level
+    player_stats['xp'] = xp
+    player_stats['stat_points'] += STAT_POINTS_PER_LEVEL * gained # Award stat points
+    player_stats['xp_to_next_level'] = xp_for_next_level(new_level)
+    return gained
+
+
+def reduced_xp(base_xp, enemy_level, player_level):
+    """XP for defeating an enemy worth `base_xp` at `enemy_level`, for a player at `player_level`."""
+    level_diff = player_level - enemy_level
+    if base_xp > 0 and level_diff > 0:
+        reduction = max(0, min(MAX_REDUCTION, level_diff * REDUCTION_PER_LEVEL))
+        return math.ceil(base_xp * (1 - reduction))
+    return base_xp
+
+
+# --- NumPy versions ---
+
+def xp_rewards(base_xp, enemy_level, player_level):
+    """reduced_xp() over arrays (any mix of arrays and scalars that broadcast)."""
+    base = np.asarray(base_xp, dtype=np.int64)
+    level_diff = np.asarray(player_level, dtype=np.int64) - np.asarray(enemy_level, dtype=np.int64)
+    reduction = np.clip(level_diff * REDUCTION_PER_LEVEL, 0, MAX_REDUCTION)
+    reduced = np.ceil(base * (1 - reduction)).astype(np.int64)
+    return np.where((base > 0) & (level_diff > 0), reduced, base)
+
+
+def grant_xp_bulk(players, amounts):
+    """grant_xp() for many player states at once.
+
+    `amounts` is one amount for everyone or one per player. Returns an array
+    of the levels each player gained.
+    """
+    level = np.fromiter((p['level'] for p in players), dtype=np.int64, count=len(players))
+    xp = np.fromiter((p['xp'] for p in players), dtype=np.int64, count=len(players)) + np.asarray(amounts, dtype=np.int64)
+    xp_to_next_level = np.fromiter((p['xp_to_next_level'] for p in players), dtype=np.int64, count=len(players))
+
+    ups = (xp >= xp_to_next_level) & (level < LEVEL_CAP)
+    xp = np.where(ups, xp - xp_to_next_level, xp)
+    new_level = level + ups
+    more = ups & (new_level < LEVEL_CAP)
+    cumulative = np.asarray(_CUMULATIVE, dtype=np.int64)
+    total = cumulative[np.where(more, new_level, 1) - 1] + xp
+    new_level = np.where(more, np.minimum(np.searchsorted(cumulative, total, side='right'), LEVEL_CAP), new_level)
+    xp = np.where(more, total - cumulative[np.where(more, new_level, 1) - 1], xp)
+    gained = new_level - level
+
+    for player, player_level, player_xp, player_gained in zip(players, new_level.tolist(), xp.tolist(), gained.tolist()):
+        player['xp'] = player_xp
+        if player_gained:
+            player['level'] = player_level
+            player['stat_points'] += STAT_POINTS_PER_LEVEL * player_gained
+            player['xp_to_next_level'] = xp_for_next_level(player_level)
+    return gained
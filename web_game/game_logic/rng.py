@@ -0,0 +1,25 @@
+# Per-session random streams
+#
+# Game rolls used to come from the global `random` module, which every
+# request (and every thread) shares, so a session's rolls depended on what
+# everyone else was doing. Each session now has its own seeded stream:
+# game_state['rng'] holds [seed, step], and every request draws from a
+# generator seeded with "seed:step", then advances step. Replaying the same
+# actions from the same seed gives the same rolls (recorder.py relies on it).
+# Encounter rolls and combat damage (combat.py takes an `rng` argument
+# wherever it rolls) both draw from it.
+
+import random
+import secrets
+
+
+def new_seed():
+    """Returns a fresh 63-bit seed for a session stream."""
+    return secrets.randbits(63)
+
+
+def session_rng(game_state):
+    """Returns this request's Random for a session and advances its stream."""
+    seed, step = game_state.get('rng') or (new_seed(), 0)
+    game_state['rng'] = [seed, step + 1]
+    return random.Random(f"{seed}:{step}")
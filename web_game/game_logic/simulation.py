@@ -0,0 +1,236 @@
+# Headless combat simulator for balancing
+#
+# Runs many fights of a player build against enemies from ENEMY_STATS and
+# reports win rate, turns-to-kill and expected XP per minute of play.
+#
+# Two implementations share the same rules:
+#   - simulate_reference(): drives the real combat.handle_combat_action one
+#     turn at a time. Slow, but it *is* the game code.
+#   - simulate_vectorized(): runs whole batches of fights as NumPy arrays.
+# `--check` on the command line runs both and compares them statistically;
+# benchmarks/microbench.py compare runs the same check with fixed seeds.
+#
+# Usage (from web_game/):
+#   python -m game_logic.simulation --attack 10 --defense 5 --weapon rusty_sword --fights 1000000
+
+import argparse
+import math
+import random
+import time
+
+from . import combat, items, progression
+
+try:
+    import numpy as np
+except ImportError: # NumPy is only needed for the vectorized simulator
+    np = None
+
+DEFAULT_MAX_TURNS = 500 # Fights that can't finish (nobody can do damage) stop here
+DEFEND_BOOST = 2 # Mirrors Character.defend()
+DAMAGE_SPREAD = 2 # Mirrors randint(attack - 2, attack + 2) in Character.attack_target()
+
+
+def make_build(health=100, attack=10, defense=5, weapon='fists', level=1, name='Simulated Hero'):
+    """Returns a player state dict like the one created at character creation."""
+    return {
+        'name': name, 'health': health, 'max_health': health,
+        'attack': attack, 'defense': defense, 'is_player': True, 'is_defending': False,
+        'level': level, 'xp': 0, 'xp_to_next_level': 100, 'stat_points': 0,
+        'inventory': {}, 'equipment': {'weapon': weapon},
+    }
+
+
+def summarize(enemy_name, player_level, wins, losses, turns, seconds_per_turn, xp=None):
+    """Turns raw fight outcomes into a report dict. `turns` is a sorted list/array."""
+    fights = len(turns)
+    if xp is None: # XP per win, unless the caller already worked it out
+        xp, _ = combat.xp_reward_for(enemy_name, player_level)
+    mean_turns = float(turns.mean()) if hasattr(turns, 'mean') else sum(turns) / fights
+    win_rate = wins / fights
+    # Expected XP per fight, spread over the time the fight takes to click through
+    minutes_per_fight = mean_turns * seconds_per_turn / 60
+    return {
+        'enemy': enemy_name,
+        'fights': fights,
+        'win_rate': win_rate,
+        'loss_rate': losses / fights,
+        'mean_turns': mean_turns,
+        'turns_p50': int(turns[int(fights * 0.50)]),
+        'turns_p90': int(turns[int(fights * 0.90)]),
+        'turns_p99': int(turns[min(fights - 1, int(fights * 0.99))]),
+        'xp_per_minute': (win_rate * xp / minutes_per_fight) if minutes_per_fight else 0.0,
+    }
+
+
+def simulate_reference(player_state, enemy_name, fights, policy='attack', seed=None,
+                       max_turns=DEFAULT_MAX_TURNS, seconds_per_turn=2.0):
+    """Simulates fights by calling the real combat code turn by turn."""
+    defend_below = combat.parse_policy(policy)
+    rng = random.Random(seed)
+    wins = losses = 0
+    turns = []
+    for _ in range(fights):
+        combat_state = combat.start_combat(player_state, enemy_name)
+        turn = 0
+        while not combat_state['is_over'] and turn < max_turns:
+            player = combat_state['player']
+            action = combat.choose_action(player['health'], player['max_health'], defend_below)
+            combat_state = combat.handle_combat_action(combat_state, action, rng=rng)
+            turn += 1
+        if combat_state['victory'] is True:
+            wins += 1
+        elif combat_state['victory'] is False:
+            losses += 1
+        turns.append(turn)
+    turns.sort()
+    return summarize(enemy_name, player_state.get('level', 1), wins, losses, turns, seconds_per_turn)
+
+
+def simulate_vectorized(player_state, enemy_names, fights, policy='attack', seed=None,
+                        max_turns=DEFAULT_MAX_TURNS, seconds_per_turn=2.0, batch_size=1_000_000):
+    """Simulates `fights` fights against each enemy as batched NumPy arrays.
+
+    Returns a list of report dicts, one per enemy, in the order given.
+    """
+    if np is None:
+        raise RuntimeError("The vectorized simulator needs NumPy (pip install numpy)")
+    rng = np.random.default_rng(seed)
+    defend_below = combat.parse_policy(policy)
+    max_health = player_state['max_health']
+    attack_bonus, defense_bonus = items.equipment_bonus(player_state.get('equipment', {}))
+    player_attack = player_state['attack'] + attack_bonus
+    player_defense = player_state['defense'] + defense_bonus
+
+    # XP per win for every enemy at once
+    enemy_stats = [combat.ENEMY_STATS.get(name, combat.ENEMY_STATS['Slime']) for name in enemy_names]
+    rewards = progression.xp_rewards([s['xp_reward'] for s in enemy_stats], [s['level'] for s in enemy_stats],
+                                     player_state.get('level', 1)).tolist()
+
+    reports = []
+    for enemy_name, stats, xp in zip(enemy_names, enemy_stats, rewards):
+        wins = losses = 0
+        turn_chunks = []
+        remaining = fights
+        while remaining:
+            n = min(remaining, batch_size)
+            remaining -= n
+            outcome, turns = _run_batch(
+                rng, n, player_state['health'], max_health, player_attack, player_defense,
+                stats['health'], stats['attack'], stats['defense'], defend_below, max_turns)
+            wins += int((outcome == 1).sum())
+            losses += int((outcome == -1).sum())
+            turn_chunks.append(turns)
+        all_turns = np.sort(np.concatenate(turn_chunks))
+        reports.append(summarize(enemy_name, player_state.get('level', 1), wins, losses, all_turns, seconds_per_turn, xp))
+    return reports
+
+
+def _run_batch(rng, n, health, max_health, attack, defense, enemy_health, enemy_attack, enemy_defense,
+               defend_below, max_turns):
+    """Runs n independent fights in lockstep. Returns (outcome, turns) arrays.
+
+    outcome is 1 for a win, -1 for a loss and 0 for fights cut off at max_turns.
+    """
+    player_hp = np.full(n, health, dtype=np.int32)
+    enemy_hp = np.full(n, enemy_health, dtype=np.int32)
+    outcome = np.zeros(n, dtype=np.int8)
+    turns = np.full(n, max_turns, dtype=np.int32)
+    active = np.arange(n) # Indices of fights still running
+
+    for turn in range(1, max_turns + 1):
+        if active.size == 0:
+            break
+        hp = player_hp[active]
+        defending = hp < defend_below * max_health
+
+        # Player attacks (unless defending): damage roll minus enemy defense
+        roll = rng.integers(attack - DAMAGE_SPREAD, attack + DAMAGE_SPREAD + 1, size=active.size)
+        damage = np.where(defending, 0, np.maximum(0, roll - enemy_defense))
+        ehp = enemy_hp[active] - damage
+        enemy_hp[active] = ehp
+        won = ehp <= 0
+
+        # Surviving enemies attack back; defending adds the +2 boost for this hit only
+        roll = rng.integers(enemy_attack - DAMAGE_SPREAD, enemy_attack + DAMAGE_SPREAD + 1, size=active.size)
+        damage = np.maximum(0, roll - (defense + DEFEND_BOOST * defending))
+        hp = np.where(won, hp, hp - damage)
+        player_hp[active] = hp
+        lost = ~won & (hp <= 0)
+
+        finished = won | lost
+        done = active[finished]
+        outcome[done] = np.where(won[finished], 1, -1)
+        turns[done] = turn
+        active = active[~finished]
+
+    return outcome, turns
+
+
+def check_equivalence(player_state, enemy_names, fights, policy, seed):
+    """Compares the vectorized simulator with the reference one. Returns True if they agree."""
+    ok = True
+    vectorized = simulate_vectorized(player_state, enemy_names, fights * 50, policy, seed=seed)
+    for enemy_name, fast in zip(enemy_names, vectorized):
+        slow = simulate_reference(player_state, enemy_name, fights, policy, seed=seed)
+        # Win rates: two-proportion z-test. Mean turns: compare against the sampling error.
+        pooled = (slow['win_rate'] * slow['fights'] + fast['win_rate'] * fast['fights']) / (slow['fights'] + fast['fights'])
+        se = math.sqrt(max(pooled * (1 - pooled), 1e-12) * (1 / slow['fights'] + 1 / fast['fights']))
+        z_win = abs(slow['win_rate'] - fast['win_rate']) / se
+        turn_tolerance = max(0.5, 0.05 * slow['mean_turns'])
+        # The exact odds table used for auto-battle should agree with both
+        stats = combat.ENEMY_STATS[enemy_name]
+        attack_bonus, defense_bonus = items.equipment_bonus(player_state['equipment'])
+        exact = combat.win_odds(player_state['health'], player_state['max_health'], player_state['attack'] + attack_bonus,
+                                player_state['defense'] + defense_bonus, enemy_name, stats['health'], policy)
+        z_exact = 0.0 if exact is None else abs(exact - fast['win_rate']) / math.sqrt(max(exact * (1 - exact), 1e-12) / fast['fights'])
+        agrees = z_win < 4 and z_exact < 4 and abs(slow['mean_turns'] - fast['mean_turns']) < turn_tolerance
+        ok = ok and agrees
+        exact_text = 'n/a' if exact is None else f"{exact:.3f}" # Too long a fight to tabulate
+        print(f"{enemy_name:<14} win {slow['win_rate']:.3f} vs {fast['win_rate']:.3f} (z={z_win:.2f}) exact {exact_text}  "
+              f"turns {slow['mean_turns']:.2f} vs {fast['mean_turns']:.2f}  {'OK' if agrees else 'MISMATCH'}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate fights of a player build against every enemy.")
+    parser.add_argument('--health', type=int, default=100)
+    parser.add_argument('--attack', type=int, default=10)
+    parser.add_argument('--defense', type=int, default=5)
+    parser.add_argument('--weapon', default='fists', choices=sorted(items.WEAPONS))
+    parser.add_argument('--level', type=int, default=1)
+    parser.add_argument('--enemy', action='append', help="Enemy to fight (repeatable, default: all)")
+    parser.add_argument('--fights', type=int, default=100_000, help="Fights per enemy")
+    parser.add_argument('--policy', default='attack', help="'attack' or 'defend_below:<percent>'")
+    parser.add_argument('--seconds-per-turn', type=float, default=2.0, help="Player time per combat turn, for XP/minute")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--reference', action='store_true', help="Use the pure-Python reference simulator")
+    parser.add_argument('--check', action='store_true', help="Check the vectorized simulator against the reference")
+    args = parser.parse_args(argv)
+
+    build = make_build(args.health, args.attack, args.defense, args.weapon, args.level)
+    enemy_names = args.enemy or list(combat.ENEMY_STATS)
+
+    if args.check:
+        return 0 if check_equivalence(build, enemy_names, min(args.fights, 20_000), args.policy, args.seed) else 1
+
+    start = time.perf_counter()
+    if args.reference or np is None:
+        reports = [simulate_reference(build, name, args.fights, args.policy, seed=args.seed,
+                                      seconds_per_turn=args.seconds_per_turn)
+                   for name in enemy_names]
+    else:
+        reports = simulate_vectorized(build, enemy_names, args.fights, args.policy, seed=args.seed,
+                                      seconds_per_turn=args.seconds_per_turn)
+    elapsed = time.perf_counter() - start
+
+    print(f"{'enemy':<14} {'win %':>7} {'loss %':>7} {'turns':>6} {'p50':>4} {'p90':>4} {'p99':>4} {'XP/min':>8}")
+    for r in reports:
+        print(f"{r['enemy']:<14} {r['win_rate'] * 100:>7.2f} {r['loss_rate'] * 100:>7.2f} {r['mean_turns']:>6.2f} "
+              f"{r['turns_p50']:>4} {r['turns_p90']:>4} {r['turns_p99']:>4} {r['xp_per_minute']:>8.2f}")
+    total = args.fights * len(enemy_names)
+    print(f"\n{total:,} fights in {elapsed:.2f}s ({total / elapsed:,.0f} fights/s)")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
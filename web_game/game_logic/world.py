@@ -0,0 +1,236 @@
+# Compiled world graph
+#
+# The world (locations, their descriptions, exits, items and encounters) is
+# defined in world.json. At startup it is validated once and compiled into an
+# immutable World with O(1) (location, direction) -> target lookups and
+# precomputed encounter tables. The compiled form is cached on disk, keyed by
+# a hash of the definition and of the game data compiling it reads (enemy
+# stats, item ids), so restarts skip parsing and validation.
+#
+# A location's "encounter" has a rate (percent chance when entering) and a
+# weighted table of entries. An entry names an enemy, or a level band
+# ("levels": [low, high]) that expands to every ENEMY_STATS entry in that
+# band (each with the entry's weight), plus an optional pack size
+# "count": [min, max]. The older {"enemy", "chance", "count"} shorthand is
+# still accepted.
+
+import hashlib
+import json
+import os
+import pickle
+import sys
+from collections import deque, namedtuple
+from types import MappingProxyType
+
+from . import encounters, items
+from .combat import ENEMY_STATS
+
+WORLD_PATH = os.path.join(os.path.dirname(__file__), 'world.json')
+COMPILER_VERSION = 3 # Bump when the compiled format changes to invalidate caches
+
+Location = namedtuple('Location', ['id', 'message', 'options', 'items', 'encounter'])
+
+
+class WorldError(ValueError):
+    """Raised when the world definition is invalid."""
+
+
+def compile_world(definition):
+    """Validates a world definition and returns its compiled (picklable) form."""
+    start = definition.get('start')
+    raw_locations = definition.get('locations', {})
+    if start not in raw_locations:
+        raise WorldError(f"Start location '{start}' is not defined")
+
+    errors = []
+    exits = {} # (location_id, direction) -> target_id
+    compiled_encounters = {}
+    for location_id, location in raw_locations.items():
+        for option in location.get('options', []):
+            if option.get('action') != 'go':
+                continue
+            direction, target = option.get('direction'), option.get('to')
+            if (location_id, direction) in exits:
+                errors.append(f"{location_id}: duplicate exit '{direction}'")
+            elif target not in raw_locations:
+                errors.append(f"{location_id}: exit '{direction}' leads to unknown location '{target}'")
+            else:
+                exits[(location_id, direction)] = target
+        for item in location.get('items', []):
+            if items.get_item_details(item.get('item_id')) is None:
+                errors.append(f"{location_id}: unknown item '{item.get('item_id')}'")
+        if location.get('encounter'):
+            compiled_encounters[location_id] = _compile_encounter(location_id, location['encounter'], errors)
+
+    # Every location must be reachable from the start
+    neighbours = {}
+    for (source, _), target in exits.items():
+        neighbours.setdefault(source, []).append(target)
+    reachable = {start}
+    queue = deque([start])
+    while queue:
+        for target in neighbours.get(queue.popleft(), []):
+            if target not in reachable:
+                reachable.add(target)
+                queue.append(target)
+    for location_id in raw_locations:
+        if location_id not in reachable:
+            errors.append(f"{location_id}: unreachable from '{start}'")
+
+    if errors:
+        raise WorldError("Invalid world definition:\n  " + "\n  ".join(errors))
+
+    compiled_locations = {}
+    for location_id, location in raw_locations.items():
+        compiled_locations[location_id] = {
+            'message': location.get('message', ''),
+            # The client never needs to see where an exit leads
+            'options': [{k: v for k, v in option.items() if k != 'to'} for option in location.get('options', [])],
+            'items': [dict(item) for item in location.get('items', [])],
+            'encounter': compiled_encounters.get(location_id),
+        }
+    return {'start': start, 'locations': compiled_locations, 'exits': exits}
+
+
+def _compile_encounter(location_id, encounter, errors):
+    """Expands an encounter definition into entries plus its alias table."""
+    if 'table' in encounter:
+        rate, table = encounter.get('rate', 50), encounter['table']
+    else: # Shorthand: one enemy type
+        rate, table = encounter.get('chance', 50), [{'enemy': encounter.get('enemy'), 'count': encounter.get('count', [1, 1])}]
+    if not 0 <= rate <= 100:
+        errors.append(f"{location_id}: encounter rate {rate} is not a percentage")
+
+    entries = []
+    for row in table:
+        low, high = row.get('count', [1, 1])
+        if not 1 <= low <= high:
+            errors.append(f"{location_id}: invalid encounter count [{low}, {high}]")
+        weight = row.get('weight', 1)
+        if weight <= 0:
+            errors.append(f"{location_id}: encounter weights must be positive")
+            continue
+        if 'levels' in row:
+            band_low, band_high = row['levels']
+            names = [name for name, stats in ENEMY_STATS.items() if band_low <= stats.get('level', 1) <= band_high]
+            if not names:
+                errors.append(f"{location_id}: no enemies in level band {row['levels']}")
+        elif row.get('enemy') in ENEMY_STATS:
+            names = [row['enemy']]
+        else:
+            errors.append(f"{location_id}: unknown enemy '{row.get('enemy')}'")
+            names = []
+        entries.extend((name, weight, low, high) for name in names)
+
+    if not entries:
+        errors.append(f"{location_id}: encounter table is empty")
+        return None
+    prob, alias = encounters.build_alias([entry[1] for entry in entries])
+    return {'rate': rate, 'entries': entries, 'prob': prob, 'alias': alias}
+
+
+class World:
+    """Immutable, compiled world graph."""
+    __slots__ = ('start', 'locations', 'exits', 'encounters', 'source_hash')
+
+    def __init__(self, compiled, source_hash=None):
+        intern = sys.intern # Location ids and directions are compared on every request
+        locations = {}
+        tables = {}
+        for location_id, data in compiled['locations'].items():
+            location_id = intern(location_id)
+            encounter = encounters.EncounterTable(**data['encounter']) if data['encounter'] else None
+            locations[location_id] = Location(
+                location_id,
+                data['message'],
+                tuple(MappingProxyType(option) for option in data['options']),
+                tuple(MappingProxyType(item) for item in data['items']),
+                encounter,
+            )
+            if encounter:
+                tables[location_id] = encounter
+        exits = {(intern(source), intern(direction)): intern(target)
+                 for (source, direction), target in compiled['exits'].items()}
+        if encounters.np is None and any(entry.max_count > 1 for table in tables.values() for entry in table.entries):
+            # Packs are fought with NumPy (see combat.EnemySide); refuse to start rather than play them differently
+            raise RuntimeError("This world has multi-enemy encounters, which need NumPy (pip install numpy)")
+
+        set_attr = object.__setattr__
+        set_attr(self, 'start', intern(compiled['start']))
+        set_attr(self, 'locations', MappingProxyType(locations))
+        set_attr(self, 'exits', MappingProxyType(exits))
+        set_attr(self, 'encounters', MappingProxyType(tables))
+        set_attr(self, 'source_hash', source_hash)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("World is immutable")
+
+    def exit(self, location_id, direction):
+        """Returns the location reached by going `direction`, or None."""
+        if not isinstance(direction, str):
+            return None # Client input: a list or dict isn't a direction (nor hashable)
+        return self.exits.get((location_id, direction))
+
+    def location(self, location_id):
+        """Returns the Location for an id, or None if it doesn't exist."""
+        return self.locations.get(location_id)
+
+    def encounter(self, location_id):
+        """Returns the EncounterTable for a location, or None if it's peaceful."""
+        return self.encounters.get(location_id)
+
+
+def compiler_inputs():
+    """Everything besides world.json that the compiled world depends on, as bytes.
+
+    Level bands expand over ENEMY_STATS and enemies and items are validated
+    against the game data, so a change there must miss the cache too.
+    """
+    return json.dumps([COMPILER_VERSION, ENEMY_STATS, sorted(items.ITEMS)], sort_keys=True).encode('utf-8')
+
+
+def load_world(path=WORLD_PATH, cache_dir=None):
+    """Loads and compiles a world definition, using the on-disk cache if possible."""
+    with open(path, 'rb') as f:
+        source = f.read()
+    source_hash = hashlib.sha256(source + compiler_inputs()).hexdigest()[:16]
+
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(path), '__pycache__')
+    cache_path = os.path.join(cache_dir, f"{os.path.basename(path)}.{source_hash}.pickle")
+
+    try:
+        with open(cache_path, 'rb') as f:
+            return World(pickle.load(f), source_hash)
+    except (OSError, pickle.PickleError, EOFError):
+        pass # No usable cache, compile from source
+
+    compiled = compile_world(json.loads(source))
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(compiled, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path) # Atomic, so other workers never read a partial file
+    except OSError:
+        pass # Read-only deployment: just run without the cache
+    return World(compiled, source_hash)
+
+
+WORLD = load_world()
+_reload_listeners = [] # Called after the world is swapped, e.g. to drop cached views
+
+
+def on_reload(listener):
+    """Registers a function to call whenever the world is reloaded."""
+    _reload_listeners.append(listener)
+    return listener
+
+
+def reload_world(path=WORLD_PATH):
+    """Recompiles the world definition and swaps it in."""
+    global WORLD
+    WORLD = load_world(path)
+    for listener in _reload_listeners:
+        listener()
+    return WORLD
@@ -0,0 +1,41 @@
+# Production serving config for the web game
+#
+# Usage (from web_game/):
+#   SECRET_KEY=... gunicorn -c gunicorn.conf.py
+#
+# Every worker (and every node behind the load balancer) must share
+# SECRET_KEY and a session store, so any of them can serve any session:
+#   - one node:     SESSION_BACKEND=sqlite (the default set below)
+#   - many nodes:   SESSION_BACKEND=redis SESSION_REDIS_URL=redis://...
+# The per-process session cache is off by default here, since a worker
+# could otherwise answer from its own stale copy of a session. (Writes are
+# compare-and-swaps either way, see session_store.py: an action that ran on
+# a stale copy runs again instead of overwriting newer progress.)
+
+import multiprocessing
+import os
+
+wsgi_app = 'app:app' # The module-level app; a factory call here would build a second one per worker
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread' # Threads cover the time spent waiting on the session store
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+keepalive = 5
+# Recycle workers now and then so slow leaks can't build up; jitter avoids all restarting at once
+max_requests = 10000
+max_requests_jitter = 1000
+# Don't import the app in the master: savegames starts a writer thread, and
+# threads don't survive fork. Each worker builds its own app instead.
+preload_app = False
+
+# Shared state defaults for multi-worker serving (explicit settings win)
+os.environ.setdefault('SESSION_BACKEND', 'sqlite')
+os.environ.setdefault('SESSION_CACHE_SIZE', '0')
+
+
+def on_starting(server):
+    if not os.environ.get('SECRET_KEY'):
+        raise RuntimeError("Set SECRET_KEY: workers need a shared key to read each other's sessions")
+    if os.environ['SESSION_BACKEND'] == 'memory' and workers > 1:
+        raise RuntimeError("SESSION_BACKEND=memory keeps sessions in one worker; use sqlite, redis or cookie")
@@ -0,0 +1,216 @@
+# In-process metrics with a Prometheus text endpoint
+#
+# Counters and histograms are aggregated per thread: each thread records into
+# its own shard (a plain dict only it writes to), so recording never takes a
+# lock and costs a dict lookup and an add. Shards are only summed when
+# /metrics is scraped. When a thread exits (a thread-per-request server
+# starts one per request), its shard is folded into the metric's totals and
+# dropped, so shards only exist for live threads. Numbers another module
+# already keeps (like the location view cache's hit counts) are Collected:
+# read when /metrics is scraped, with nothing to record.
+#
+# Label values are bounded: callers map free-form input (like the action
+# name a client sends) onto a known set with bounded(), and every metric
+# also caps its number of label combinations (max_series), folding anything
+# beyond that into "other". A client can't grow the series count.
+
+import bisect
+import threading
+import time
+import weakref
+
+from game_logic import locations # Its view cache counters are read at scrape time
+
+DEFAULT_MAX_SERIES = 200
+OTHER = 'other'
+
+# Seconds: game logic runs in ~0.1 ms, whole requests in a few ms
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+BYTES_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 65536)
+TURN_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50, 100, 200)
+
+_registry = [] # Every metric, in registration order
+
+
+def bounded(value, allowed):
+    """Returns value if it's one of `allowed`, else "other"."""
+    return value if value in allowed else OTHER
+
+
+class _ShardOwner:
+    """Lives in a thread's thread-local storage, so it's freed when the thread exits."""
+    __slots__ = ('__weakref__',)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=(), max_series=DEFAULT_MAX_SERIES):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.max_series = max_series
+        self._series = set() # Label tuples seen so far (for the cap)
+        self._series_lock = threading.Lock() # Only taken for label tuples not seen yet
+        self._local = threading.local()
+        self._shards = {} # id -> dict, one per live thread that has recorded anything
+        self._retired = {} # Totals of the shards of threads that have exited
+        self._shards_lock = threading.Lock() # Taken when a thread starts or stops recording, and by scrapes
+        _registry.append(self)
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            owner = self._local.owner = _ShardOwner()
+            with self._shards_lock:
+                self._shards[id(shard)] = shard
+            weakref.finalize(owner, self._retire, shard)
+        return shard
+
+    def _retire(self, shard):
+        # The thread is gone, so nothing writes to its shard any more
+        with self._shards_lock:
+            self._merge(self._retired, list(shard.items()))
+            del self._shards[id(shard)]
+
+    def _key(self, labels):
+        if labels not in self._series:
+            with self._series_lock:
+                if labels not in self._series:
+                    if len(self._series) >= self.max_series:
+                        return (OTHER,) * len(self.labelnames)
+                    self._series.add(labels)
+        return labels
+
+    def _totals(self):
+        """Every shard (live or retired) summed."""
+        with self._shards_lock:
+            snapshots = [list(self._retired.items())]
+            snapshots += [list(shard.items()) for shard in self._shards.values()] # Copy under the GIL
+        totals = {}
+        for items in snapshots:
+            self._merge(totals, items)
+        return totals
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    @staticmethod
+    def _merge(totals, items):
+        for key, value in items:
+            totals[key] = totals.get(key, 0) + value
+
+    def collect(self):
+        for key, value in sorted(self._totals().items()):
+            yield self.name, _labels(self.labelnames, key), value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS, max_series=DEFAULT_MAX_SERIES):
+        super().__init__(name, help, labelnames, max_series)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        shard = self._shard()
+        key = self._key(labels)
+        entry = shard.get(key)
+        if entry is None:
+            entry = shard[key] = [[0] * (len(self.buckets) + 1), 0.0] # Per-bucket counts, sum
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def time(self, *labels):
+        """Context manager that observes the time spent in its block."""
+        return _Timer(self, labels)
+
+    @staticmethod
+    def _merge(totals, items):
+        for key, (counts, total) in items:
+            merged = totals.setdefault(key, [[0] * len(counts), 0.0])
+            merged[0] = [a + b for a, b in zip(merged[0], counts)]
+            merged[1] += total
+
+    def collect(self):
+        for key, (counts, total) in sorted(self._totals().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield f"{self.name}_bucket", _labels(self.labelnames + ('le',), key + (le,)), cumulative
+            yield f"{self.name}_sum", _labels(self.labelnames, key), total
+            yield f"{self.name}_count", _labels(self.labelnames, key), cumulative
+
+
+class Collected:
+    """A metric kept elsewhere and read when /metrics is scraped: read() returns {label tuple: value}."""
+    def __init__(self, name, help, kind, labelnames, read):
+        self.name = name
+        self.help = help
+        self.kind = kind # 'counter' or 'gauge'
+        self.labelnames = tuple(labelnames)
+        self.read = read
+        _registry.append(self)
+
+    def collect(self):
+        for key, value in sorted(self.read().items()):
+            yield self.name, _labels(self.labelnames, key), value
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{n}="{escape(v)}"' for n, v in zip(names, values)) + '}'
+
+
+def render():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.collect():
+            lines.append(f"{name}{labels} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+# --- The game's metrics ---
+
+ACTION_SECONDS = Histogram('game_action_seconds', "Time spent in the game logic per action.", ['action'])
+ACTION_REJECTED = Counter('game_action_rejected_total', "Actions that weren't valid where they were sent.", ['action'])
+RESPONSE_BYTES = Histogram('game_response_bytes', "Size of /action response bodies.", ['action'], BYTES_BUCKETS)
+SESSION_BYTES = Histogram('game_session_bytes', "Size of serialized sessions written to the store.", [], BYTES_BUCKETS)
+# outcome: retried (the request ran again), rejected (answered 409), dropped (a page load's write)
+SESSION_CONFLICTS = Counter('game_session_conflicts_total', "Session writes that lost to another request's.", ['outcome'])
+COMBAT_TURNS = Histogram('game_combat_turns', "Turns per finished combat encounter.", ['result'], TURN_BUCKETS)
+ENCOUNTER_ROLLS = Counter('game_encounter_rolls_total', "Encounter rolls on entering a zone.", ['zone', 'result'])
+VIEW_CACHE_LOOKUPS = Collected('game_view_cache_lookups_total', "Location view cache lookups.", 'counter', ['result'],
+                               lambda: {('hit',): locations.view_cache_info()['hits'],
+                                        ('miss',): locations.view_cache_info()['misses']})
+VIEW_CACHE_VIEWS = Collected('game_view_cache_views', "Location views currently cached.", 'gauge', [],
+                             lambda: {(): locations.view_cache_info()['size']})
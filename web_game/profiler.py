@@ -0,0 +1,246 @@
+# On-demand sampling profiler (admin only)
+#
+# Opt-in: the /admin routes only exist when ADMIN_TOKEN is set, and every
+# call must send it as "Authorization: Bearer <token>".
+#
+#   POST /admin/profile/start  {"sample": 0.1, "seconds": 30, "interval_ms": 1}
+#   POST /admin/profile/stop
+#   GET  /admin/profile?format=collapsed     (flamegraph.pl / speedscope / inferno)
+#   GET  /admin/profile?format=speedscope    (https://www.speedscope.app)
+#
+# While a profile runs, a `sample` fraction of requests (1 = all of them) is
+# marked as profiled, and a background thread takes a stack sample of every
+# thread currently serving a marked request each `interval_ms`. Stacks are
+# aggregated across requests, under a root frame naming the route, and
+# cover everything the request does: the action handlers, Jinja rendering,
+# JSON serialization, the session store. After `seconds` (if given) the
+# sampler stops by itself and the profile stays around for export.
+#
+# When no profile is running the only cost is one global lookup per request.
+#
+#   POST /admin/actions/<action>/hook  {"hook": "timing" | "cprofile" | null, "sample": 0.1}
+#   GET  /admin/actions/<action>/hook
+# install, remove and read the per-action hooks from dispatch.py.
+
+import hmac
+import json
+import random
+import sys
+import threading
+import time
+
+from flask import Blueprint, Response, abort, current_app, jsonify, request
+
+import actions
+import dispatch
+
+MAX_STACK_DEPTH = 128
+
+
+class SamplingProfiler:
+    """Samples the stacks of the threads serving profiled requests."""
+    def __init__(self, sample=1.0, interval=0.001, duration=None):
+        self.sample = sample
+        self.interval = interval
+        self.duration = duration
+        self.counts = {} # (label, code objects from the outermost frame in) -> samples
+        self.requests = 0 # Requests profiled so far
+        self.samples = 0
+        self.started = time.time()
+        self.stopped = None
+        self._threads = {} # thread id -> label of the request it is serving
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    @property
+    def running(self):
+        return not self._stop.is_set()
+
+    def enter(self, label):
+        """Marks the calling thread's request as profiled (if it's in the sample)."""
+        if self.running and random.random() < self.sample:
+            self._threads[threading.get_ident()] = label
+            self.requests += 1
+
+    def exit(self):
+        self._threads.pop(threading.get_ident(), None)
+
+    def _run(self):
+        deadline = time.monotonic() + self.duration if self.duration else None
+        while not self._stop.wait(self.interval):
+            if deadline and time.monotonic() >= deadline:
+                break
+            if not self._threads:
+                continue
+            frames = sys._current_frames()
+            for ident, label in list(self._threads.items()):
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                key = (label, tuple(reversed(stack)))
+                self.counts[key] = self.counts.get(key, 0) + 1
+                self.samples += 1
+        self._stop.set()
+        self.stopped = time.time()
+
+    # --- Export ---
+
+    def snapshot(self):
+        """A copy of the counts, safe to iterate while the sampler is still adding to them."""
+        return dict(self.counts) # One C-level copy, which the sampler thread can't interleave with
+
+    def status(self):
+        return {
+            'running': self.running, 'sample': self.sample, 'interval_ms': self.interval * 1000,
+            'seconds': self.duration, 'requests': self.requests, 'samples': self.samples,
+            'stacks': len(self.counts), 'started': self.started, 'stopped': self.stopped,
+        }
+
+    def collapsed(self):
+        """Collapsed stack format: "root;outer;...;inner count" per line."""
+        lines = []
+        for (label, stack), count in sorted(self.snapshot().items(), key=lambda item: -item[1]):
+            names = [label] + [frame_name(code) for code in stack]
+            lines.append(f"{';'.join(name.replace(';', ':') for name in names)} {count}")
+        return '\n'.join(lines) + '\n'
+
+    def speedscope(self):
+        """A speedscope "sampled" profile, weights in seconds."""
+        frames, index = [], {}
+
+        def frame_id(key, name, file=None, line=None):
+            if key not in index:
+                index[key] = len(frames)
+                frames.append({'name': name, 'file': file, 'line': line} if file else {'name': name})
+            return index[key]
+
+        samples, weights = [], []
+        for (label, stack), count in self.snapshot().items():
+            ids = [frame_id(('label', label), label)]
+            ids += [frame_id(code, code.co_name, code.co_filename, code.co_firstlineno) for code in stack]
+            samples.append(ids)
+            weights.append(count * self.interval)
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled', 'name': f"web_game ({self.requests} requests)", 'unit': 'seconds',
+                'startValue': 0, 'endValue': sum(weights), 'samples': samples, 'weights': weights,
+            }],
+            'exporter': 'web_game profiler.py',
+        }
+
+
+def frame_name(code):
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+
+# --- Flask integration ---
+
+_profiler = None # The current (or last) SamplingProfiler
+
+def _enter_request():
+    profiler = _profiler
+    if profiler is not None and profiler.running:
+        # The route, not the raw path: per-id paths and 404s would each add their own stacks
+        rule = request.url_rule
+        profiler.enter(f"{request.method} {rule.rule}" if rule is not None else "<unmatched>")
+
+def _exit_request(exc):
+    profiler = _profiler
+    if profiler is not None:
+        profiler.exit()
+
+
+admin = Blueprint('admin', __name__, url_prefix='/admin')
+
+@admin.before_request
+def _check_token():
+    supplied = request.headers.get('Authorization', '')
+    expected = f"Bearer {current_app.config['ADMIN_TOKEN']}"
+    if not hmac.compare_digest(supplied.encode('utf-8'), expected.encode('utf-8')):
+        abort(404) # Don't advertise that the routes exist
+
+@admin.route('/profile/start', methods=['POST'])
+def start_profile():
+    global _profiler
+    options = request.get_json(silent=True) or {}
+    if not isinstance(options, dict):
+        return jsonify({'error': "Expected a JSON object"}), 400
+    try:
+        sample = float(options.get('sample', 1.0))
+        interval = float(options.get('interval_ms', 1.0)) / 1000
+        seconds = float(options['seconds']) if options.get('seconds') else None
+    except (TypeError, ValueError):
+        return jsonify({'error': "sample, interval_ms and seconds must be numbers"}), 400
+    if not (0 < sample <= 1) or interval <= 0:
+        return jsonify({'error': "Expected 0 < sample <= 1 and interval_ms > 0"}), 400
+    if _profiler is not None:
+        _profiler.stop()
+    _profiler = SamplingProfiler(sample, interval, seconds).start()
+    return jsonify(_profiler.status())
+
+@admin.route('/profile/stop', methods=['POST'])
+def stop_profile():
+    if _profiler is None:
+        return jsonify({'error': "No profile"}), 404
+    _profiler.stop()
+    return jsonify(_profiler.status())
+
+@admin.route('/profile')
+def export_profile():
+    if _profiler is None:
+        return jsonify({'error': "No profile"}), 404
+    export = request.args.get('format', 'status')
+    if export == 'collapsed':
+        return Response(_profiler.collapsed(), content_type='text/plain; charset=utf-8')
+    if export == 'speedscope':
+        return Response(json.dumps(_profiler.speedscope()), content_type='application/json',
+                        headers={'Content-Disposition': 'attachment; filename="profile.speedscope.json"'})
+    return jsonify(_profiler.status())
+
+@admin.route('/actions/<name>/hook', methods=['GET', 'POST'])
+def action_hook(name):
+    if name not in actions.KNOWN_ACTIONS:
+        return jsonify({'error': f"Unknown action '{name}'"}), 404
+    if request.method == 'POST':
+        options = request.get_json(silent=True) or {}
+        if not isinstance(options, dict):
+            return jsonify({'error': "Expected a JSON object"}), 400
+        kind = options.get('hook')
+        try:
+            sample = float(options.get('sample', 1.0))
+        except (TypeError, ValueError):
+            return jsonify({'error': "sample must be a number"}), 400
+        if kind == 'timing':
+            actions.registry.set_hook(name, dispatch.TimingHook())
+        elif kind == 'cprofile':
+            actions.registry.set_hook(name, dispatch.ProfileHook(sample))
+        elif kind is None:
+            actions.registry.set_hook(name, None)
+        else:
+            return jsonify({'error': "hook must be 'timing', 'cprofile' or null"}), 400
+    hook = actions.registry.hook(name)
+    return Response(hook.report() if hook else "No hook\n", content_type='text/plain; charset=utf-8')
+
+
+def init_app(app):
+    """Adds the admin routes and request hooks if app.config['ADMIN_TOKEN'] is set."""
+    if not app.config.get('ADMIN_TOKEN'):
+        return
+    app.before_request(_enter_request)
+    app.teardown_request(_exit_request)
+    app.register_blueprint(admin)
@@ -0,0 +1,207 @@
+# Record and replay of live sessions
+#
+# With RECORD_PATH set, every action a (sampled) session sends is appended to
+# a log, one compact JSON line per record:
+#   {"s": key, "state": {...}}          the session's game_state before its
+#                                       first recorded action
+#   {"s": key, "a": payload, "h": crc}  one /action payload
+#   {"s": key, "b": payload, "h": crc}  one /actions batch
+# `key` is a hash of the session id (the id itself is a credential and never
+# written) and `h` is a CRC of the game_state the action produced. Every
+# line goes to a plain log in a single O_APPEND write, so all the workers
+# of a server can share one log. A path ending in .gz is gzip compressed
+# instead, which only works for a single process.
+#
+# All game randomness comes from the session's own stream (game_state['rng'],
+# see game_logic/rng.py), so replaying a log re-runs every session exactly:
+#
+#   python recorder.py replay actions.jsonl.gz [--repeat 10]
+#
+# re-executes the log as fast as it can against the current code, checks
+# each resulting state against its recorded CRC and reports the first
+# divergence per session. Same code, same states; a change that alters game
+# behaviour shows up as a mismatch, and --repeat makes it a benchmark with
+# real traffic. A session's actions are logged in the order they were
+# stored (see session_store.py), so overlapping requests replay as they ran.
+
+import atexit
+import gzip
+import hashlib
+import json
+import threading
+import time
+import zlib
+
+from game_logic import rng
+
+# Bookkeeping that the web layer changes after the action (see savegames.save_payload)
+IGNORED_KEYS = ('save_crc',)
+
+
+def state_crc(game_state):
+    """CRC of a game_state's canonical JSON (what replays are checked against)."""
+    canonical = {k: v for k, v in game_state.items() if k not in IGNORED_KEYS}
+    return zlib.crc32(json.dumps(canonical, sort_keys=True, separators=(',', ':')).encode('utf-8'))
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 'b')
+    if mode == 'a':
+        return open(path, 'ab', buffering=0) # One write() per line, straight to the file
+    return open(path, mode + 'b')
+
+
+class Recorder:
+    """Appends the action stream of sampled sessions to a log file."""
+    def __init__(self, path, sample=1.0):
+        self.path = path
+        self.sample = sample # Fraction of sessions recorded, chosen by session id
+        self._file = _open(path, 'a')
+        self._lock = threading.Lock()
+        self._started = set() # Keys whose starting state is already in the log
+        self.records = 0
+
+    def begin(self, sid, game_state):
+        """Call before applying an action. Returns a token for end(), or None if the session isn't recorded.
+
+        Nothing is written until end(): an attempt that loses its
+        compare-and-swap (see app.play) just drops its token.
+        """
+        if not sid:
+            return None
+        digest = hashlib.blake2b(sid.encode('utf-8'), digest_size=8).digest()
+        if int.from_bytes(digest, 'big') / 2 ** 64 >= self.sample:
+            return None
+        key = digest.hex()
+        start = None
+        if key not in self._started:
+            # Sessions from before rng.py have no stream yet; give them one now
+            # rather than have session_rng() pick an unrecorded seed
+            game_state.setdefault('rng', [rng.new_seed(), 0])
+            # Serialized now, since the action changes game_state in place
+            start = json.dumps({'s': key, 'state': game_state}, separators=(',', ':'))
+        return key, start
+
+    def end(self, token, data, game_state, batch=False):
+        """Call after the action (or batch) was stored, with its payload and resulting state."""
+        if token is None:
+            return
+        key, start = token
+        line = json.dumps({'s': key, 'b' if batch else 'a': data, 'h': state_crc(game_state)},
+                          separators=(',', ':')) + '\n'
+        with self._lock:
+            if start is not None and key not in self._started:
+                line = start + '\n' + line # Same write, so the state always comes first
+                self._started.add(key)
+                self.records += 1
+            self._file.write(line.encode('utf-8'))
+            self.records += 1
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def read_log(path):
+    """Yields the records of a log."""
+    with _open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def replay(records, verify=True):
+    """Re-executes log records. Returns (actions replayed, {key: first mismatching action index})."""
+    import actions # The web layer's game module; imported here so the log format stays importable alone
+
+    states = {}
+    steps = {}
+    mismatches = {}
+    replayed = 0
+    for record in records:
+        key = record['s']
+        if 'state' in record:
+            states[key] = json.loads(json.dumps(record['state'])) # Private copy: records may be reused
+            steps[key] = 0
+            continue
+        game_state = states.get(key)
+        if game_state is None or key in mismatches:
+            continue # No starting state (log cut mid-session), or already diverged
+        if 'b' in record:
+            data = record['b']
+            actions.apply_actions(game_state, data['actions'], data.get('rev'))
+        else:
+            actions.apply_action(game_state, record['a'])
+        replayed += 1
+        if verify and state_crc(game_state) != record['h']:
+            mismatches[key] = steps[key]
+        steps[key] += 1
+    return replayed, mismatches
+
+
+# --- Flask integration ---
+
+def begin(game_state):
+    """Starts recording the current request's action. Returns a token for end() (None if not recording)."""
+    from flask import current_app, session
+    recorder = current_app.extensions.get('recorder')
+    if recorder is None:
+        return None
+    token = recorder.begin(getattr(session, 'sid', None), game_state) # Cookie sessions have no id
+    return (recorder, token) if token else None
+
+
+def end(token, data, game_state, batch=False):
+    """Logs the request's action once its session was stored."""
+    if token is not None:
+        recorder, token = token
+        recorder.end(token, data, game_state, batch)
+
+
+def init_app(app):
+    """Starts recording to app.config['RECORD_PATH'] if it's set."""
+    path = app.config.get('RECORD_PATH')
+    if not path:
+        return None
+    recorder = Recorder(path, app.config.get('RECORD_SAMPLE', 1.0))
+    app.extensions['recorder'] = recorder
+    atexit.register(recorder.close)
+    return recorder
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Replay recorded sessions against this build.")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    replay_parser = subcommands.add_parser('replay', help="Re-execute a log and verify the resulting states")
+    replay_parser.add_argument('log')
+    replay_parser.add_argument('--repeat', type=int, default=1, help="Replay the log this many times (benchmarking)")
+    replay_parser.add_argument('--no-verify', dest='verify', action='store_false', help="Skip the state checks")
+    args = parser.parse_args(argv)
+
+    records = list(read_log(args.log))
+    sessions = sum(1 for r in records if 'state' in r)
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        replayed, mismatches = replay(records, args.verify)
+    elapsed = time.perf_counter() - start
+    total = replayed * args.repeat
+    print(f"{sessions:,} sessions, {replayed:,} actions x {args.repeat}: "
+          f"{elapsed:.2f}s ({total / elapsed if elapsed else 0:,.0f} actions/s)")
+    for key, index in sorted(mismatches.items()):
+        print(f"  session {key}: state differs from the recording after action {index}")
+    if mismatches:
+        print(f"{len(mismatches)} of {sessions} sessions diverged")
+        return 1
+    if args.verify:
+        print("All states match the recording")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
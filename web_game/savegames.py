@@ -0,0 +1,253 @@
+# Persistent save games
+#
+# The session only lives as long as its cookie (and, with the default
+# backends, the process), so a player's progress is also written to save
+# slots in SQLite. Saves are keyed by a random, unguessable `save_id` cookie
+# that is independent of the session cookie and secret key, so they survive
+# restarts and expired sessions.
+#
+# Writes are write-behind: handle_action only drops the latest snapshot into
+# an in-memory queue, and a background thread commits whatever has piled up
+# in one transaction every SAVE_FLUSH_INTERVAL seconds. Many rapid updates
+# from the same player coalesce into a single row write, and the fsync at
+# commit (synchronous=FULL) is paid once per batch instead of once per action.
+# Reads check the queue first, so a player always sees their latest save.
+
+import atexit
+import json
+import logging
+import re
+import secrets
+import sqlite3
+import threading
+import time
+import zlib
+
+from flask import current_app, g, request
+
+SAVE_COOKIE = 'save_id'
+SAVE_COOKIE_MAX_AGE = 365 * 24 * 3600 # Saves are meant to outlive sessions
+SAVE_VERSION = 1
+_SAVE_ID_RE = re.compile(r'^[A-Za-z0-9_-]{32}$') # secrets.token_urlsafe(24)
+
+log = logging.getLogger(__name__)
+
+
+class SaveStore:
+    """Save slots in a single SQLite table (WAL mode)."""
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local() # sqlite3 connections can't be shared across threads
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS saves ("
+            " save_id TEXT PRIMARY KEY, data BLOB NOT NULL, updated REAL NOT NULL)"
+        )
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Unlike sessions, saves must survive a crash: fsync on every commit.
+            # Commits are batched by WriteBehindQueue, which keeps this affordable.
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, save_id):
+        row = self._conn().execute("SELECT data FROM saves WHERE save_id = ?", (save_id,)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def write_many(self, items):
+        """Writes (save_id, payload) pairs in a single transaction."""
+        now = time.time()
+        conn = self._conn()
+        with conn: # One transaction (and one fsync) for the whole batch
+            conn.executemany(
+                "INSERT OR REPLACE INTO saves (save_id, data, updated) VALUES (?, ?, ?)",
+                [(save_id, payload, now) for save_id, payload in items]
+            )
+
+    def delete(self, save_id):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM saves WHERE save_id = ?", (save_id,))
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM saves").fetchone()[0]
+
+
+class WriteBehindQueue:
+    """Coalesces save writes in memory and commits them in batches from a background thread."""
+    def __init__(self, store, flush_interval=0.05, max_batch=1000):
+        self.store = store
+        self.flush_interval = flush_interval # How long updates may pile up before a commit
+        self.max_batch = max_batch # Commit early once this many players are waiting
+        self._pending = {} # save_id -> latest payload (later puts overwrite earlier ones)
+        self._inflight = {} # Batch currently being written, still readable
+        self._cond = threading.Condition()
+        self._closed = False
+        self.stats = {'puts': 0, 'writes': 0, 'batches': 0, 'errors': 0}
+        self._thread = threading.Thread(target=self._run, name='savegame-writer', daemon=True)
+        self._thread.start()
+
+    def put(self, save_id, payload):
+        with self._cond:
+            if self._closed: # Shutting down: write synchronously rather than lose it
+                self.store.write_many([(save_id, payload)])
+                return
+            self._pending[save_id] = payload
+            self.stats['puts'] += 1
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+                self._cond.notify_all()
+
+    def get(self, save_id):
+        with self._cond:
+            payload = self._pending.get(save_id) or self._inflight.get(save_id)
+        return payload if payload is not None else self.store.load(save_id)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending: # Closed and drained
+                    return
+                # Let rapid updates coalesce (puts notify us, so wait against a deadline)
+                deadline = time.monotonic() + self.flush_interval
+                while not self._closed and len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+            try:
+                self.store.write_many(batch.items())
+                self.stats['writes'] += len(batch)
+                self.stats['batches'] += 1
+            except Exception: # Anything escaping would kill the writer and strand every later save
+                log.exception("Writing %d save games failed, retrying", len(batch))
+                self.stats['errors'] += 1
+                with self._cond:
+                    for save_id, payload in batch.items():
+                        self._pending.setdefault(save_id, payload) # Newer puts win
+                time.sleep(self.flush_interval)
+            finally:
+                with self._cond:
+                    self._inflight = {}
+                    self._cond.notify_all() # Wake flush() waiters
+
+    def flush(self):
+        """Blocks until everything queued so far is committed."""
+        with self._cond:
+            while self._pending or self._inflight:
+                self._cond.notify_all()
+                self._cond.wait(self.flush_interval)
+
+    def close(self):
+        """Commits the remaining saves and stops the writer thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def __len__(self):
+        return len(self._pending)
+
+
+# --- Snapshots ---
+
+def snapshot(game_state):
+    """Returns the progress worth saving from a game state, or None before character creation."""
+    player_stats = game_state.get('player_stats')
+    if not player_stats:
+        return None
+    # Mid-fight, player_stats already has the fight's damage (it's the only
+    # copy) and current_location is still where the fight started; the fight
+    # itself isn't saved
+    return {'v': SAVE_VERSION, 'player': player_stats, 'location': game_state.get('current_location')}
+
+
+def encode(save):
+    return json.dumps(save, separators=(',', ':')).encode('utf-8')
+
+
+def decode(payload):
+    save = json.loads(payload)
+    return save if save.get('v') == SAVE_VERSION else None
+
+
+def save_payload(game_state):
+    """Returns the encoded save for game_state, or None if there's nothing new to save."""
+    save = snapshot(game_state)
+    if save is None:
+        return None
+    payload = encode(save)
+    checksum = zlib.crc32(payload)
+    if game_state.get('save_crc') == checksum:
+        return None # Nothing new since the last save from this session
+    game_state['save_crc'] = checksum
+    return payload
+
+
+def valid_save_id(value):
+    """Returns value if it looks like a save id we issued, else None."""
+    return value if value and _SAVE_ID_RE.match(value) else None
+
+
+def new_save_id():
+    return secrets.token_urlsafe(24)
+
+
+# --- Flask integration ---
+
+def _save_id(create=False):
+    """The request's save id from its cookie; creates one if asked and there is none."""
+    save_id = g.get('save_id')
+    if save_id is None:
+        save_id = valid_save_id(request.cookies.get(SAVE_COOKIE))
+        if save_id is None and create:
+            save_id = g.new_save_id = new_save_id()
+        g.save_id = save_id
+    return save_id
+
+
+def load_progress():
+    """Loads the current player's save (a snapshot() dict), or None if they have none."""
+    save_id = _save_id()
+    if save_id is None:
+        return None
+    payload = current_app.extensions['savegames'].get(save_id)
+    return decode(payload) if payload is not None else None
+
+
+def queue_save(payload):
+    """Queues a save_payload() result (None: nothing to save) for the current player."""
+    if payload is not None:
+        current_app.extensions['savegames'].put(_save_id(create=True), payload)
+
+
+def _set_save_cookie(response):
+    save_id = g.get('new_save_id')
+    if save_id:
+        response.set_cookie(
+            SAVE_COOKIE, save_id, max_age=SAVE_COOKIE_MAX_AGE, httponly=True, samesite='Lax',
+            secure=current_app.config.get('SESSION_COOKIE_SECURE', False),
+        )
+    return response
+
+
+def init_app(app):
+    """Opens the save database and starts the write-behind thread."""
+    queue = WriteBehindQueue(
+        SaveStore(app.config['SAVE_DB_PATH']),
+        flush_interval=app.config.get('SAVE_FLUSH_INTERVAL', 0.05),
+        max_batch=app.config.get('SAVE_MAX_BATCH', 1000),
+    )
+    app.extensions['savegames'] = queue
+    app.after_request(_set_save_cookie)
+    atexit.register(queue.close) # Don't drop queued saves on a clean shutdown
+    return queue
@@ -0,0 +1,616 @@
+# Server-side session storage for the web game
+#
+# Flask's default session keeps the whole game_state inside a signed cookie,
+# so every request ships the player's stats, inventory and combat state in
+# both directions. The interface below keeps only an opaque, signed session id
+# in the cookie and stores the state itself in one of the backends:
+#   - MemoryStore:  in-process LRU with eviction (fast, lost on restart)
+#   - SQLiteStore:  durable tier on SQLite in WAL mode
+#   - RedisStore:   anything with a redis-py compatible get/set/delete API
+#   - TieredStore:  an LRU in front of a durable store (read-through, write-through)
+#
+# store_get()/store_set() are the awaitable versions used by the ASGI app.
+#
+# Concurrent requests for one session (a double click, two tabs) each load
+# the session, change it and write it back. So that the last writer can't
+# silently undo the others, every stored session carries a version number,
+# bumped on each write, and sessions are written with a compare-and-swap:
+# set_if(sid, payload, version) only stores if the session is still at the
+# version the request loaded (0: not stored). A request that loses reloads
+# the session and runs again (see app.play). Within one process,
+# SessionLocks also make one session's requests take turns, so they don't
+# lose in the first place; different sessions never wait on each other.
+
+import asyncio
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+
+from flask import current_app
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+import metrics # Serialized session sizes and write conflicts
+import state_schema # Stored form of the game_state
+
+DEFAULT_TTL = 7 * 24 * 3600 # Sessions expire after a week of inactivity
+
+
+# --- Backends ---
+# Every backend stores opaque bytes and a version under a session id and
+# exposes the same get/set/delete and get_versioned/set_if methods, so the
+# session interface doesn't care which it uses. get_versioned() returns
+# (payload, version), (None, 0) for no session; set_if() returns the new
+# version, or None if the stored one wasn't `version`.
+# `blocking` says whether those calls wait on I/O (async callers then run them
+# in a thread); backends with native async I/O also provide aget/aset.
+
+class MemoryStore:
+    """In-process LRU store. Evicts the least recently used session when full."""
+    blocking = False
+
+    def __init__(self, max_entries=10000, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict() # sid -> (expires_at, payload, version)
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def _entry(self, sid):
+        # Call with the lock held
+        entry = self._data.get(sid)
+        if entry is None:
+            return None
+        if entry[0] < time.time():
+            del self._data[sid] # Expired
+            return None
+        self._data.move_to_end(sid) # Mark as recently used
+        return entry
+
+    def _put(self, sid, payload, version):
+        # Call with the lock held
+        self._data[sid] = (time.time() + self.ttl, payload, version)
+        self._data.move_to_end(sid)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False) # Drop least recently used
+            self.evictions += 1
+
+    def get(self, sid):
+        return self.get_versioned(sid)[0]
+
+    def get_versioned(self, sid):
+        with self._lock:
+            entry = self._entry(sid)
+            return (None, 0) if entry is None else entry[1:]
+
+    def set(self, sid, payload, version=None):
+        """Stores unconditionally, as `version` if given (a cache of another store), else the next one."""
+        with self._lock:
+            if version is None:
+                entry = self._entry(sid)
+                version = entry[2] + 1 if entry else 1
+            self._put(sid, payload, version)
+
+    def set_if(self, sid, payload, version):
+        with self._lock:
+            entry = self._entry(sid)
+            if (entry[2] if entry else 0) != version:
+                return None
+            self._put(sid, payload, version + 1)
+            return version + 1
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteStore:
+    """Durable store backed by a single SQLite table in WAL mode."""
+    blocking = True
+
+    def __init__(self, path, ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local() # sqlite3 connections can't be shared across threads
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " sid TEXT PRIMARY KEY, data BLOB NOT NULL, expires REAL NOT NULL,"
+            " version INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(sessions)")]
+        if 'version' not in columns: # Table from before versioned writes
+            conn.execute("ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # WAL + NORMAL only fsyncs at checkpoints, which is plenty for sessions
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, sid):
+        return self.get_versioned(sid)[0]
+
+    def get_versioned(self, sid):
+        row = self._conn().execute(
+            "SELECT data, expires, version FROM sessions WHERE sid = ?", (sid,)
+        ).fetchone()
+        if row is None or row[1] < time.time():
+            return None, 0
+        return bytes(row[0]), row[2]
+
+    def set(self, sid, payload):
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO sessions (sid, data, expires, version) VALUES (?, ?, ?, 1)"
+            " ON CONFLICT (sid) DO UPDATE SET data = excluded.data, expires = excluded.expires,"
+            " version = sessions.version + 1",
+            (sid, payload, time.time() + self.ttl)
+        )
+        conn.commit()
+
+    def set_if(self, sid, payload, version):
+        conn = self._conn()
+        now = time.time()
+        if version:
+            cursor = conn.execute(
+                "UPDATE sessions SET data = ?, expires = ?, version = version + 1"
+                " WHERE sid = ? AND version = ? AND expires >= ?",
+                (payload, now + self.ttl, sid, version, now)
+            )
+        else: # Only if there's no session yet, an expired one or one stored before versions
+            cursor = conn.execute(
+                "INSERT INTO sessions (sid, data, expires, version) VALUES (?, ?, ?, 1)"
+                " ON CONFLICT (sid) DO UPDATE SET data = excluded.data, expires = excluded.expires, version = 1"
+                " WHERE sessions.expires < ? OR sessions.version = 0",
+                (sid, payload, now + self.ttl, now)
+            )
+        conn.commit()
+        return version + 1 if cursor.rowcount == 1 else None
+
+    def delete(self, sid):
+        conn = self._conn()
+        conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+        conn.commit()
+
+    def purge_expired(self):
+        """Removes expired sessions. Returns the number of rows deleted."""
+        conn = self._conn()
+        cursor = conn.execute("DELETE FROM sessions WHERE expires < ?", (time.time(),))
+        conn.commit()
+        return cursor.rowcount
+
+
+# Compare-and-swap for RedisStore: KEYS[1] holds the payload, KEYS[2] its
+# version (missing for sessions stored before versions, which count as 0)
+_REDIS_SET_IF = """
+local current = 0
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    current = tonumber(redis.call('GET', KEYS[2]) or '0')
+end
+if current ~= tonumber(ARGV[2]) then
+    return false
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+redis.call('SET', KEYS[2], current + 1, 'EX', ARGV[3])
+return current + 1
+"""
+
+
+class RedisStore:
+    """Store for any client with redis-py's API (get/set(ex=)/delete, mget, pipelines and scripts)."""
+    blocking = True
+
+    def __init__(self, client, prefix='game_session:', ttl=DEFAULT_TTL, async_client=None):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.async_client = async_client # Optional redis.asyncio client for the ASGI app
+        self._set_if = client.register_script(_REDIS_SET_IF)
+        self._aset_if = async_client.register_script(_REDIS_SET_IF) if async_client is not None else None
+
+    def _keys(self, sid):
+        return [self.prefix + sid, self.prefix + sid + ':v']
+
+    @staticmethod
+    def _versioned(values):
+        payload, version = values
+        return (None, 0) if payload is None else (payload, int(version or 0))
+
+    def get(self, sid):
+        return self.client.get(self.prefix + sid)
+
+    def get_versioned(self, sid):
+        return self._versioned(self.client.mget(self._keys(sid)))
+
+    def set(self, sid, payload):
+        key, version_key = self._keys(sid)
+        with self.client.pipeline() as pipe: # MULTI/EXEC
+            pipe.set(key, payload, ex=self.ttl)
+            pipe.incr(version_key)
+            pipe.expire(version_key, self.ttl)
+            pipe.execute()
+
+    def set_if(self, sid, payload, version):
+        return self._set_if(keys=self._keys(sid), args=[payload, version, self.ttl])
+
+    def delete(self, sid):
+        self.client.delete(*self._keys(sid))
+
+    async def aget(self, sid):
+        if self.async_client is None:
+            return await asyncio.to_thread(self.get, sid)
+        return await self.async_client.get(self.prefix + sid)
+
+    async def aset(self, sid, payload):
+        if self.async_client is None:
+            return await asyncio.to_thread(self.set, sid, payload)
+        key, version_key = self._keys(sid)
+        async with self.async_client.pipeline() as pipe:
+            pipe.set(key, payload, ex=self.ttl)
+            pipe.incr(version_key)
+            pipe.expire(version_key, self.ttl)
+            await pipe.execute()
+
+    async def aget_versioned(self, sid):
+        if self.async_client is None:
+            return await asyncio.to_thread(self.get_versioned, sid)
+        return self._versioned(await self.async_client.mget(self._keys(sid)))
+
+    async def aset_if(self, sid, payload, version):
+        if self.async_client is None:
+            return await asyncio.to_thread(self.set_if, sid, payload, version)
+        return await self._aset_if(keys=self._keys(sid), args=[payload, version, self.ttl])
+
+
+class TieredStore:
+    """Keeps hot sessions in a MemoryStore in front of a durable store."""
+    def __init__(self, front, back):
+        self.front = front
+        self.back = back
+
+    def get(self, sid):
+        return self.get_versioned(sid)[0]
+
+    def get_versioned(self, sid):
+        payload, version = self.front.get_versioned(sid)
+        if payload is None:
+            payload, version = self.back.get_versioned(sid)
+            if payload is not None:
+                self.front.set(sid, payload, version) # Warm the cache for the next request
+        return payload, version
+
+    def set(self, sid, payload):
+        self.back.set(sid, payload) # Write-through so the durable tier is never behind
+        self.front.delete(sid) # The durable tier picked the version; read it back next time
+
+    def set_if(self, sid, payload, version):
+        return self._cached(sid, payload, self.back.set_if(sid, payload, version))
+
+    def _cached(self, sid, payload, version):
+        if version is None:
+            self.front.delete(sid) # Our copy is stale (another worker wrote the session)
+        else:
+            self.front.set(sid, payload, version)
+        return version
+
+    def delete(self, sid):
+        self.front.delete(sid)
+        self.back.delete(sid)
+
+    async def aget(self, sid):
+        return (await self.aget_versioned(sid))[0]
+
+    async def aget_versioned(self, sid):
+        payload, version = self.front.get_versioned(sid)
+        if payload is None:
+            payload, version = await store_get_versioned(self.back, sid)
+            if payload is not None:
+                self.front.set(sid, payload, version)
+        return payload, version
+
+    async def aset(self, sid, payload):
+        await store_set(self.back, sid, payload)
+        self.front.delete(sid)
+
+    async def aset_if(self, sid, payload, version):
+        return self._cached(sid, payload, await store_set_if(self.back, sid, payload, version))
+
+
+async def store_get(store, sid):
+    """Awaitable store.get(): native async if the store has it, else a thread for blocking I/O."""
+    if hasattr(store, 'aget'):
+        return await store.aget(sid)
+    if getattr(store, 'blocking', True):
+        return await asyncio.to_thread(store.get, sid)
+    return store.get(sid) # In-process, nothing to wait for
+
+
+async def store_set(store, sid, payload):
+    """Awaitable store.set(), see store_get()."""
+    if hasattr(store, 'aset'):
+        return await store.aset(sid, payload)
+    if getattr(store, 'blocking', True):
+        return await asyncio.to_thread(store.set, sid, payload)
+    store.set(sid, payload)
+
+
+async def store_get_versioned(store, sid):
+    """Awaitable store.get_versioned(), see store_get()."""
+    if hasattr(store, 'aget_versioned'):
+        return await store.aget_versioned(sid)
+    if getattr(store, 'blocking', True):
+        return await asyncio.to_thread(store.get_versioned, sid)
+    return store.get_versioned(sid)
+
+
+async def store_set_if(store, sid, payload, version):
+    """Awaitable store.set_if(), see store_get()."""
+    if hasattr(store, 'aset_if'):
+        return await store.aset_if(sid, payload, version)
+    if getattr(store, 'blocking', True):
+        return await asyncio.to_thread(store.set_if, sid, payload, version)
+    return store.set_if(sid, payload, version)
+
+
+# --- Per-session locks ---
+
+class SessionLocks:
+    """One lock per session id, so a session's requests take turns and others don't wait.
+
+    A lock only exists while a request holds it or waits for it. `factory`
+    makes the locks: threading.Lock for threads, asyncio.Lock for the
+    requests of one event loop (which then wait their turn in arrival order).
+    """
+    def __init__(self, factory=threading.Lock):
+        self.factory = factory
+        self._locks = {} # sid -> [lock, requests holding or waiting for it]
+        self._guard = threading.Lock()
+
+    def _checkout(self, sid):
+        with self._guard:
+            entry = self._locks.get(sid)
+            if entry is None:
+                entry = self._locks[sid] = [self.factory(), 0]
+            entry[1] += 1
+            return entry[0]
+
+    def _checkin(self, sid):
+        with self._guard:
+            entry = self._locks[sid]
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[sid]
+
+    @contextmanager
+    def hold(self, sid):
+        """Holds the session's lock. Yields True if another request had it first."""
+        lock = self._checkout(sid)
+        try:
+            waited = not lock.acquire(blocking=False)
+            if waited:
+                lock.acquire()
+            try:
+                yield waited
+            finally:
+                lock.release()
+        finally:
+            self._checkin(sid)
+
+    @asynccontextmanager
+    async def ahold(self, sid):
+        """hold() for asyncio locks."""
+        lock = self._checkout(sid)
+        try:
+            waited = lock.locked()
+            async with lock:
+                yield waited
+        finally:
+            self._checkin(sid)
+
+    def __len__(self):
+        return len(self._locks)
+
+
+# --- Flask integration ---
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session dict whose contents live in a store; the cookie only holds `sid`."""
+    def __init__(self, initial=None, sid=None, new=False, loaded_payload=None, version=0):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        # Serialized form as it was loaded, used for dirty tracking on save
+        self.loaded_payload = loaded_payload
+        self.version = version # Stored version it was loaded at (0: not stored yet)
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Session interface that keeps game state server-side in `store`."""
+    salt = 'game-session-id'
+
+    def __init__(self, store):
+        self.store = store
+        self.locks = SessionLocks() # For the threads of this process
+
+    def _signer(self, app):
+        # Sign with SECRET_KEY, but still accept ids signed with a key being rotated out
+        keys = [*app.config.get('SECRET_KEY_FALLBACKS', []), app.secret_key]
+        return Signer(keys, salt=self.salt)
+
+    def sign_sid(self, app, sid):
+        """Returns the cookie value for a session id."""
+        return self._signer(app).sign(sid.encode('ascii')).decode('ascii')
+
+    def unsign_sid(self, app, cookie):
+        """Returns the session id from a cookie value, or None if it's missing or forged."""
+        if not cookie:
+            return None
+        try:
+            return self._signer(app).unsign(cookie).decode('ascii')
+        except BadSignature:
+            return None
+
+    def new_sid(self):
+        return secrets.token_urlsafe(32)
+
+    def serialize(self, session):
+        data = dict(session)
+        if isinstance(data.get('game_state'), dict):
+            data['game_state'] = state_schema.to_stored(data['game_state']) # Compact inventory
+        return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+    def deserialize(self, payload):
+        data = json.loads(payload)
+        if isinstance(data.get('game_state'), dict):
+            state_schema.from_stored(data['game_state'])
+        return data
+
+    def open_session(self, app, request):
+        if not app.secret_key:
+            return None
+        sid = self.unsign_sid(app, request.cookies.get(self.get_cookie_name(app)))
+        if sid:
+            payload, version = self.store.get_versioned(sid)
+            if payload is not None:
+                return ServerSideSession(self.deserialize(payload), sid=sid, loaded_payload=payload, version=version)
+            # Known id but nothing stored (expired/evicted): reuse the id
+            return ServerSideSession(sid=sid)
+        return ServerSideSession(sid=self.new_sid(), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified: # Session was emptied: forget it everywhere
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        # Views that play actions have stored the session already (commit()). If
+        # anything else loses a race here (e.g. two first page loads), the other
+        # request's session is kept and this one's changes are dropped.
+        if session.modified and not self.commit(session):
+            metrics.SESSION_CONFLICTS.inc('dropped')
+
+        # The id never changes, so the cookie only needs to be sent once
+        if session.new:
+            response.set_cookie(
+                name,
+                self.sign_sid(app, session.sid),
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+
+
+    def commit(self, session):
+        """Stores a session now, unless another request has stored it since it was loaded.
+
+        Returns False on such a conflict, and leaves both the store and
+        `session` as they were. Dirty tracking: nothing is written if the
+        session is unchanged (views often reassign session['game_state']
+        without changing it, so this compares bytes).
+        """
+        payload = self.serialize(session)
+        if payload != session.loaded_payload:
+            version = self.store.set_if(session.sid, payload, session.version)
+            if version is None:
+                return False
+            metrics.SESSION_BYTES.observe(len(payload))
+            session.loaded_payload, session.version = payload, version
+        session.modified = False
+        return True
+
+    def reload(self, session):
+        """Replaces the contents of `session` with what's stored now."""
+        payload, version = self.store.get_versioned(session.sid)
+        session.clear()
+        if payload is not None:
+            session.update(self.deserialize(payload))
+        session.loaded_payload, session.version = payload, version
+        session.modified = False
+
+
+# Helpers for views; they do nothing for Flask's cookie sessions, whose state
+# travels with each request
+
+@contextmanager
+def locked(session):
+    """Makes the current request wait for the session's other requests in this process.
+
+    If one of them went first, the session is reloaded: that request has most
+    likely just changed it.
+    """
+    if not isinstance(session, ServerSideSession):
+        yield
+        return
+    interface = current_app.session_interface
+    with interface.locks.hold(session.sid) as waited:
+        if waited:
+            interface.reload(session)
+        yield
+
+
+def commit(session):
+    """Stores the session now; False if another request stored it first (see ServerSideSessionInterface.commit)."""
+    if not isinstance(session, ServerSideSession):
+        return True
+    return current_app.session_interface.commit(session)
+
+
+def reload(session):
+    if isinstance(session, ServerSideSession):
+        current_app.session_interface.reload(session)
+
+
+def store_from_config(config):
+    """Builds the session store selected by config['SESSION_BACKEND']."""
+    backend = config.get('SESSION_BACKEND', 'memory')
+    ttl = config.get('SESSION_TTL', DEFAULT_TTL)
+    cache_size = config.get('SESSION_CACHE_SIZE', 10000)
+
+    if backend == 'memory':
+        return MemoryStore(max_entries=cache_size, ttl=ttl)
+    if backend == 'sqlite':
+        path = config.get('SESSION_SQLITE_PATH', os.path.join(os.getcwd(), 'sessions.sqlite3'))
+        durable = SQLiteStore(path, ttl=ttl)
+    elif backend == 'redis':
+        import redis # Optional dependency, only needed for this backend
+        import redis.asyncio
+        url = config.get('SESSION_REDIS_URL', 'redis://localhost:6379/0')
+        durable = RedisStore(redis.Redis.from_url(url), ttl=ttl, async_client=redis.asyncio.Redis.from_url(url))
+    else:
+        raise ValueError(f"Unknown SESSION_BACKEND '{backend}'")
+
+    if cache_size:
+        return TieredStore(MemoryStore(max_entries=cache_size, ttl=ttl), durable)
+    return durable
+
+
+def init_app(app):
+    """Installs the configured session interface. 'cookie' keeps Flask's default."""
+    if app.config.get('SESSION_BACKEND', 'memory') != 'cookie':
+        app.session_interface = ServerSideSessionInterface(store_from_config(app.config))
@@ -0,0 +1,65 @@
+# Versioned state protocol for /action responses
+#
+# Every action bumps game_state['rev']. A client that tells us which revision
+# it holds (the 'rev' field of its request) gets back only a JSON-Patch style
+# list of operations (RFC 6902 add/remove/replace) that turns its copy into the
+# new state. If its revision isn't the one we last sent (second tab, lost
+# response, page from an older session) it gets a full snapshot instead.
+# Clients that don't send 'rev' keep receiving the plain state as before.
+
+# Keys kept in game_state for the server's own bookkeeping, never sent to the client
+SERVER_ONLY_KEYS = ('v', 'rev', 'rng', 'save_crc', 'combat_turns')
+
+
+def response_view(game_state):
+    """Returns the stored part of the client-facing view (a shallow copy; see actions.response_view)."""
+    return {key: value for key, value in game_state.items() if key not in SERVER_ONLY_KEYS}
+
+
+def _escape(key):
+    """Escapes a key for use in a JSON pointer."""
+    return str(key).replace('~', '~0').replace('/', '~1')
+
+
+def make_patch(old, new, path=''):
+    """Returns the list of patch operations that turn `old` into `new`."""
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = []
+        for key, old_value in old.items():
+            if key not in new:
+                ops.append({'op': 'remove', 'path': f"{path}/{_escape(key)}"})
+            else:
+                ops.extend(make_patch(old_value, new[key], f"{path}/{_escape(key)}"))
+        for key, new_value in new.items():
+            if key not in old:
+                ops.append({'op': 'add', 'path': f"{path}/{_escape(key)}", 'value': new_value})
+        return ops
+
+    if isinstance(old, (list, tuple)) and isinstance(new, (list, tuple)):
+        # Same length: patch element by element. Otherwise replacing the whole
+        # list is both simpler and usually smaller (e.g. a new options list).
+        if len(old) == len(new):
+            ops = []
+            for index, (old_item, new_item) in enumerate(zip(old, new)):
+                ops.extend(make_patch(old_item, new_item, f"{path}/{index}"))
+            return ops
+        return [{'op': 'replace', 'path': path, 'value': new}]
+
+    # Scalars (or a type change). bool is an int subclass, so compare types too.
+    if type(old) is type(new) and old == new:
+        return []
+    return [{'op': 'replace', 'path': path, 'value': new}]
+
+
+def build_response(old_view, new_view, rev, client_rev):
+    """Builds the /action payload for a client holding `client_rev`.
+
+    `old_view` is the view at `client_rev`, or None if the client's revision
+    doesn't match ours and it needs a full snapshot.
+    """
+    if client_rev is None:
+        # Legacy client: plain state, with the revision so it can opt in later
+        return dict(new_view, rev=rev)
+    if old_view is None:
+        return {'rev': rev, 'state': new_view}
+    return {'rev': rev, 'base': client_rev, 'patch': make_patch(old_view, new_view)}
@@ -0,0 +1,90 @@
+# The stored shape of a session's game_state, and migrations from older ones
+#
+# Version 2 (current) stores only what can't be worked out again:
+#
+#   v                  schema version
+#   current_location   where the player is ('character_creation' before the name)
+#   player_stats       the player, the only copy (also during a fight)
+#   combat_state       None, or the fight: 'enemy' (plus 'enemies' and
+#                      'target' for packs), 'is_over', 'victory' and
+#                      'destination', the location the player walks into
+#                      after winning (and an auto-battle's 'turn_log')
+#   rng, rev, save_crc, combat_turns
+#                      server bookkeeping (see state_protocol.SERVER_ONLY_KEYS)
+#
+# The options on screen and the message describing the current situation are
+# derived from that when a view is built (actions.response_view). What an
+# action itself has to say (its 'message') lives in game_state only while the
+# request runs (EVENT_KEYS) and is sent with that one response.
+#
+# Version 1 (unversioned) also stored the last message, the options list,
+# previous_location (never read), the combat's own copy of the player and
+# its turn_message, and location_before_combat next to the fight.
+# Sessions are upgraded in place the first time they're used (upgrade()).
+#
+# The session stores write player_stats['inventory'] in its compact form
+# (see game_logic/inventory.py): to_stored() gives the copy that gets
+# serialized, from_stored() turns a loaded one back in place. States that
+# were stored before that hold a plain map or list, which load as they are.
+
+from game_logic import inventory
+
+SCHEMA_VERSION = 2
+
+# Produced by an action for its own response, never stored
+EVENT_KEYS = ('message',)
+
+
+def _v1_to_v2(game_state):
+    for key in ('message', 'options', 'previous_location'):
+        game_state.pop(key, None)
+    destination = game_state.pop('location_before_combat', None)
+    combat_state = game_state.get('combat_state')
+    if combat_state:
+        player = combat_state.pop('player', None)
+        if player is not None:
+            game_state['player_stats'] = player # The fight's copy was the up-to-date one
+        combat_state.pop('turn_message', None)
+        if destination:
+            combat_state['destination'] = destination
+
+# Version -> function upgrading a state from that version to the next (in place)
+MIGRATIONS = {
+    1: _v1_to_v2,
+}
+
+
+def upgrade(game_state):
+    """Migrates a game_state to SCHEMA_VERSION in place. Returns it."""
+    version = game_state.get('v', 1)
+    if version == SCHEMA_VERSION:
+        return game_state
+    if version > SCHEMA_VERSION:
+        raise ValueError(f"game_state version {version} is newer than this server ({SCHEMA_VERSION})")
+    while version < SCHEMA_VERSION:
+        MIGRATIONS[version](game_state)
+        version += 1
+    game_state['v'] = SCHEMA_VERSION
+    return game_state
+
+
+def pop_events(game_state):
+    """Removes an action's event keys from game_state. Returns them as a dict."""
+    return {key: game_state.pop(key, None) for key in EVENT_KEYS}
+
+
+def to_stored(game_state):
+    """The form of game_state that is written to a session store (game_state is left alone)."""
+    player_stats = game_state.get('player_stats')
+    if not player_stats or 'inventory' not in player_stats:
+        return game_state
+    stored_player = dict(player_stats, inventory=inventory.pack(player_stats['inventory']))
+    return dict(game_state, player_stats=stored_player)
+
+
+def from_stored(game_state):
+    """Undoes to_stored() on a loaded game_state, in place. Returns it."""
+    player_stats = game_state.get('player_stats')
+    if player_stats and inventory.is_packed(player_stats.get('inventory')):
+        player_stats['inventory'] = inventory.unpack(player_stats['inventory'])
+    return game_state